@@ -0,0 +1,205 @@
+import logging
+import os
+import re
+import json
+import zlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración de la caché de respuestas ---
+ANSWER_CACHE_MAX_ENTRIES = 500 # Límite LRU de preguntas guardadas
+NEAR_DUPLICATE_THRESHOLD = 0.8 # Similitud de Jaccard estimada mínima para considerar dos preguntas iguales
+MINHASH_PERMUTATIONS = 64
+SHINGLE_SIZE = 3 # Palabras por shingle
+CACHE_FILE_VERSION = 1
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# Coeficientes fijos (no aleatorios) para que las firmas sean estables entre ejecuciones
+_MINHASH_COEFFS = [((i * 0x9E3779B1 + 0x7F4A7C15) % _MERSENNE_PRIME or 1, (i * 0x85EBCA77 + 0xC2B2AE3D) % _MERSENNE_PRIME)
+                   for i in range(1, MINHASH_PERMUTATIONS + 1)]
+
+# Opciones tipo "a) texto", "b. texto" al inicio de línea o tras espacios
+_OPTION_RE = re.compile(r"(?:^|\s)([a-hA-H])[\)\.]\s+")
+_ANSWER_LETTER_RE = re.compile(r"^\s*([a-hA-H])[\)\.]\s*")
+
+
+def normalize_text(text):
+    """Minúsculas, sin acentos, sin puntuación y con los espacios colapsados."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", without_accents).split())
+
+def split_options(question):
+    """
+    Separa el enunciado de las alternativas explícitas (a), b), ...).
+    Devuelve (enunciado, [(letra, texto_opción)]). Sin alternativas, la lista queda vacía.
+    """
+    matches = list(_OPTION_RE.finditer(question))
+    # Solo se consideran alternativas si empiezan en "a" y siguen en orden (a, b, c...)
+    letters = [m.group(1).lower() for m in matches]
+    expected = [chr(ord("a") + i) for i in range(len(letters))]
+    if len(matches) < 2 or letters != expected:
+        return question, []
+    stem = question[:matches[0].start()]
+    options = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(question)
+        options.append((letters[i], question[match.end():end].strip()))
+    return stem, options
+
+def question_key(question):
+    """Clave exacta: enunciado normalizado + alternativas normalizadas sin importar su orden."""
+    stem, options = split_options(question)
+    normalized_options = sorted(normalize_text(text) for _letter, text in options)
+    return " || ".join([normalize_text(stem)] + normalized_options)
+
+def minhash_signature(key):
+    """Firma MinHash de los shingles de palabras de una clave normalizada."""
+    words = key.split()
+    if len(words) < SHINGLE_SIZE:
+        shingles = {key}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _MINHASH_COEFFS]
+
+def estimate_similarity(sig_a, sig_b):
+    """Similitud de Jaccard estimada a partir de dos firmas MinHash."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+def remap_answer_letter(answer, cached_question, new_question):
+    """
+    Si la respuesta es "x) texto" y las alternativas cambiaron de orden,
+    reescribe la letra para que apunte a la misma alternativa en la nueva pregunta.
+    """
+    match = _ANSWER_LETTER_RE.match(answer)
+    if not match:
+        return answer
+    _stem, old_options = split_options(cached_question)
+    _stem, new_options = split_options(new_question)
+    old_text = dict(old_options).get(match.group(1).lower())
+    if old_text is None:
+        return answer
+    for letter, text in new_options:
+        if normalize_text(text) == normalize_text(old_text):
+            return f"{letter}) {text}" if letter != match.group(1).lower() else answer
+    return answer
+
+
+class AnswerCache:
+    """Caché LRU de respuestas con coincidencia exacta (normalizada) y de casi-duplicados (MinHash)."""
+
+    def __init__(self, path=None, max_entries=ANSWER_CACHE_MAX_ENTRIES, threshold=NEAR_DUPLICATE_THRESHOLD):
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.entries = OrderedDict() # clave -> {"question", "answer", "signature", "options"}
+        self.lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    def get(self, question):
+        """
+        Devuelve la respuesta guardada para la pregunta (o una casi idéntica), o None. Las preguntas con
+        alternativas solo coinciden exactamente (enunciado y opciones normalizados, en cualquier orden): con
+        las mismas opciones, un enunciado casi igual puede preguntar lo contrario ("la primera etapa" /
+        "la última etapa") y la respuesta guardada sería incorrecta.
+        """
+        key = question_key(question)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.exact_hits += 1
+                return remap_answer_letter(entry["answer"], entry["question"], question)
+            if split_options(question)[1]:
+                self.misses += 1
+                return None
+
+            signature = minhash_signature(key)
+            best_key, best_similarity = None, 0.0
+            for candidate_key, candidate in self.entries.items():
+                if candidate["options"]: # Solo se compara con preguntas sin alternativas
+                    continue
+                similarity = estimate_similarity(signature, candidate["signature"])
+                if similarity > best_similarity:
+                    best_key, best_similarity = candidate_key, similarity
+            if best_key is not None and best_similarity >= self.threshold:
+                entry = self.entries[best_key]
+                self.entries.move_to_end(best_key)
+                self.near_hits += 1
+                logger.debug("Caché de respuestas: casi-duplicado encontrado (similitud %.2f).", best_similarity)
+                return remap_answer_letter(entry["answer"], entry["question"], question)
+
+            self.misses += 1
+            return None
+
+    def put(self, question, answer):
+        """Guarda una respuesta y persiste la caché en disco."""
+        key = question_key(question)
+        with self.lock:
+            self.entries[key] = {
+                "question": question,
+                "answer": answer,
+                "signature": minhash_signature(key),
+                "options": sorted(normalize_text(t) for _l, t in split_options(question)[1]),
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False) # Expulsar la menos usada recientemente
+            if self.path:
+                self._save_locked()
+
+    def stats_text(self):
+        """Texto corto con los contadores de aciertos y fallos."""
+        hits = self.exact_hits + self.near_hits
+        return f"{hits} aciertos ({self.near_hits} aprox.) / {self.misses} fallos"
+
+    def clear(self):
+        """Vacía la caché en memoria y en disco."""
+        with self.lock:
+            self.entries.clear()
+            if self.path and os.path.isfile(self.path):
+                os.remove(self.path)
+
+    def load(self):
+        """Carga la caché desde disco (ignora archivos inexistentes, corruptos o de otra versión)."""
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CACHE_FILE_VERSION:
+                return
+            for item in data.get("entries", [])[-self.max_entries:]:
+                key = question_key(item["question"])
+                self.entries[key] = {
+                    "question": item["question"],
+                    "answer": item["answer"],
+                    "signature": minhash_signature(key),
+                    "options": sorted(normalize_text(t) for _l, t in split_options(item["question"])[1]),
+                }
+            logger.info("Caché de respuestas cargada: %s entradas.", len(self.entries))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("No se pudo cargar la caché de respuestas (%s): %s", self.path, e)
+
+    def _save_locked(self):
+        """Escribe la caché a disco de forma atómica (debe llamarse con el lock tomado)."""
+        data = {
+            "version": CACHE_FILE_VERSION,
+            # En orden LRU: la última es la usada más recientemente
+            "entries": [{"question": e["question"], "answer": e["answer"]} for e in self.entries.values()],
+        }
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("No se pudo guardar la caché de respuestas: %s", e)
@@ -0,0 +1,784 @@
+"""
+Núcleo del asistente sin dependencias de interfaz: material de estudio, armado del prompt,
+llamadas a OpenAI y caché de respuestas. Lo usan la app de bandeja (main.py) y el modo por lotes
+(batch.py); no importa tkinter, pystray, pynput ni mss.
+Los módulos pesados (openai, httpx, pypdf, PIL) se importan al usarlos por primera vez, para que la
+app pueda mostrar la ventana y la bandeja antes de pagar su carga (ver start_background_loading).
+"""
+import os
+import time
+import logging
+import threading
+import contextlib
+from dotenv import load_dotenv
+from retrieval import RetrievalIndex # Índice BM25 para enviar solo los pasajes relevantes
+from corpus_store import CorpusStore # Material en un archivo mapeado en memoria con tablas de posiciones
+from corpus_cleaning import clean_documents # Quita plantillas, artefactos y párrafos repetidos del texto extraído
+from prompt_builder import (TokenCounter, TokenAccounting, build_messages, count_message_tokens,
+                            context_window, token_cache_path, usage_attributes) # Conteo de tokens y prompt con prefijo estable
+from answer_cache import AnswerCache # Caché de respuestas con detección de casi-duplicados
+from image_cache import ImageAnswerCache # Caché de respuestas a capturas de área por hash perceptual
+from resilience import ApiError, AUTH, QUOTA, RETRYABLE_KINDS, RateLimiter, ResilientCaller # Reintentos, límites RPM/TPM y cortacircuitos
+from request_scheduler import RequestCancelled
+from tracing import span, current_trace
+from pdf_watcher import PdfDirectoryWatcher, snapshot_directory # Recarga en caliente del directorio de PDFs
+from local_answerer import answer_locally # Respuestas locales a preguntas de opción múltiple (requiere NumPy)
+from model_router import ModelRouter, ModelStats, STRONG, answers_agree # Modelo rápido o fuerte por petición
+
+logger = logging.getLogger("asistente")
+
+# --- Configuración ---
+PDF_DIRECTORY = "pdfs"
+# Procesos para extraer PDFs en paralelo (0 = uno por núcleo, 1 = secuencial)
+EXTRACTION_WORKERS = 0
+
+SYSTEM_MESSAGE = "Eres un asistente experto que responde preguntas de opción múltiple basándose en material de estudio o imágenes proporcionadas."
+
+# El prompt se divide en partes fijas (instrucciones + material) y la parte variable (la pregunta),
+# en ese orden, para que el prefijo sea idéntico entre llamadas y aproveche la caché de prompt del proveedor.
+PROMPT_INSTRUCTIONS = """
+Tu tarea principal es responder la pregunta proporcionada de la manera más precisa y concisa posible.
+
+Considera los siguientes tipos de pregunta:
+
+1. PREGUNTA CON OPCIONES MÚLTIPLES EXPLÍCITAS (ej: con a), b), c)):
+   - Identifica la alternativa correcta.
+   - RESPONDE ÚNICAMENTE con la letra de la alternativa y el texto completo de esa alternativa (ej: "a) El proceso de transformación digital.", "b) Se refiere a la capacidad de adaptación.").
+
+2. PREGUNTA DIRECTA O DE CONOCIMIENTO (que busca una única respuesta fáctica, sin opciones explícitas en la pregunta):
+   - Proporciona la respuesta correcta y concisa.
+   - FORMATEA ESTA RESPUESTA COMO SI FUERA LA PRIMERA ALTERNATIVA, utilizando "a)" seguido de la respuesta (ej: si la pregunta es "¿Color del cielo?", responde "a) Azul").
+
+3. PREGUNTA PARA COMPLETAR LA ORACIÓN (ej: "El sol sale por el ____."):
+   - Proporciona la palabra o frase corta que completa correctamente la oración.
+
+
+En todos los casos, DEBES proporcionar una respuesta y seguir ESTRICTAMENTE este orden de prioridad para la información:
+1. EXCLUSIVAMENTE el material de estudio adjunto (PDFs).
+2. Si se proporciona una imagen, basa tu respuesta PRINCIPALMENTE en la imagen, complementada por el material de estudio.
+3. Solo como ÚLTIMO RECURSO, si la información no está en el material ni en la imagen, usa tu conocimiento general.
+
+NO INCLUYAS EXPLICACIONES, saludos, ni ningún otro texto adicional. Solo la respuesta directa según el tipo de pregunta y formato especificado.
+"""
+
+PROMPT_CONTEXT_TEMPLATE = """Material de estudio adjunto (PDFs):
+---
+{pdf_context}
+---
+"""
+
+PROMPT_QUESTION_TEMPLATE = """Pregunta del usuario (y posible imagen adjunta):
+---
+{user_question}
+---
+
+RESPUESTA (según el tipo de pregunta, ver instrucciones arriba):
+"""
+OPENAI_MODEL = "gpt-4o"
+MAX_COMPLETION_TOKENS = 250 # Tope de tokens de la respuesta
+# Presupuesto de tokens de entrada por modelo (instrucciones + material + pregunta)
+INPUT_TOKEN_BUDGETS = {"gpt-4o": 16000, "gpt-4o-mini": 16000}
+DEFAULT_INPUT_TOKEN_BUDGET = 16000
+# Si el material completo cabe en el presupuesto se envía siempre igual, como prefijo estable,
+# para que la caché de prompt del proveedor lo reutilice en cada llamada
+CACHE_FRIENDLY_PREFIX = True
+# Recuperación de pasajes: si el material no cabe en el presupuesto, solo se envían los más relevantes
+USE_RETRIEVAL = True # False (o --contexto-completo) envía el material completo en cada pregunta
+RETRIEVAL_TOP_K = 8 # Máximo de pasajes por pregunta
+RETRIEVAL_MAX_CHARS = 6000 # Presupuesto de caracteres del material enviado por pregunta
+# Caché de respuestas: las preguntas repetidas (o casi idénticas) no vuelven a llamar a la API
+USE_ANSWER_CACHE = True
+ANSWER_CACHE_PATH = "answer_cache.json"
+# Caché por imagen: una captura de área igual o casi igual (dHash) a una ya respondida reutiliza la respuesta
+# antes del OCR, la codificación y la API
+USE_IMAGE_CACHE = True
+IMAGE_CACHE_PATH = "image_answer_cache.json"
+# Streaming: la etiqueta muestra la respuesta a medida que llega; se copia al portapapeles al terminar
+STREAMING_ENABLED = True
+# Motor asíncrono (httpx.AsyncClient con HTTP/2, pool keep-alive y precalentamiento) en su propio hilo.
+# False (o --motor-sincrono) usa el cliente síncrono original.
+USE_ASYNC_ENGINE = True
+# Codificación de capturas de área: sobrescribe valores de image_pipeline.DEFAULT_SETTINGS
+# (p.ej. {"format": "PNG", "max_long_edge": None, "byte_budget": None} para el PNG original sin pérdida)
+IMAGE_ENCODING_SETTINGS = {}
+# Límites de la cuenta en la API (ver la página de límites de la organización): el limitador local
+# reparte las peticiones para no llegar al 429. None desactiva el límite correspondiente.
+RATE_LIMIT_RPM = 500 # Peticiones por minuto
+RATE_LIMIT_TPM = 30000 # Tokens (entrada + salida máxima) por minuto
+# Recarga en caliente: al añadir, modificar o borrar PDFs del directorio se re-extraen solo esos archivos
+PDF_WATCH_BACKEND = "auto" # "auto", "windows", "inotify", "polling" o None (sin recarga)
+# Limpieza del material tras la extracción: líneas de plantilla (encabezados, pies, código del curso, números
+# de página), artefactos de pypdf y párrafos repetidos dentro de un PDF o entre PDFs. False (o --sin-limpieza)
+# envía el texto tal como se extrae.
+USE_CORPUS_CLEANING = True
+CORPUS_STORE_DIRECTORY = None # Dónde se escribe el archivo mapeado del material (None = directorio temporal)
+MAX_BYTES_PER_TOKEN = 16 # Cota holgada para leer solo el inicio del material cuando hay que recortarlo
+# Respuestas locales: las preguntas de opción múltiple cuya alternativa aparece claramente en el material
+# (puntuación y margen sobre la segunda por encima de los umbrales) se responden sin llamar a la API.
+# Usa el índice de recuperación (no disponible con --contexto-completo). Sin conexión con la API, las
+# que no superan los umbrales se responden igualmente con la mejor alternativa local, marcada como sin
+# confirmar: se muestra con UNCONFIRMED_MARK y no se copia al portapapeles.
+USE_LOCAL_ANSWERER = True
+LOCAL_ANSWER_MIN_SCORE = 0.5
+LOCAL_ANSWER_MIN_MARGIN = 0.25
+# Errores de la API con los que se recurre a la respuesta local (la API no está disponible; una clave
+# inválida o ausente no lo es: se muestra el error para que se corrija)
+LOCAL_FALLBACK_KINDS = RETRYABLE_KINDS | {QUOTA}
+UNCONFIRMED_MARK = "?" # Delante de las respuestas locales sin confirmar en la etiqueta
+# Enrutado de modelos: cada petición va al modelo rápido (FAST_MODEL) o al fuerte (OPENAI_MODEL) según su
+# tipo y tamaño (ver model_router.DEFAULT_ROUTES). False (o --sin-enrutado) envía todo a OPENAI_MODEL.
+USE_MODEL_ROUTER = True
+FAST_MODEL = "gpt-4o-mini"
+MODEL_ROUTES = {} # Sobrescribe rutas por tipo, p.ej. {"opcion_multiple": "rapido"}
+# Consulta doble (--consulta-doble): lo que va al modelo fuerte se pide también al rápido a la vez; la
+# respuesta rápida se muestra y se copia primero, y se corrige si la del fuerte es distinta (una llamada más)
+HEDGED_REQUESTS = False
+
+# --- Carga de Clave API ---
+load_dotenv()
+API_KEY = os.getenv("OPENAI_API_KEY")
+# URL alternativa de la API (p.ej. el servidor local de mock_openai_server.py); None = API de OpenAI
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+MISSING_API_KEY_MESSAGE = "No se encontró la variable de entorno OPENAI_API_KEY. Asegúrate de que esté en el archivo .env"
+
+client = None # Cliente síncrono de OpenAI, creado en la primera llamada (ver get_client)
+_client_lock = threading.Lock()
+
+# Estado compartido: se inicializa con prepare_corpus() y start_async_engine()
+corpus_text = None # Material (CorpusStore) que se pasa como contexto; disponible cuando corpus_ready está activo
+corpus_ready = threading.Event()
+corpus_cache_warm = False # True si al cargar ya había texto extraído en caché (arranque "en caliente")
+global_retrieval_index = None # Índice de pasajes construido a partir de los PDFs
+corpus_documents = [] # Documentos del material ({"filename", "pages", "key"}, páginas leídas del almacén), base de las recargas
+corpus_directory = None # Directorio del que se cargó el material
+corpus_snapshot = {} # Estado de los PDFs (mtime, tamaño) al empezar la carga: punto de partida del observador
+corpus_load_options = {} # use_cache/workers de la carga, reutilizados en las recargas
+_corpus_lock = threading.Lock() # Una carga o recarga a la vez (las peticiones no lo toman)
+pdf_watcher = None # Observador del directorio de PDFs (ver start_corpus_watcher)
+answer_cache = None # Caché de respuestas (AnswerCache), creada al iniciar si USE_ANSWER_CACHE
+image_cache = None # Caché de respuestas por imagen (ImageAnswerCache), creada al iniciar si USE_IMAGE_CACHE
+token_counter = TokenCounter(OPENAI_MODEL) # Se reemplaza en prepare_corpus por uno con caché junto al corpus
+token_accounting = TokenAccounting() # Tokens de entrada/salida y aciertos de caché de prompt por petición
+async_engine = None # Motor asíncrono (AsyncOpenAIEngine), arrancado con start_async_engine si USE_ASYNC_ENGINE
+resilient_caller = ResilientCaller(RateLimiter(RATE_LIMIT_RPM, RATE_LIMIT_TPM)) # Ver configure_rate_limits
+model_stats = ModelStats() # Latencia por modelo y desacuerdos de las consultas dobles
+
+# --- Funciones ---
+
+def get_client():
+    """
+    Devuelve el cliente síncrono de OpenAI, creándolo la primera vez (importar openai cuesta ~0,5 s).
+    Sin clave API lanza ApiError(AUTH), que la app muestra en la etiqueta.
+    """
+    global client
+    if client is not None:
+        return client
+    if not API_KEY:
+        raise ApiError(AUTH, MISSING_API_KEY_MESSAGE)
+    with _client_lock:
+        if client is None:
+            import httpx
+            from openai import OpenAI
+            # Inicializar OpenAI con un cliente httpx personalizado
+            # Esto puede ayudar a evitar problemas con la configuración de proxies del entorno.
+            try:
+                custom_httpx_client = httpx.Client(trust_env=False)
+                # Los reintentos los hace resilient_caller (con Retry-After y cortacircuitos), no el SDK
+                client = OpenAI(api_key=API_KEY, base_url=OPENAI_BASE_URL, http_client=custom_httpx_client, max_retries=0)
+            except Exception as e_httpx:
+                logger.error("Error al inicializar OpenAI con httpx.Client(trust_env=False): %s", e_httpx)
+                logger.warning("Intentando inicialización simple de OpenAI (puede fallar si el problema de proxy persiste)...")
+                client = OpenAI(api_key=API_KEY, base_url=OPENAI_BASE_URL, max_retries=0) # Fallback a la original si la nueva falla por otra razón
+    return client
+
+def load_pdf_documents(directory, use_cache=True, workers=None, reuse=None):
+    """
+    Extrae los PDFs del directorio página por página. Devuelve [{"filename", "pages", "key"}].
+    reuse ({nombre: documento}) son los PDFs sin cambios desde la carga anterior, que no se vuelven a leer.
+    """
+    if workers is None:
+        workers = EXTRACTION_WORKERS
+    logger.info("Buscando PDFs en: %s", os.path.abspath(directory))
+    if not os.path.isdir(directory):
+        logger.error("El directorio '%s' no existe.", directory)
+        return []
+    try:
+        from pdf_extraction import extract_documents # Carga pypdf solo cuando hay que leer el material
+        documents = extract_documents(directory, use_cache=use_cache, workers=workers, reuse=reuse)
+        logger.info("Extracción de texto de PDFs completada.")
+        return documents
+    except Exception as e:
+        logger.error("Error al listar el directorio '%s': %s", directory, e)
+        return []
+
+def join_documents_text(documents):
+    """Une el texto de todas las páginas no vacías con el separador entre textos de PDFs."""
+    all_text = [page_text for doc in documents for page_text in doc["pages"] if page_text]
+    return "\n\n---\n\n".join(all_text) # Separador entre textos de PDFs
+
+def extract_text_from_pdfs(directory, use_cache=True, workers=None):
+    """Extrae texto de todos los archivos PDF en el directorio especificado (con caché en disco y limpio)."""
+    documents = load_pdf_documents(directory, use_cache=use_cache, workers=workers)
+    if USE_CORPUS_CLEANING:
+        documents, _report = clean_documents(documents)
+    return join_documents_text(documents)
+
+def select_context_for_question(question, context, context_token_budget, allow_retrieval=True):
+    """
+    Devuelve (material, prefijo_estable) para una pregunta. context es el almacén del material
+    (CorpusStore) o un texto:
+    - el material completo si cabe en el presupuesto de tokens (prefijo estable, aprovecha la caché de prompt),
+      o si no hay índice; un almacén se devuelve tal cual (ver build_prompt_messages);
+    - si no cabe, los pasajes más relevantes dentro del presupuesto (cambian con cada pregunta);
+    - si ningún pasaje coincide (o la recuperación está desactivada o no se permite), el material
+      recortado al presupuesto.
+    """
+    context = context or ""
+    if isinstance(context, CorpusStore):
+        corpus_tokens = context.token_count if context.token_count is not None else token_counter.count(context.full_text())
+        corpus_chars = context.chars
+    else:
+        corpus_tokens = token_counter.count(context, memoize=False)
+        corpus_chars = len(context)
+    if corpus_tokens <= context_token_budget and CACHE_FRIENDLY_PREFIX:
+        return context, True
+    if allow_retrieval and USE_RETRIEVAL and global_retrieval_index is not None:
+        passages = global_retrieval_index.build_context(question, top_k=RETRIEVAL_TOP_K, max_chars=RETRIEVAL_MAX_CHARS,
+                                                        max_tokens=context_token_budget)
+        if passages:
+            logger.info("Recuperación: %s de %s caracteres del material seleccionados.", len(passages), corpus_chars)
+            return passages, False
+        logger.info("Recuperación: ningún pasaje coincide con la pregunta. Usando el material completo.")
+    if corpus_tokens > context_token_budget:
+        logger.warning("Material recortado a %s de %s tokens (presupuesto de entrada).", context_token_budget, corpus_tokens)
+        if isinstance(context, CorpusStore): # Leer solo el inicio del archivo, no el material entero
+            context = context.prefix_text(context_token_budget * MAX_BYTES_PER_TOKEN)
+        return token_counter.truncate(context, context_token_budget), True
+    return context, True
+
+def build_prompt_messages(question, context, image_url=None, model=None):
+    """
+    Arma los mensajes respetando el presupuesto de tokens de entrada del modelo (None = OPENAI_MODEL).
+    Devuelve (mensajes, tokens_de_entrada_estimados, prefijo_estable).
+    """
+    question_text = PROMPT_QUESTION_TEMPLATE.format(user_question=question)
+    system_text = SYSTEM_MESSAGE + "\n" + PROMPT_INSTRUCTIONS
+    fixed_tokens = count_message_tokens(token_counter, system_text, PROMPT_CONTEXT_TEMPLATE.format(pdf_context=""),
+                                        question_text, has_image=bool(image_url))
+    budget = INPUT_TOKEN_BUDGETS.get(model or OPENAI_MODEL, DEFAULT_INPUT_TOKEN_BUDGET)
+    # Con imagen la pregunta de texto es genérica: no sirve para recuperar pasajes
+    selected_context, stable_prefix = select_context_for_question(question, context, max(0, budget - fixed_tokens),
+                                                                  allow_retrieval=not image_url)
+    if isinstance(selected_context, CorpusStore):
+        # Material completo: el mensaje se arma una vez por versión del material y lo comparten todas las
+        # peticiones, en lugar de una copia del corpus por petición en curso
+        context_text, context_tokens = selected_context.cached("mensaje_material", lambda: _context_message(selected_context.full_text()))
+    else:
+        context_text, context_tokens = _context_message(selected_context)
+    messages = build_messages(system_text, context_text, question_text, image_url=image_url)
+    input_tokens = context_tokens + count_message_tokens(token_counter, system_text, "", question_text, has_image=bool(image_url))
+    return messages, input_tokens, stable_prefix
+
+def _context_message(context):
+    """Mensaje de material del prompt y sus tokens."""
+    context_text = PROMPT_CONTEXT_TEMPLATE.format(pdf_context=context)
+    return context_text, token_counter.count(context_text, memoize=False) # Cambia con cada pregunta: no se memoriza
+
+def encode_image_to_base64(image_pil):
+    """
+    Codifica un objeto PIL.Image a base64 string, reescalado y comprimido según IMAGE_ENCODING_SETTINGS.
+    Devuelve (base64, tipo_mime).
+    """
+    from image_pipeline import encode_image, format_report as format_image_report # Reescalado y compresión de capturas
+    with span("codificacion") as encode_span:
+        image_str, mime_type, report = encode_image(image_pil, IMAGE_ENCODING_SETTINGS)
+        encode_span.set(bytes=report["bytes"], chars=len(image_str), format=report["format"],
+                        size=f"{report['final_size'][0]}x{report['final_size'][1]}")
+    logger.debug("Imagen codificada: %s", format_image_report(report))
+    return image_str, mime_type
+
+def get_openai_answer(question, context, image_base64=None, on_partial=None, image_mime="image/png", cancel_event=None,
+                      model=None): # Modificado para aceptar imagen
+    """
+    Obtiene la respuesta de OpenAI con model (None = OPENAI_MODEL).
+    Si se pasa on_partial y STREAMING_ENABLED, se llama con el texto parcial a medida que llega.
+    Los errores transitorios (429, 5xx, red) se reintentan; si la llamada falla definitivamente
+    lanza resilience.ApiError, cuyo display_text sirve para la etiqueta. cancel_event (p.ej. el de
+    la petición del planificador) interrumpe las esperas entre reintentos.
+    """
+    model = model or OPENAI_MODEL
+    image_url = f"data:{image_mime};base64,{image_base64}" if image_base64 else None
+    with span("prompt") as prompt_span:
+        messages_payload, input_tokens, stable_prefix = build_prompt_messages(question, context, image_url=image_url, model=model)
+        prompt_span.set(tokens=input_tokens, stable_prefix=stable_prefix)
+    # No pedir más tokens de salida de los que caben en la ventana de contexto
+    max_completion_tokens = max(1, min(MAX_COMPLETION_TOKENS, context_window(model) - input_tokens))
+
+    if image_base64:
+        logger.info("Enviando pregunta e imagen a OpenAI (%s, ~%s tokens de entrada)...", model, input_tokens)
+    else:
+        logger.info("Enviando pregunta a OpenAI (%s, ~%s tokens de entrada)...", model, input_tokens)
+
+    request_start = time.perf_counter()
+    streaming = STREAMING_ENABLED and on_partial is not None
+    first_partial_at = [] # Momento del primer texto parcial, para el tramo 'api'
+    def on_partial_timed(partial_text):
+        if not first_partial_at:
+            first_partial_at.append(time.perf_counter())
+        on_partial(partial_text)
+
+    def call_api():
+        if async_engine is not None:
+            # Motor asíncrono: conexiones HTTP/2 reutilizadas y precalentadas
+            return async_engine.complete(
+                messages_payload,
+                on_partial=on_partial_timed if streaming else None,
+                model=model,
+                temperature=0.0,
+                max_tokens=max_completion_tokens
+            )
+        if streaming:
+            return stream_openai_answer(messages_payload, on_partial_timed, request_start, max_completion_tokens, model=model)
+        response = get_client().chat.completions.create(
+            model=model,
+            messages=messages_payload,
+            temperature=0.0, # Temperatura bajada para respuestas más deterministas
+            max_tokens=max_completion_tokens
+        )
+        logger.info("Latencia total: %.0f ms.", (time.perf_counter() - request_start) * 1000)
+        return response.choices[0].message.content.strip(), response.usage
+
+    with span("api", model=model, image=bool(image_base64)) as api_span:
+        try:
+            # Un reintento después de mostrar texto parcial haría retroceder la etiqueta: solo antes del primero
+            (answer, usage), attempts = resilient_caller.call(call_api, estimated_tokens=input_tokens + max_completion_tokens,
+                                                              cancel_event=cancel_event, can_retry=lambda: not first_partial_at)
+        except ApiError as e:
+            model_stats.record_call(model, (time.perf_counter() - request_start) * 1000, error=True)
+            api_span.set(error=e.kind, attempts=e.attempts)
+            logger.error("Error al llamar a la API de OpenAI (%s, %d intentos): %s", e.kind, e.attempts, e)
+            raise
+        model_stats.record_call(model, (time.perf_counter() - request_start) * 1000)
+        api_span.set(chars=len(answer), attempts=attempts, **usage_attributes(usage))
+        if first_partial_at:
+            api_span.set(first_token_ms=round((first_partial_at[0] - request_start) * 1000, 1))
+    if usage is not None and resilient_caller.limiter is not None:
+        resilient_caller.limiter.adjust_tokens((usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+                                               - input_tokens - max_completion_tokens)
+    logger.info("%s", token_accounting.record(usage, input_tokens, stable_prefix))
+    logger.info("Respuesta recibida (completa): %s", answer)
+    return answer
+
+def stream_openai_answer(messages_payload, on_partial, request_start, max_completion_tokens=MAX_COMPLETION_TOKENS, model=None):
+    """
+    Consume la respuesta en modo streaming, llamando a on_partial(texto_parcial) con cada fragmento.
+    Registra el tiempo hasta el primer carácter visible junto a la latencia total.
+    Devuelve (respuesta, uso_de_tokens).
+    """
+    stream = get_client().chat.completions.create(
+        model=model or OPENAI_MODEL,
+        messages=messages_payload,
+        temperature=0.0,
+        max_tokens=max_completion_tokens,
+        stream=True,
+        stream_options={"include_usage": True} # El último fragmento trae el uso de tokens
+    )
+    parts = []
+    first_token_ms = None
+    usage = None
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_token_ms is None and delta.strip():
+                first_token_ms = (time.perf_counter() - request_start) * 1000
+            parts.append(delta)
+            on_partial("".join(parts).strip())
+    finally:
+        stream.close() # Libera la conexión también si on_partial cancela la petición
+    total_ms = (time.perf_counter() - request_start) * 1000
+    first_token_text = f"{first_token_ms:.0f} ms" if first_token_ms is not None else "sin texto"
+    logger.info("Streaming: primer carácter visible en %s, latencia total %.0f ms.", first_token_text, total_ms)
+    return "".join(parts).strip(), usage
+
+def route_request(question, has_image=False):
+    """Modelo para la petición: (modelo, tipo de petición, FAST o STRONG). Sin enrutado, OPENAI_MODEL."""
+    if not USE_MODEL_ROUTER:
+        return OPENAI_MODEL, None, STRONG
+    return ModelRouter(FAST_MODEL, OPENAI_MODEL, routes=MODEL_ROUTES).route(question, has_image=has_image)
+
+def get_routed_answer(question, context, image_base64=None, on_partial=None, image_mime="image/png", cancel_event=None,
+                      on_preliminary=None):
+    """
+    Como get_openai_answer, pero con el modelo que elige el enrutado. Con HEDGED_REQUESTS, lo que va al
+    modelo fuerte se consulta también al rápido (ver get_hedged_answer); on_preliminary(respuesta) recibe
+    la respuesta rápida si llega antes que la fuerte. Devuelve la respuesta definitiva.
+    """
+    model, kind, tier = route_request(question, has_image=bool(image_base64))
+    if kind is not None:
+        logger.debug("Enrutado: petición '%s' -> modelo %s (%s).", kind, model, tier)
+    if HEDGED_REQUESTS and tier == STRONG and FAST_MODEL != model:
+        return get_hedged_answer(question, context, image_base64=image_base64, on_partial=on_partial, image_mime=image_mime,
+                                 cancel_event=cancel_event, on_preliminary=on_preliminary, strong_model=model)
+    return get_openai_answer(question, context, image_base64=image_base64, on_partial=on_partial, image_mime=image_mime,
+                             cancel_event=cancel_event, model=model)
+
+def get_hedged_answer(question, context, image_base64=None, on_partial=None, image_mime="image/png", cancel_event=None,
+                      on_preliminary=None, strong_model=None):
+    """
+    Consulta doble: pide la respuesta a FAST_MODEL (en otro hilo, con streaming hacia on_partial) y a
+    strong_model (en este hilo, sin streaming) a la vez. Si la rápida llega primero se entrega a
+    on_preliminary para mostrarla y copiarla enseguida. Devuelve la del modelo fuerte, o la rápida si
+    el fuerte falla; si fallan las dos se propaga el error del fuerte. Registra el desacuerdo en model_stats.
+    Si la fuerte llega primero se cancela la rápida: con streaming se cierra la conexión en el siguiente
+    fragmento; sin streaming solo se evitan sus reintentos (la petición en curso no puede interrumpirse).
+    """
+    strong_model = strong_model or OPENAI_MODEL
+    trace = current_trace()
+    lock = threading.Lock()
+    state = {"fast": None, "fast_error": None, "strong": None, "preliminary": None}
+    fast_cancel = threading.Event() # Cancela la consulta rápida sin tocar el cancel_event de la petición
+
+    def compare():
+        """Con las dos respuestas ya recibidas (la llama quien termine en segundo lugar)."""
+        agreed = answers_agree(state["fast"], state["strong"])
+        upgraded = not agreed and state["preliminary"] is not None
+        model_stats.record_hedge(agreed, upgraded=upgraded)
+        if upgraded:
+            logger.info("Consulta doble: %s corrige la respuesta de %s (%s -> %s).", strong_model, FAST_MODEL,
+                        state["fast"], state["strong"])
+        logger.info("Consulta doble: respuestas %s. %s", "iguales" if agreed else "distintas", model_stats.stats_text())
+
+    def on_fast_partial(partial_text):
+        if fast_cancel.is_set() or (cancel_event is not None and cancel_event.is_set()):
+            # La excepción corta el streaming y cierra la conexión: no se siguen gastando tokens
+            raise RequestCancelled("Consulta rápida cancelada")
+        with lock:
+            if state["strong"] is None and on_partial is not None: # Con la respuesta fuerte ya entregada, el texto parcial la taparía
+                on_partial(partial_text)
+
+    def run_fast():
+        try:
+            with trace.activate() if trace is not None else contextlib.nullcontext():
+                # Siempre con on_partial: con streaming activo la consulta puede cancelarse a mitad de respuesta
+                answer = get_openai_answer(question, context, image_base64=image_base64, on_partial=on_fast_partial,
+                                           image_mime=image_mime, cancel_event=fast_cancel, model=FAST_MODEL)
+        except Exception as e: # Incluye RequestCancelled desde on_partial: la fuerte decide el resultado
+            logger.debug("Consulta doble: el modelo rápido no respondió (%s).", e)
+            with lock:
+                state["fast_error"] = e
+            return
+        with lock:
+            state["fast"] = answer
+            strong_done = state["strong"] is not None
+            if not strong_done and on_preliminary is not None:
+                # Bajo el candado: la respuesta fuerte no puede entregarse antes que esta
+                state["preliminary"] = answer
+                on_preliminary(answer)
+        if strong_done:
+            compare()
+
+    fast_thread = threading.Thread(target=run_fast, name="consulta-rapida", daemon=True)
+    fast_thread.start()
+    try:
+        answer = get_openai_answer(question, context, image_base64=image_base64, image_mime=image_mime,
+                                   cancel_event=cancel_event, model=strong_model)
+    except ApiError as e:
+        if cancel_event is not None and cancel_event.is_set():
+            fast_cancel.set()
+        fast_thread.join() # La rápida tiene sus propios tiempos límite
+        if state["fast"] is None:
+            raise
+        logger.warning("Consulta doble: %s falló (%s); se mantiene la respuesta de %s.", strong_model, e.display_text, FAST_MODEL)
+        return state["fast"]
+    except BaseException:
+        fast_cancel.set() # Petición cancelada o reemplazada: la rápida ya no sirve
+        raise
+    with lock:
+        state["strong"] = answer
+        fast_done = state["fast"] is not None
+    if fast_done:
+        compare()
+    else:
+        fast_cancel.set()
+        logger.debug("Consulta doble: %s respondió primero; se cancela la consulta a %s.", strong_model, FAST_MODEL)
+    return answer
+
+def format_display_text(answer, confirmed=True):
+    """
+    Acorta la respuesta para la etiqueta: inicio y final de la respuesta si es larga. Las respuestas
+    sin confirmar (ver get_answer_with_cache) llevan UNCONFIRMED_MARK delante.
+    """
+    text = answer[:16] + "..." + answer[-13:] if len(answer) > 27 else answer
+    return text if confirmed else f"{UNCONFIRMED_MARK} {text}"
+
+def get_answer_with_cache(question, context, on_partial=None, cancel_event=None, on_preliminary=None):
+    """
+    Responde desde la caché de respuestas si es posible; si no, con el respondedor local si la pregunta
+    es de opción múltiple y la alternativa es clara en el material; si no, consulta a OpenAI con el
+    modelo que elige el enrutado (on_preliminary: ver get_routed_answer) y guarda la respuesta.
+    Devuelve (respuesta, confirmada). Si la API no está disponible (LOCAL_FALLBACK_KINDS) y hay una
+    alternativa local, se devuelve esa aunque no supere los umbrales, con confirmada=False: quien la
+    muestre debe distinguirla de una respuesta real. El resto de fallos de la API (ApiError) se
+    propagan sin tocar la caché.
+    """
+    if answer_cache is not None:
+        with span("cache_respuestas") as cache_span:
+            cached_answer = answer_cache.get(question)
+            cache_span.set(hit=cached_answer is not None)
+        if cached_answer is not None:
+            logger.info("Respuesta desde caché (sin llamar a la API): %s [%s]", cached_answer, answer_cache.stats_text())
+            return cached_answer, True
+    local = None
+    if USE_LOCAL_ANSWERER:
+        with span("local") as local_span:
+            local = answer_locally(question, global_retrieval_index,
+                                   min_score=LOCAL_ANSWER_MIN_SCORE, min_margin=LOCAL_ANSWER_MIN_MARGIN)
+            local_span.set(confident=local is not None and local.confident,
+                           score=round(local.score, 3) if local is not None else None)
+        if local is not None and local.confident:
+            # No se guarda en la caché de respuestas: con otros umbrales o más material podría cambiar
+            logger.info("Respuesta local en %.1f ms (sin llamar a la API): %s", local.ms, local.summary_text())
+            return local.answer, True
+        if local is not None:
+            logger.debug("Respuesta local insuficiente (%s): %s", local.reason, local.summary_text())
+    try:
+        answer = get_routed_answer(question, context, on_partial=on_partial, cancel_event=cancel_event,
+                                   on_preliminary=on_preliminary)
+    except ApiError as e:
+        if local is None or e.kind not in LOCAL_FALLBACK_KINDS:
+            raise
+        logger.warning("API no disponible (%s): se usa la mejor respuesta local, sin confirmar (%s): %s",
+                       e.display_text, local.reason, local.summary_text())
+        return local.answer, False
+    if answer_cache is not None:
+        answer_cache.put(question, answer)
+        logger.debug("Caché de respuestas: %s", answer_cache.stats_text())
+    return answer, True
+
+def build_retrieval_index(documents, previous=None, changed_filenames=()):
+    """
+    Construye el índice de recuperación del material (None si la recuperación está desactivada).
+    Con previous solo se trocean y tokenizan los PDFs de changed_filenames; el resto se reutiliza.
+    """
+    if not USE_RETRIEVAL or not documents:
+        return None
+    index_start = time.perf_counter()
+    if previous is not None:
+        index = previous.updated(documents, changed_filenames)
+    else:
+        index = RetrievalIndex.from_documents(documents)
+    index.attach_token_counts(token_counter.count) # Conteos por pasaje, cacheados junto al corpus
+    logger.info("Índice de recuperación: %s pasajes en %.0f ms.", len(index.chunks), (time.perf_counter() - index_start) * 1000)
+    return index
+
+def clean_corpus_documents(documents):
+    """Limpia el texto extraído (si USE_CORPUS_CLEANING) y registra la reducción por PDF."""
+    if not USE_CORPUS_CLEANING or not documents:
+        return documents
+    clean_start = time.perf_counter()
+    documents, report = clean_documents(documents, count_tokens=token_counter.count)
+    logger.info("Limpieza del material en %.0f ms: %s.", (time.perf_counter() - clean_start) * 1000, report.stats_text())
+    for line in report.table_lines()[:-1]:
+        logger.debug("Limpieza: %s", line)
+    return documents
+
+def build_corpus(documents, previous_index=None, changed_filenames=(), previous_documents=None):
+    """
+    Limpia el texto extraído y construye el índice y el almacén mapeado del material. Los pasajes del
+    índice pasan a leerse del almacén, así que al terminar el texto extraído (documents) ya no hace falta
+    en memoria. La limpieza mira todo el material a la vez (plantillas y párrafos repetidos entre PDFs):
+    en una recarga, los PDFs sin cambios cuyo texto limpio cambió (previous_documents es el material
+    limpio anterior) también se vuelven a indexar. Devuelve (almacén, índice o None).
+    """
+    documents = clean_corpus_documents(documents)
+    if previous_index is not None and previous_documents is not None and USE_CORPUS_CLEANING:
+        previous_pages = {doc["filename"]: doc["pages"] for doc in previous_documents}
+        changed_filenames = set(changed_filenames) | {
+            doc["filename"] for doc in documents
+            if doc["filename"] in previous_pages and list(previous_pages[doc["filename"]]) != doc["pages"]}
+    index = build_retrieval_index(documents, previous=previous_index, changed_filenames=changed_filenames)
+    store_start = time.perf_counter()
+    store = CorpusStore.build(documents, index.chunks if index is not None else (), directory=CORPUS_STORE_DIRECTORY)
+    if index is not None:
+        index.chunks = store.chunks
+    store.token_count = token_counter.count(store.full_text())
+    token_counter.save()
+    logger.info("Almacén del material en %.0f ms: %s.", (time.perf_counter() - store_start) * 1000, store.memory_text())
+    return store, index
+
+def prepare_corpus(directory=None, use_cache=True, workers=None):
+    """
+    Carga el material de estudio, construye el índice de recuperación y precuenta los tokens del corpus.
+    Devuelve el almacén del material (el contexto que se pasa a get_openai_answer).
+    """
+    global global_retrieval_index, token_counter, corpus_text, corpus_cache_warm
+    global corpus_documents, corpus_directory, corpus_snapshot, corpus_load_options
+    from pdf_extraction import get_cache_dir
+    directory = directory or PDF_DIRECTORY
+    cache_dir = get_cache_dir(directory)
+    with _corpus_lock:
+        corpus_cache_warm = use_cache and os.path.isdir(cache_dir) and any(name.endswith(".json") for name in os.listdir(cache_dir))
+        # Antes de extraer: lo que cambie durante la carga lo verá el observador en su primera comprobación
+        snapshot = snapshot_directory(directory)
+        extraction_start = time.perf_counter()
+        pdf_documents = load_pdf_documents(directory, use_cache=use_cache, workers=workers)
+        logger.info("Texto de los PDFs cargado en %.0f ms.", (time.perf_counter() - extraction_start) * 1000)
+
+        token_counter = TokenCounter(OPENAI_MODEL, cache_path=token_cache_path(cache_dir, OPENAI_MODEL))
+        store, global_retrieval_index = build_corpus(pdf_documents)
+        if global_retrieval_index is None:
+            logger.info("Recuperación desactivada: se enviará el material completo en cada pregunta.")
+        logger.info("Material de estudio: %d tokens (%s), presupuesto de entrada %d.", store.token_count,
+                    "exacto" if token_counter.exact else "estimado", INPUT_TOKEN_BUDGETS.get(OPENAI_MODEL, DEFAULT_INPUT_TOKEN_BUDGET))
+        if not store.chars:
+            logger.warning("No se pudo cargar texto de los PDFs. El asistente podría no tener contexto de clase.")
+        corpus_documents = store.documents()
+        corpus_directory = directory
+        corpus_snapshot = snapshot
+        corpus_load_options = {"use_cache": use_cache, "workers": workers}
+        corpus_text = store
+    corpus_ready.set()
+    return store
+
+def reload_corpus(added=(), changed=(), removed=()):
+    """
+    Recarga incremental del material tras cambios en el directorio de PDFs: solo se extraen y se
+    indexan los PDFs añadidos o modificados; los demás se reutilizan de la carga anterior.
+    El almacén y el índice nuevos se sustituyen de una vez al final, sin bloquear las peticiones:
+    las que ya tenían el material siguen con el anterior y las siguientes usan el nuevo.
+    Devuelve un resumen {"added", "changed", "removed", "documents", "chars", "ms"}.
+    """
+    global global_retrieval_index, corpus_text, corpus_documents
+    with _corpus_lock:
+        if corpus_directory is None:
+            raise RuntimeError("El material no se ha cargado todavía")
+        start = time.perf_counter()
+        touched = set(added) | set(changed) | set(removed)
+        reuse = {doc["filename"]: doc for doc in corpus_documents if doc["filename"] not in touched}
+        if USE_CORPUS_CLEANING:
+            # El material cargado está limpio: la limpieza se rehace sobre el texto extraído, que está en la caché
+            from pdf_extraction import cached_document
+            cached = {filename: cached_document(corpus_directory, doc) for filename, doc in reuse.items()}
+            reuse = {filename: doc for filename, doc in cached.items() if doc is not None} # Sin caché: se vuelve a extraer
+        documents = load_pdf_documents(corpus_directory, reuse=reuse, **corpus_load_options)
+        store, index = build_corpus(documents, previous_index=global_retrieval_index, changed_filenames=touched,
+                                    previous_documents=corpus_documents)
+        # Sustitución en una sola asignación: nunca se ve el almacén nuevo con el índice viejo desde este módulo
+        corpus_documents, corpus_text, global_retrieval_index = store.documents(), store, index
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    logger.info("Material recargado en %.0f ms: %d nuevos, %d modificados, %d eliminados (%d PDFs, %d tokens).",
+                elapsed_ms, len(added), len(changed), len(removed), len(documents), store.token_count)
+    return {"added": list(added), "changed": list(changed), "removed": list(removed), "documents": len(documents),
+            "chars": store.chars, "ms": round(elapsed_ms, 1)}
+
+def start_corpus_watcher(backend=None, on_reload_start=None, on_reload_done=None):
+    """
+    Observa el directorio del material y lo recarga (reload_corpus) cuando cambian sus PDFs.
+    on_reload_start(añadidos, modificados, eliminados) se llama al detectar cambios y
+    on_reload_done(resumen, error) al terminar, ambos desde el hilo del observador.
+    """
+    global pdf_watcher
+    backend = backend or PDF_WATCH_BACKEND
+    if not backend or pdf_watcher is not None or corpus_directory is None:
+        return pdf_watcher
+    def on_change(added, changed, removed):
+        if on_reload_start is not None:
+            on_reload_start(added, changed, removed)
+        summary, error = None, None
+        try:
+            summary = reload_corpus(added, changed, removed)
+        except Exception as e:
+            logger.exception("Error al recargar el material de estudio: %s", e)
+            error = e
+        if on_reload_done is not None:
+            on_reload_done(summary, error)
+    pdf_watcher = PdfDirectoryWatcher(corpus_directory, on_change, backend=backend, snapshot=corpus_snapshot).start()
+    return pdf_watcher
+
+def stop_corpus_watcher():
+    global pdf_watcher
+    if pdf_watcher is not None:
+        pdf_watcher.stop()
+        pdf_watcher = None
+
+def wait_for_corpus(cancel_event=None):
+    """
+    Devuelve el material de estudio, esperando a que termine de cargarse si hace falta.
+    Si cancel_event se activa durante la espera lanza RequestCancelled.
+    """
+    while not corpus_ready.wait(0.1):
+        if cancel_event is not None and cancel_event.is_set():
+            from request_scheduler import RequestCancelled
+            raise RequestCancelled("Petición cancelada mientras se cargaba el material")
+    return corpus_text
+
+def start_background_loading(use_cache=True, workers=None, on_ready=None):
+    """
+    Arranca en un hilo aparte lo lento del inicio: el motor asíncrono (importa openai y precalienta
+    la conexión) y la carga del material. on_ready(almacén) se llama al terminar, desde ese hilo
+    (con None si la carga falló).
+    Las preguntas que lleguen antes esperan en wait_for_corpus.
+    """
+    def load():
+        store = None
+        try:
+            start_async_engine()
+            store = prepare_corpus(use_cache=use_cache, workers=workers)
+        except Exception as e:
+            logger.exception("Error al cargar el material de estudio: %s", e)
+            corpus_ready.set() # Mejor responder sin material que dejar las preguntas esperando para siempre
+        if on_ready is not None:
+            on_ready(store)
+    thread = threading.Thread(target=load, name="carga-material", daemon=True)
+    thread.start()
+    return thread
+
+def configure_rate_limits(requests_per_minute=None, tokens_per_minute=None, wait_for_quota=False):
+    """
+    Ajusta el limitador local a los límites de la cuenta (por defecto RATE_LIMIT_RPM / RATE_LIMIT_TPM).
+    Con wait_for_quota las peticiones esperan su turno sin límite de tiempo en lugar de fallar como "rate limited".
+    """
+    rpm = requests_per_minute if requests_per_minute is not None else RATE_LIMIT_RPM
+    tpm = tokens_per_minute if tokens_per_minute is not None else RATE_LIMIT_TPM
+    if wait_for_quota:
+        resilient_caller.limiter = RateLimiter(rpm or None, tpm or None, max_wait=None)
+    else:
+        resilient_caller.limiter = RateLimiter(rpm or None, tpm or None)
+    logger.info("Limitador de la API: %s peticiones/min, %s tokens/min.", rpm or "sin límite", tpm or "sin límite")
+
+def start_async_engine():
+    """Arranca el bucle de eventos y precalienta la conexión (si USE_ASYNC_ENGINE)."""
+    global async_engine
+    if USE_ASYNC_ENGINE and async_engine is None:
+        if not API_KEY:
+            logger.error("%s", MISSING_API_KEY_MESSAGE)
+            return None
+        from async_engine import AsyncOpenAIEngine # Bucle asyncio con conexiones HTTP/2 precalentadas
+        async_engine = AsyncOpenAIEngine(API_KEY, base_url=OPENAI_BASE_URL).start()
+    return async_engine
+
+def stop_async_engine():
+    global async_engine
+    if async_engine is not None:
+        async_engine.stop()
+        async_engine = None
+
+def open_answer_cache(path=None):
+    """Abre la caché de respuestas (si USE_ANSWER_CACHE) para que get_answer_with_cache la use."""
+    global answer_cache
+    if USE_ANSWER_CACHE and answer_cache is None:
+        answer_cache = AnswerCache(path or ANSWER_CACHE_PATH)
+    return answer_cache
+
+def open_image_cache(path=None):
+    """Abre la caché de respuestas por imagen (si USE_IMAGE_CACHE) para las capturas de área."""
+    global image_cache
+    if USE_IMAGE_CACHE and image_cache is None:
+        image_cache = ImageAnswerCache(path or IMAGE_CACHE_PATH)
+    return image_cache
@@ -0,0 +1,157 @@
+import logging
+import time
+import asyncio
+import threading
+import importlib.util
+import httpx
+from openai import AsyncOpenAI
+
+from profiler import checkpoint as profiler_checkpoint
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración del motor asíncrono ---
+MAX_CONNECTIONS = 10
+MAX_KEEPALIVE_CONNECTIONS = 4
+KEEPALIVE_EXPIRY_SECONDS = 120 # Tiempo que el pool conserva una conexión ociosa
+# Si pasa este tiempo sin peticiones, se vuelve a calentar la conexión para que
+# la siguiente pregunta no pague DNS + TCP + TLS (los servidores cierran conexiones ociosas)
+PREWARM_IDLE_SECONDS = 45
+REQUEST_TIMEOUT_SECONDS = 60
+CONNECT_TIMEOUT_SECONDS = 10
+
+
+def http2_available():
+    """HTTP/2 en httpx requiere el paquete opcional 'h2' (pip install httpx[http2]); solo se comprueba que esté."""
+    return importlib.util.find_spec("h2") is not None
+
+
+class AsyncOpenAIEngine:
+    """
+    Motor de peticiones basado en asyncio que corre en su propio hilo con un bucle de eventos.
+    Usa un httpx.AsyncClient con HTTP/2 y pool keep-alive, calienta la conexión al iniciar
+    y tras periodos de inactividad. Los hilos de la app le envían trabajo con complete().
+    """
+
+    def __init__(self, api_key, base_url=None, http2=True, prewarm_idle_seconds=PREWARM_IDLE_SECONDS):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.http2 = http2 and http2_available()
+        if http2 and not self.http2:
+            logger.warning("El paquete 'h2' no está instalado; el motor asíncrono usará HTTP/1.1.")
+        self.prewarm_idle_seconds = prewarm_idle_seconds
+        self.loop = None
+        self.thread = None
+        self.http_client = None
+        self.client = None
+        self.ready = threading.Event()
+        self.last_activity = time.monotonic()
+        self.prewarm_count = 0
+
+    def start(self):
+        """Arranca el hilo del bucle de eventos y espera a que el cliente esté creado."""
+        self.thread = threading.Thread(target=self._run_loop, name="motor-openai-async", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.http_client = httpx.AsyncClient(
+            http2=self.http2,
+            trust_env=False, # Igual que el cliente síncrono: evitar la configuración de proxies del entorno
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                                keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS),
+            timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+        )
+        # max_retries=0: los reintentos (con Retry-After y cortacircuitos) los decide quien llama
+        self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=self.http_client, max_retries=0)
+        self.loop.create_task(self._keep_warm())
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*asyncio.all_tasks(self.loop), return_exceptions=True))
+            self.loop.run_until_complete(self.http_client.aclose())
+            self.loop.close()
+
+    async def prewarm(self):
+        """Abre (o reutiliza) la conexión con el servidor sin gastar tokens: un HEAD a la URL base."""
+        start = time.perf_counter()
+        try:
+            response = await self.http_client.head(str(self.client.base_url))
+            self.prewarm_count += 1
+            # El primer precalentamiento interesa al arrancar; los siguientes (por inactividad) solo al depurar
+            logger.log(logging.INFO if self.prewarm_count == 1 else logging.DEBUG,
+                       "Conexión con la API precalentada en %.0f ms (%s).",
+                       (time.perf_counter() - start) * 1000, response.http_version)
+        except httpx.HTTPError as e:
+            logger.warning("No se pudo precalentar la conexión con la API: %s", e)
+        self.last_activity = time.monotonic()
+
+    async def _keep_warm(self):
+        """Calienta al iniciar y vuelve a hacerlo cada vez que la conexión lleva un rato ociosa."""
+        await self.prewarm()
+        while True:
+            await asyncio.sleep(self.prewarm_idle_seconds / 3)
+            if time.monotonic() - self.last_activity >= self.prewarm_idle_seconds:
+                await self.prewarm()
+
+    def submit(self, coroutine):
+        """Envía una corrutina al bucle del motor desde cualquier hilo. Devuelve un concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def _complete(self, messages, on_partial, **kwargs):
+        profiler_checkpoint() # El hilo del bucle vive toda la sesión: se suma al perfilado completo en curso
+        request_start = time.perf_counter()
+        self.last_activity = time.monotonic()
+        try:
+            if on_partial is None:
+                response = await self.client.chat.completions.create(messages=messages, **kwargs)
+                answer = response.choices[0].message.content.strip()
+                logger.info("Latencia total: %.0f ms.", (time.perf_counter() - request_start) * 1000)
+                return answer, response.usage
+
+            stream = await self.client.chat.completions.create(messages=messages, stream=True,
+                                                               stream_options={"include_usage": True}, **kwargs)
+            parts = []
+            first_token_ms = None
+            usage = None
+            try:
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if first_token_ms is None and delta.strip():
+                        first_token_ms = (time.perf_counter() - request_start) * 1000
+                    parts.append(delta)
+                    on_partial("".join(parts).strip())
+            finally:
+                await stream.close() # Libera la conexión también si on_partial cancela la petición
+            total_ms = (time.perf_counter() - request_start) * 1000
+            first_token_text = f"{first_token_ms:.0f} ms" if first_token_ms is not None else "sin texto"
+            logger.info("Streaming: primer carácter visible en %s, latencia total %.0f ms.", first_token_text, total_ms)
+            return "".join(parts).strip(), usage
+        finally:
+            self.last_activity = time.monotonic()
+
+    def complete(self, messages, on_partial=None, **kwargs):
+        """
+        Ejecuta una chat completion en el bucle del motor y espera el resultado (bloqueante para el hilo que llama).
+        Con on_partial se usa streaming y se llama con el texto parcial desde el hilo del motor.
+        Devuelve (respuesta, uso_de_tokens); el uso puede ser None si la API no lo informa.
+        """
+        return self.submit(self._complete(messages, on_partial, **kwargs)).result()
+
+    def stop(self):
+        """Detiene el bucle de eventos (el cliente HTTP se cierra al salir del bucle)."""
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
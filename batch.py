@@ -0,0 +1,248 @@
+"""
+Modo por lotes sin interfaz: responde un archivo JSONL de preguntas con varias peticiones en paralelo
+y escribe las respuestas (con sus tiempos) en otro JSONL. No importa tkinter, pystray, pynput ni mss,
+así que funciona en un servidor sin pantalla.
+
+Cada línea de entrada es un objeto JSON con la pregunta ("question", "pregunta", "text", "texto" o "body")
+y, opcionalmente, un identificador ("id" o "request_id") y una imagen ("image", "imagen" o "image_path";
+las rutas relativas se resuelven respecto al archivo de entrada). Una línea que sea solo un string JSON
+se toma como la pregunta. En la salida, "confirmed" es false cuando la API no estaba disponible y la
+respuesta es la mejor alternativa local sin confirmar; --reanudar vuelve a preguntar esas.
+
+Uso: python batch.py preguntas.jsonl --salida respuestas.jsonl --concurrencia 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PIL import Image
+import assistant_core as core
+from resilience import ApiError
+from tracing import Tracer, configure_logging
+import profiler
+
+logger = logging.getLogger("asistente.lotes")
+
+# --- Configuración ---
+BATCH_CONCURRENCY = 8 # Preguntas en vuelo a la vez
+QUESTION_FIELDS = ("question", "pregunta", "text", "texto", "body")
+ID_FIELDS = ("id", "request_id")
+IMAGE_FIELDS = ("image", "imagen", "image_path")
+IMAGE_QUESTION = "Responde la pregunta que aparece en la imagen." # Si la línea trae imagen sin pregunta
+
+
+def first_field(record, fields):
+    for field in fields:
+        value = record.get(field)
+        if value not in (None, ""):
+            return value
+    return None
+
+def read_questions(path):
+    """Lee el JSONL de entrada. Devuelve [{"index", "id", "question", "image"}]; las líneas inválidas se omiten con aviso."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                logger.warning("Línea %d ignorada: JSON inválido (%s).", line_number, e)
+                continue
+            if isinstance(record, str):
+                record = {"question": record}
+            if not isinstance(record, dict):
+                logger.warning("Línea %d ignorada: se esperaba un objeto o un string.", line_number)
+                continue
+            question = first_field(record, QUESTION_FIELDS)
+            image = first_field(record, IMAGE_FIELDS)
+            if image:
+                image = os.path.join(base_dir, image) if not os.path.isabs(image) else image
+            if not question and not image:
+                logger.warning("Línea %d ignorada: no tiene pregunta ni imagen.", line_number)
+                continue
+            item_id = first_field(record, ID_FIELDS)
+            items.append({"index": len(items), "id": item_id if item_id is not None else line_number,
+                          "question": question or IMAGE_QUESTION, "image": image})
+    return items
+
+def read_answered_ids(path):
+    """Identificadores ya respondidos sin error (y confirmados) en un archivo de salida anterior (para --reanudar)."""
+    answered = set()
+    if not os.path.isfile(path):
+        return answered
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and not record.get("error") and record.get("confirmed", True):
+                answered.add(str(record.get("id")))
+    return answered
+
+def answer_item(item, context, tracer):
+    """Responde una pregunta del lote con la misma lógica que la app. Devuelve el registro de salida."""
+    trace = tracer.start_trace("lote", id=item["id"])
+    timings = {}
+    answer = None
+    confirmed = True
+    error = None
+    start = time.perf_counter()
+    with trace.activate():
+        try:
+            if item["image"]:
+                with trace.span("imagen") as image_span:
+                    with Image.open(item["image"]) as image:
+                        image_pil = image.convert("RGB")
+                    image_span.set(size=f"{image_pil.width}x{image_pil.height}")
+                image_b64, image_mime = core.encode_image_to_base64(image_pil)
+                answer = core.get_routed_answer(item["question"], context, image_base64=image_b64, image_mime=image_mime)
+            else:
+                answer, confirmed = core.get_answer_with_cache(item["question"], context)
+        except ApiError as e:
+            error = f"{e.kind}: {e}"
+        except Exception as e:
+            logger.exception("Error al responder la pregunta %s: %s", item["id"], e)
+            error = f"{type(e).__name__}: {e}"
+    latency_ms = (time.perf_counter() - start) * 1000
+    for name, ms in trace.spans:
+        timings[name] = round(timings.get(name, 0.0) + ms, 1)
+    trace.finish(error=bool(error))
+    return {"index": item["index"], "id": item["id"], "question": item["question"], "image": item["image"],
+            "answer": answer, "confirmed": confirmed, "error": error, "latency_ms": round(latency_ms, 1), "timing_ms": timings}
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def run_batch(items, context, output_path, concurrency, append=False):
+    """
+    Responde las preguntas con hasta `concurrency` peticiones en paralelo. Cada resultado se escribe
+    en cuanto está listo (en orden de llegada; el campo "index" da el orden de entrada).
+    Devuelve la lista de registros de salida.
+    """
+    tracer = Tracer() # Solo en memoria: los tiempos por etapa van en cada línea de salida
+    results = []
+    write_lock = threading.Lock()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "a" if append else "w", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="lote") as executor:
+        futures = [executor.submit(answer_item, item, context, tracer) for item in items]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            with write_lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+            results.append(result)
+            logger.info("[%d/%d] %s -> %s (%.0f ms)", done, len(items), result["id"],
+                        result["answer"] if result["error"] is None else result["error"], result["latency_ms"])
+    return results
+
+def print_summary(results, elapsed_s, concurrency):
+    latencies = [r["latency_ms"] for r in results]
+    errors = sum(1 for r in results if r["error"])
+    unconfirmed = sum(1 for r in results if not r["confirmed"])
+    throughput = len(results) / elapsed_s if elapsed_s > 0 else 0.0
+    print(f"{len(results)} preguntas en {elapsed_s:.1f} s con concurrencia {concurrency} "
+          f"({throughput:.2f} preguntas/s), {errors} con error, {unconfirmed} sin confirmar (respuesta local sin la API).")
+    if latencies:
+        print(f"Latencia por pregunta: p50 {percentile(latencies, 0.50):.0f} ms, p95 {percentile(latencies, 0.95):.0f} ms, "
+              f"máx {max(latencies):.0f} ms.")
+    if core.answer_cache is not None:
+        print(f"Caché de respuestas: {core.answer_cache.stats_text()}")
+    print(core.token_accounting.stats_text())
+    print(core.resilient_caller.stats_text())
+    print(core.model_stats.stats_text())
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support() # Necesario en Windows si se empaqueta como ejecutable
+    parser = argparse.ArgumentParser(description="Responde un archivo JSONL de preguntas sin interfaz gráfica.")
+    parser.add_argument("entrada", help="Archivo JSONL con una pregunta por línea.")
+    parser.add_argument("--salida", help="Archivo JSONL de respuestas (por defecto <entrada>.respuestas.jsonl).")
+    parser.add_argument("--concurrencia", type=int, default=BATCH_CONCURRENCY, help="Preguntas en vuelo a la vez.")
+    parser.add_argument("--reanudar", action="store_true",
+                        help="Añade a la salida existente y omite las preguntas que ya tienen respuesta sin error.")
+    parser.add_argument("--pdfs", default=core.PDF_DIRECTORY, help="Directorio del material de estudio.")
+    parser.add_argument("--sin-cache", action="store_true",
+                        help="Extrae el texto de los PDFs sin leer ni escribir la caché.")
+    parser.add_argument("--sin-cache-respuestas", action="store_true",
+                        help="Pregunta siempre a la API, sin leer ni guardar la caché de respuestas.")
+    parser.add_argument("--workers", type=int, default=core.EXTRACTION_WORKERS,
+                        help="Procesos para extraer los PDFs (0 = uno por núcleo, 1 = secuencial).")
+    parser.add_argument("--motor-sincrono", action="store_true",
+                        help="Usa el cliente síncrono original en lugar del motor asíncrono HTTP/2.")
+    parser.add_argument("--contexto-completo", action="store_true",
+                        help="Envía el material completo en cada pregunta en lugar de los pasajes recuperados.")
+    parser.add_argument("--sin-limpieza", action="store_true",
+                        help="Usa el texto de los PDFs tal como se extrae (sin quitar plantillas ni párrafos repetidos).")
+    parser.add_argument("--modelo-rapido", default=core.FAST_MODEL, help="Modelo para las preguntas sencillas.")
+    parser.add_argument("--modelo-fuerte", default=core.OPENAI_MODEL, help="Modelo para las preguntas complejas.")
+    parser.add_argument("--sin-enrutado", action="store_true", help="Envía todas las preguntas al modelo fuerte.")
+    parser.add_argument("--sin-respuestas-locales", action="store_true",
+                        help="Envía todas las preguntas a la API, sin intentar responder las de opción múltiple con el material.")
+    parser.add_argument("--rpm", type=int, default=core.RATE_LIMIT_RPM,
+                        help="Peticiones por minuto permitidas a la cuenta (0 = sin límite local).")
+    parser.add_argument("--tpm", type=int, default=core.RATE_LIMIT_TPM,
+                        help="Tokens por minuto permitidos a la cuenta (0 = sin límite local).")
+    parser.add_argument("--perfilar", choices=profiler.MODES,
+                        help="Perfila el lote (sin la carga del material) y deja los archivos en 'perfiles'.")
+    parser.add_argument("--log-nivel", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO",
+                        help="Nivel mínimo de los mensajes de registro.")
+    args = parser.parse_args()
+    configure_logging(args.log_nivel)
+
+    output_path = args.salida or os.path.splitext(args.entrada)[0] + ".respuestas.jsonl"
+    items = read_questions(args.entrada)
+    if args.reanudar:
+        answered = read_answered_ids(output_path)
+        items = [item for item in items if str(item["id"]) not in answered]
+        logger.info("Reanudando: %d preguntas ya respondidas en %s.", len(answered), output_path)
+    if not items:
+        logger.info("No hay preguntas que responder.")
+        sys.exit(0)
+
+    core.STREAMING_ENABLED = False # Sin etiqueta que actualizar: la respuesta completa basta
+    if args.contexto_completo:
+        core.USE_RETRIEVAL = False
+    if args.sin_limpieza:
+        core.USE_CORPUS_CLEANING = False
+    if args.motor_sincrono:
+        core.USE_ASYNC_ENGINE = False
+    if args.sin_respuestas_locales:
+        core.USE_LOCAL_ANSWERER = False
+    core.FAST_MODEL = args.modelo_rapido
+    core.OPENAI_MODEL = args.modelo_fuerte
+    core.USE_MODEL_ROUTER = not args.sin_enrutado
+    core.configure_rate_limits(args.rpm, args.tpm, wait_for_quota=True) # En un lote, mejor esperar cupo que fallar
+    if not args.sin_cache_respuestas:
+        core.open_answer_cache()
+    pdf_text_context = core.prepare_corpus(args.pdfs, use_cache=not args.sin_cache, workers=args.workers)
+    core.start_async_engine()
+
+    logger.info("Respondiendo %d preguntas con concurrencia %d -> %s", len(items), args.concurrencia, output_path)
+    if args.perfilar:
+        profiler.start_session(args.perfilar)
+    batch_start = time.perf_counter()
+    try:
+        results = run_batch(items, pdf_text_context, output_path, args.concurrencia, append=args.reanudar)
+    finally:
+        core.stop_async_engine()
+        if args.perfilar:
+            paths = profiler.stop_session()
+            logger.info("Perfil guardado: %s", ", ".join(os.path.abspath(path) for path in paths.values()))
+    print_summary(results, time.perf_counter() - batch_start, args.concurrencia)
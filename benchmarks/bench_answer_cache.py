@@ -0,0 +1,109 @@
+"""
+Comprobación de la caché de respuestas de texto (answer_cache) con la caché llena:
+- coste de la búsqueda exacta y de la de casi-duplicados (la que recorre todas las entradas),
+- aciertos cuando se vuelve a copiar la misma pregunta (otro formato, alternativas en otro orden, con la
+  letra de la respuesta reescrita), y un casi-duplicado de una pregunta sin alternativas,
+- y que no acierte cuando cambia el enunciado o una alternativa, que sería una respuesta equivocada
+  copiada sin llamar a la API ("la primera etapa" / "la última etapa" con las mismas opciones).
+Termina con error si algún caso no se comporta como se espera.
+
+    python benchmarks/bench_answer_cache.py
+    python benchmarks/bench_answer_cache.py --entradas 500 --repeticiones 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from answer_cache import AnswerCache
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+STEM = ("Según la norma ISO/IEC 27005, en el proceso de gestión de riesgos de seguridad de la información que una "
+        "organización implementa para proteger sus activos, ¿cuál de las siguientes actividades es la primera etapa?")
+OPTIONS = ["a) Identificar los activos de información de la organización",
+           "b) Evaluar la probabilidad y el impacto de cada amenaza identificada",
+           "c) Seleccionar e implementar los controles para tratar los riesgos",
+           "d) Monitorear y revisar periódicamente los riesgos residuales"]
+ANSWER = OPTIONS[0]
+OPEN_QUESTION = ("Explique brevemente en qué consiste la transferencia del riesgo como estrategia de tratamiento "
+                 "dentro de la gestión de riesgos de seguridad de la información")
+
+
+def question(stem=STEM, options=OPTIONS):
+    return "\n".join([stem] + list(options))
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else float("nan")
+
+def cases():
+    """(nombre, pregunta, respuesta esperada o None si no debe acertar)."""
+    reordered = [OPTIONS[2], OPTIONS[0], OPTIONS[3], OPTIONS[1]]
+    reordered = [f"{letter}) {text.split(') ', 1)[1]}" for letter, text in zip("abcd", reordered)]
+    return [
+        ("igual", question(), ANSWER),
+        ("otro formato", question(STEM.upper().replace("¿", "").replace(",", "")), ANSWER),
+        ("otro orden", question(options=reordered), "b) Identificar los activos de información de la organización"),
+        ("sin alternativas, casi igual", OPEN_QUESTION + " actual", "transferencia"),
+        ("última en vez de primera", question(STEM.replace("primera", "última")), None),
+        ("enunciado corto cambiado", question("¿Cuál de las siguientes actividades es la última etapa?"), None),
+        ("otra alternativa", question(options=OPTIONS[:3] + ["d) Aceptar todos los riesgos identificados"]), None),
+        ("sin alternativas, otra pregunta", "Explique en qué consiste la aceptación del riesgo", None),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coste y aciertos de la caché de respuestas de texto.")
+    parser.add_argument("--entradas", type=int, default=500, help="Preguntas distintas en la caché durante la búsqueda.")
+    parser.add_argument("--repeticiones", type=int, default=100, help="Veces que se mide cada búsqueda.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/results/cache-<fecha>.json).")
+    args = parser.parse_args()
+
+    cache = AnswerCache(None, max_entries=args.entradas + 2)
+    for i in range(args.entradas): # Relleno: preguntas distintas con y sin alternativas
+        filler = f"Pregunta de relleno número {i} sobre el control {i * 7} de la gestión de riesgos"
+        cache.put(question(filler) if i % 2 else filler, f"relleno {i}")
+    cache.put(question(), ANSWER)
+    cache.put(OPEN_QUESTION, "transferencia")
+
+    timings = {}
+    for name, text in (("exacta", question()), ("casi-duplicados", OPEN_QUESTION + " nueva")):
+        elapsed = []
+        for _ in range(args.repeticiones):
+            start = time.perf_counter()
+            cache.get(text)
+            elapsed.append((time.perf_counter() - start) * 1000)
+        timings[name] = percentile(elapsed, 0.5)
+
+    rows = []
+    for name, text, expected in cases():
+        answer = cache.get(text)
+        rows.append({"caso": name, "esperada": expected, "respuesta": answer, "ok": answer == expected})
+
+    print(f"Búsqueda con {args.entradas} entradas: exacta p50 {timings['exacta']:.3f} ms, "
+          f"casi-duplicados p50 {timings['casi-duplicados']:.3f} ms")
+    failed = 0
+    for row in rows:
+        failed += not row["ok"]
+        print(f"  {'ok' if row['ok'] else 'MAL':<4}{row['caso']:<34}{row['respuesta'] or 'no acierta'}")
+
+    output = args.salida or os.path.join(RESULTS_DIR, f"cache-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "entradas": args.entradas,
+                   "busqueda_p50_ms": timings, "casos": rows, "estadisticas": cache.stats_text()},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\n{'Todos los casos se comportan como se espera' if not failed else f'{failed} casos fallan'}.")
+    print(f"Resultados guardados en {output}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
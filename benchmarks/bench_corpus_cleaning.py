@@ -0,0 +1,171 @@
+"""
+Benchmark de la limpieza del material (corpus_cleaning) con los PDFs del curso:
+- informe por PDF: caracteres y tokens antes y después, líneas de plantilla quitadas, párrafos
+  duplicados y páginas que quedan vacías;
+- que la calidad de las respuestas se mantiene con las preguntas etiquetadas (labeled_questions.json),
+  comparando el material tal como se extrae con el limpio: aciertos del respondedor local (sin umbrales
+  y con los umbrales actuales) y preguntas cuya alternativa correcta aparece entera en los pasajes que
+  se enviarían a la API. Termina con error si el material limpio acierta menos (más allá de --tolerancia);
+- casos fijos de la corrección de artefactos y de los números de página (letras sueltas que no deben
+  unirse, números en medio de la página que son contenido). Termina con error si alguno cambia.
+
+    python benchmarks/bench_corpus_cleaning.py
+    python benchmarks/bench_corpus_cleaning.py --detalle --tolerancia 1
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import assistant_core as core
+import local_answerer
+from answer_cache import split_options
+from corpus_cleaning import clean_documents, normalize_page
+from corpus_store import PAGE_SEPARATOR
+from local_answerer import answer_locally
+from prompt_builder import TokenCounter
+from retrieval import RetrievalIndex, tokenize
+
+LABELED_QUESTIONS_PATH = os.path.join(BENCH_DIR, "labeled_questions.json")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+# (texto extraído, texto esperado tras normalize_page)
+NORMALIZATION_CASES = [
+    ("La variable C es un entero", "La variable C es un entero"),
+    ("El punto P un vértice del triángulo", "El punto P un vértice del triángulo"),
+    ("Si X tiene varianza 1", "Si X tiene varianza 1"),
+    ("Information T echnology", "Information Technology"),
+    ("Gestión de T ecnologías de la información", "Gestión de Tecnologías de la información"),
+    ("T ools: herramientas y tools", "Tools: herramientas y tools"),
+    ("seguri-\ndad de la información", "seguridad de la información"),
+]
+# (páginas de un PDF, páginas esperadas tras clean_documents)
+PAGE_NUMBER_CASES = [
+    (["Pregunta de repaso\n¿En qué año entra en vigor la norma?\n2024\n2025\nFin del enunciado\nUltima línea\n1"],
+     ["Pregunta de repaso\n¿En qué año entra en vigor la norma?\n2024\n2025\nFin del enunciado\nUltima línea"]),
+    (["Portada", "Título de la sección\nPrimer párrafo\nSegundo párrafo\n2\nTercer párrafo\nCuarto párrafo"],
+     ["Portada", "Título de la sección\nPrimer párrafo\nSegundo párrafo\nTercer párrafo\nCuarto párrafo"]),
+    (["Página 1 de 3\nContenido de la página"], ["Contenido de la página"]),
+]
+
+
+def evidence_found(context, option_text):
+    """True si todos los términos de la alternativa aparecen en el contexto recuperado."""
+    terms = set(tokenize(option_text))
+    return bool(terms) and terms <= set(tokenize(context))
+
+def check_fixed_cases():
+    """Casos fijos de normalize_page y de los números de página: lista de los que no dan lo esperado."""
+    problems = []
+    for text, expected in NORMALIZATION_CASES:
+        result = normalize_page(text)
+        if result != expected:
+            problems.append(f"normalize_page({text!r}) = {result!r}, se esperaba {expected!r}")
+    for pages, expected in PAGE_NUMBER_CASES:
+        cleaned, _report = clean_documents([{"filename": "caso.pdf", "pages": pages, "key": None}])
+        if cleaned[0]["pages"] != expected:
+            problems.append(f"clean_documents({pages!r}) = {cleaned[0]['pages']!r}, se esperaba {expected!r}")
+    return problems
+
+def evaluate(documents, questions, labels, count_tokens):
+    """Respuestas locales y pasajes recuperados para cada pregunta con un material dado."""
+    index = RetrievalIndex.from_documents(documents)
+    index.attach_token_counts(count_tokens)
+    rows = []
+    for question, label in zip(questions, labels):
+        result = answer_locally(question, index, min_score=0.0, min_margin=0.0)
+        _stem, options = split_options(question)
+        correct_text = dict(options).get(label, "")
+        context = index.build_context(question, top_k=core.RETRIEVAL_TOP_K, max_chars=core.RETRIEVAL_MAX_CHARS)
+        rows.append({"elegida": result.letter if result else None,
+                     "acierta": result is not None and result.letter == label,
+                     "confiable": result is not None and result.score >= core.LOCAL_ANSWER_MIN_SCORE
+                                  and result.margin >= core.LOCAL_ANSWER_MIN_MARGIN,
+                     "evidencia": evidence_found(context, correct_text),
+                     "tokens_contexto": count_tokens(context)})
+    full_text = PAGE_SEPARATOR.join(page for doc in documents for page in doc["pages"] if page)
+    return {"pasajes": len(index.chunks), "tokens_material": count_tokens(full_text),
+            "aciertos": sum(row["acierta"] for row in rows),
+            "confiables": sum(row["confiable"] for row in rows),
+            "aciertos_confiables": sum(row["confiable"] and row["acierta"] for row in rows),
+            "con_evidencia": sum(row["evidencia"] for row in rows),
+            "tokens_contexto_medios": sum(row["tokens_contexto"] for row in rows) / len(rows), "filas": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reducción del material y calidad de las respuestas con la limpieza.")
+    parser.add_argument("--pdfs", default=os.path.join(REPO_DIR, "pdfs"), help="Directorio del material de estudio.")
+    parser.add_argument("--preguntas", default=LABELED_QUESTIONS_PATH, help="JSON con preguntas etiquetadas.")
+    parser.add_argument("--tolerancia", type=int, default=0,
+                        help="Aciertos (o preguntas con evidencia) que el material limpio puede perder sin fallar.")
+    parser.add_argument("--detalle", action="store_true", help="Muestra las preguntas en las que cambia el resultado.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/results/limpieza-<fecha>.json).")
+    args = parser.parse_args()
+    if not local_answerer.local_answering_available():
+        sys.exit("El respondedor local requiere NumPy (pip install numpy).")
+
+    with open(args.preguntas, encoding="utf-8") as f:
+        labeled = json.load(f)
+    questions = [item["pregunta"] for item in labeled]
+    labels = [item["respuesta"].strip().lower() for item in labeled]
+    documents = core.load_pdf_documents(args.pdfs, workers=1)
+    if not documents:
+        sys.exit(f"No hay PDFs en {args.pdfs}.")
+    token_counter = TokenCounter(core.OPENAI_MODEL)
+    count_tokens = token_counter.count
+
+    start = time.perf_counter()
+    cleaned, report = clean_documents(documents)
+    cleaning_ms = (time.perf_counter() - start) * 1000
+    _cleaned, report = clean_documents(documents, count_tokens=count_tokens) # El mismo resultado, con los tokens
+    print(f"Limpieza en {cleaning_ms:.0f} ms (tokens {'exactos' if token_counter.exact else 'estimados'}):")
+    for line in report.table_lines():
+        print(f"  {line}")
+
+    raw = evaluate(documents, questions, labels, count_tokens)
+    clean = evaluate(cleaned, questions, labels, count_tokens)
+    total = len(questions)
+    print(f"\n{total} preguntas etiquetadas{'':<4}{'extraído':>12}{'limpio':>12}")
+    for name, field in (("Pasajes del índice", "pasajes"), ("Tokens del material", "tokens_material"),
+                        ("Aciertos sin umbrales", "aciertos"), ("Respondidas sin la API", "confiables"),
+                        ("  de ellas, aciertos", "aciertos_confiables"), ("Con la alternativa en los pasajes", "con_evidencia")):
+        print(f"{name:<36}{raw[field]:>12}{clean[field]:>12}")
+    print(f"{'Tokens de pasajes por pregunta':<36}{raw['tokens_contexto_medios']:>12.0f}{clean['tokens_contexto_medios']:>12.0f}")
+
+    if args.detalle:
+        for question, label, before, after in zip(questions, labels, raw["filas"], clean["filas"]):
+            if (before["acierta"], before["evidencia"]) != (after["acierta"], after["evidencia"]):
+                print(f"  [{label}] extraído {before['elegida']}{'+' if before['evidencia'] else '-'} "
+                      f"limpio {after['elegida']}{'+' if after['evidencia'] else '-'}  {question.splitlines()[0][:70]}")
+
+    wrong_without_api = lambda result: result["confiables"] - result["aciertos_confiables"]
+    holds = (clean["aciertos"] >= raw["aciertos"] - args.tolerancia
+             and clean["con_evidencia"] >= raw["con_evidencia"] - args.tolerancia
+             and wrong_without_api(clean) <= wrong_without_api(raw))
+    print(f"\nCalidad {'se mantiene' if holds else 'EMPEORA'} con el material limpio "
+          f"(tolerancia {args.tolerancia}; los fallos entre las respondidas sin la API no pueden aumentar).")
+    case_problems = check_fixed_cases()
+    print(f"Casos fijos: {len(NORMALIZATION_CASES) + len(PAGE_NUMBER_CASES) - len(case_problems)} de "
+          f"{len(NORMALIZATION_CASES) + len(PAGE_NUMBER_CASES)} correctos.")
+    for problem in case_problems:
+        print(f"  MAL {problem}")
+
+    output = args.salida or os.path.join(RESULTS_DIR, f"limpieza-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "preguntas": total, "limpieza_ms": cleaning_ms,
+                   "informe": report.rows + [report.totals()], "extraido": raw, "limpio": clean, "se_mantiene": holds,
+                   "casos_fijos_fallidos": case_problems},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {output}")
+    if not holds or case_problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
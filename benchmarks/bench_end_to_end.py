@@ -0,0 +1,289 @@
+"""
+Benchmark de extremo a extremo: reproduce preguntas grabadas (benchmarks/questions.json) y capturas de ejemplo
+a través de get_openai_answer y process_selected_area contra el servidor local (mock_openai_server.py).
+
+Mide por etapa (p50/p95/p99): extracción de PDFs, armado del prompt, codificación de la imagen,
+petición a la API y actualización de la interfaz. Los resultados se guardan en JSON para comparar
+ejecuciones y detectar regresiones.
+
+    python benchmarks/bench_end_to_end.py
+    python benchmarks/bench_end_to_end.py --latencia 0.3 --retardo-token 0.02 --repeticiones 3
+    python benchmarks/bench_end_to_end.py --comparar benchmarks/results/anterior.json
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import platform
+import threading
+import subprocess
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from mock_openai_server import MockOpenAIServer
+from sample_screenshots import load_sample_screenshots
+
+QUESTIONS_PATH = os.path.join(BENCH_DIR, "questions.json")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+STAGES = ["extraccion", "prompt", "codificacion", "peticion", "interfaz", "total_texto", "total_area"]
+AREA_TIMEOUT_SECONDS = 60
+REGRESSION_THRESHOLD = 0.10 # Un p50/p95 un 10% peor que la ejecución comparada se marca como regresión
+
+
+def percentile(values, fraction):
+    """Percentil con interpolación lineal entre los dos valores más cercanos."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(samples):
+    """{etapa: [ms]} -> {etapa: {n, p50, p95, p99, max}}."""
+    summary = {}
+    for stage in STAGES:
+        values = samples.get(stage) or []
+        if not values:
+            continue
+        summary[stage] = {"n": len(values), "p50": percentile(values, 0.50), "p95": percentile(values, 0.95),
+                          "p99": percentile(values, 0.99), "max": max(values)}
+    return summary
+
+
+class StageTimer:
+    """Acumula duraciones por etapa; las funciones de main se envuelven para medirlas en su sitio."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.local = threading.local() # Tiempo de armado del prompt de la petición en curso (por hilo)
+
+    def add(self, stage, elapsed_ms):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(elapsed_ms)
+
+    def wrap(self, module, name, stage):
+        original = getattr(module, name)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self.add(stage, elapsed_ms)
+                if stage == "prompt":
+                    self.local.prompt_ms = getattr(self.local, "prompt_ms", 0.0) + elapsed_ms
+        setattr(module, name, timed)
+
+    def wrap_request(self, module, name):
+        """La etapa 'peticion' es get_openai_answer sin el armado del prompt (que se mide aparte)."""
+        original = getattr(module, name)
+        def timed(*args, **kwargs):
+            self.local.prompt_ms = 0.0
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add("peticion", (time.perf_counter() - start) * 1000 - self.local.prompt_ms)
+        setattr(module, name, timed)
+
+
+class BenchWindow:
+    """
+    Sustituto de la ventana de Tkinter: ejecuta las llamadas de after() en su propio hilo, como el bucle
+    de Tk, y mide cuánto tarda cada actualización de la etiqueta desde que se encola hasta que se aplica.
+    """
+
+    def __init__(self):
+        self.calls = queue.Queue()
+        self.label_text = ""
+        self.final_shown = threading.Event()
+        self.current_queued_at = 0.0
+        self.final_update_ms = 0.0 # De encolar a aplicar la actualización que muestra la respuesta final
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            self.current_queued_at, fn, args = self.calls.get()
+            if fn is None:
+                return
+            fn(*args)
+
+    def after(self, _delay_ms, fn, *args):
+        self.calls.put((time.perf_counter(), fn, args))
+
+    def update_label(self, text):
+        self.label_text = text
+
+    def mark_final(self):
+        """Se llama desde el hilo de la ventana cuando la respuesta final ya está en la etiqueta."""
+        self.final_update_ms = (time.perf_counter() - self.current_queued_at) * 1000
+        self.final_shown.set()
+
+    def winfo_exists(self):
+        return True
+
+    def stop(self):
+        self.calls.put((0, None, ()))
+
+
+def load_questions(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def print_summary(summary, previous=None):
+    print(f"\n{'etapa':<14}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'máx ms':>10}   comparación")
+    regressions = []
+    for stage, stats in summary.items():
+        note = ""
+        old = (previous or {}).get(stage)
+        if old:
+            deltas = []
+            for key in ("p50", "p95"):
+                if old[key]:
+                    change = (stats[key] - old[key]) / old[key]
+                    deltas.append(f"{key} {change * 100:+.0f}%")
+                    if change > REGRESSION_THRESHOLD and stats[key] - old[key] > 1.0:
+                        regressions.append(f"{stage} {key}")
+            note = ", ".join(deltas)
+        print(f"{stage:<14}{stats['n']:>5}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}"
+              f"{stats['max']:>10.1f}   {note}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latencia de extremo a extremo con el servidor local.")
+    parser.add_argument("--latencia", type=float, default=0.2, help="Segundos hasta el primer byte del servidor local.")
+    parser.add_argument("--retardo-token", type=float, default=0.01, help="Segundos entre fragmentos en streaming.")
+    parser.add_argument("--sin-streaming", action="store_true", help="Pide las respuestas completas, sin streaming.")
+    parser.add_argument("--motor-sincrono", action="store_true", help="Usa el cliente síncrono en lugar del motor asíncrono.")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Veces que se reproduce el corpus completo.")
+    parser.add_argument("--preguntas", default=QUESTIONS_PATH, help="JSON con la lista de preguntas grabadas.")
+    parser.add_argument("--pdfs", default=os.path.join(REPO_DIR, "pdfs"), help="Directorio del material de estudio.")
+    parser.add_argument("--sin-cache", action="store_true", help="Mide la extracción sin la caché de PDFs.")
+    parser.add_argument("--ocr", action="store_true", help="Permite el camino de OCR local en las capturas.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/results/e2e-<fecha>.json).")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior para comparar percentiles.")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(latency=args.latencia, token_delay=args.retardo_token).start()
+    # assistant_core crea el cliente al importarse: debe apuntar al servidor local antes del import
+    os.environ["OPENAI_API_KEY"] = "local"
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    import main as app
+    import assistant_core as core
+    from retrieval import RetrievalIndex
+    from prompt_builder import TokenCounter
+    from async_engine import AsyncOpenAIEngine
+
+    timer = StageTimer()
+    timer.wrap(core, "build_prompt_messages", "prompt")
+    timer.wrap(app, "encode_image_to_base64", "codificacion")
+    # main importa get_openai_answer por nombre (camino de imagen); el camino OCR pasa por assistant_core
+    timer.wrap_request(app, "get_openai_answer")
+    timer.wrap_request(core, "get_openai_answer")
+    core.STREAMING_ENABLED = not args.sin_streaming
+    core.configure_rate_limits(0, 0) # El servidor local no tiene límites de cuenta: medir sin el limitador
+    app.USE_OCR = args.ocr
+    app.pyperclip.copy = lambda _text: None # No pisar el portapapeles de quien ejecuta el benchmark
+    window = BenchWindow()
+    # El último paso de process_selected_area: marca que la respuesta ya está en pantalla
+    app.force_window_to_bottom_right_corner = lambda _window: window.mark_final()
+
+    questions = load_questions(args.preguntas)
+    screenshots = load_sample_screenshots()
+    print(f"{len(questions)} preguntas, {len(screenshots)} capturas, {args.repeticiones} repeticiones; "
+          f"servidor local con {args.latencia * 1000:.0f} ms de latencia, "
+          f"{'sin streaming' if args.sin_streaming else f'streaming ({args.retardo_token * 1000:.0f} ms/fragmento)'}, "
+          f"{'cliente síncrono' if args.motor_sincrono else 'motor asíncrono'}.")
+
+    for _ in range(args.repeticiones):
+        start = time.perf_counter()
+        documents = core.load_pdf_documents(args.pdfs, use_cache=not args.sin_cache)
+        timer.add("extraccion", (time.perf_counter() - start) * 1000)
+    context = core.join_documents_text(documents)
+    core.corpus_text = context # Las selecciones de área leen el material del núcleo (ver main.context_for_request)
+    core.corpus_ready.set()
+    core.token_counter = TokenCounter(core.OPENAI_MODEL)
+    if documents:
+        core.global_retrieval_index = RetrievalIndex.from_documents(documents)
+        core.global_retrieval_index.attach_token_counts(core.token_counter.count)
+    if not args.motor_sincrono:
+        core.async_engine = AsyncOpenAIEngine("local", base_url=server.base_url).start()
+
+    try:
+        for _ in range(args.repeticiones):
+            for question in questions:
+                start = time.perf_counter()
+                def show_partial(partial_text):
+                    window.after(0, window.update_label, core.format_display_text(partial_text))
+                window.final_shown.clear()
+                answer = app.get_openai_answer(question, context, on_partial=show_partial)
+                def show_final(text=core.format_display_text(answer)):
+                    window.update_label(text)
+                    window.mark_final()
+                window.after(0, show_final)
+                window.final_shown.wait()
+                timer.add("interfaz", window.final_update_ms)
+                timer.add("total_texto", (time.perf_counter() - start) * 1000)
+
+            for name, image in screenshots:
+                app.take_screenshot_region = lambda _region, image=image: image.copy()
+                window.final_shown.clear()
+                start = time.perf_counter()
+                app.process_selected_area({"top": 0, "left": 0, "width": image.width, "height": image.height}, window)
+                if not window.final_shown.wait(AREA_TIMEOUT_SECONDS):
+                    print(f"Aviso: la captura {name} no terminó en {AREA_TIMEOUT_SECONDS} s.")
+                    continue
+                timer.add("total_area", (time.perf_counter() - start) * 1000)
+                timer.add("interfaz", window.final_update_ms)
+    finally:
+        core.stop_async_engine()
+        app.request_scheduler.shutdown()
+        window.stop()
+        server.stop()
+
+    summary = summarize(timer.samples)
+    previous = None
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            previous = json.load(f).get("summary")
+    regressions = print_summary(summary, previous)
+
+    output_path = args.salida or os.path.join(RESULTS_DIR, f"e2e-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "config": {"latency_s": args.latencia, "token_delay_s": args.retardo_token, "streaming": not args.sin_streaming,
+                   "async_engine": not args.motor_sincrono, "pdf_cache": not args.sin_cache, "ocr": args.ocr,
+                   "repetitions": args.repeticiones, "questions": len(questions), "screenshots": len(screenshots)},
+        "summary": summary,
+        "samples_ms": timer.samples,
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {output_path}")
+    if regressions:
+        print(f"Posibles regresiones (>{REGRESSION_THRESHOLD * 100:.0f}%): {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark de la caché de respuestas por imagen (image_cache) con capturas de ejemplo:
+- coste de la huella (recorte al contenido, dHash y máscara de tinta) y de la búsqueda con la caché llena,
+- aciertos cuando se vuelve a seleccionar la misma pregunta (igual, con otro margen, recomprimida en PNG),
+- y que no acierte cuando cambia el texto (una palabra, una alternativa, un número), que sería una
+  respuesta equivocada.
+
+    python benchmarks/bench_image_cache.py
+    python benchmarks/bench_image_cache.py --entradas 200 --repeticiones 20
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+from PIL import Image, ImageOps
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from image_cache import ImageAnswerCache, fingerprint
+from sample_screenshots import synthetic_screenshot
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+QUESTION = "¿Qué control del anexo 12 de la norma protege la información frente a la modificación no autorizada?"
+OPTIONS = ["a) Confidencialidad", "b) Integridad", "c) Disponibilidad", "d) No repudio"]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else float("nan")
+
+def png_roundtrip(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    buffer.seek(0)
+    return Image.open(buffer)
+
+def variants(size, font_size):
+    """(nombre, captura, debe acertar) respecto a la captura original de QUESTION."""
+    def shot(question=QUESTION, options=OPTIONS):
+        return synthetic_screenshot(question, options, size=size, font_size=font_size)
+    original = shot()
+    background = original.getpixel((0, 0))
+    wider = ImageOps.expand(original, border=30, fill=background).crop((8, 20, size[0] + 45, size[1] + 50))
+    return original, [
+        ("igual", shot(), True),
+        ("otro margen", wider, True),
+        ("png", png_roundtrip(original), True),
+        ("otra palabra", shot(QUESTION.replace("modificación", "divulgación")), False),
+        ("otro número", shot(QUESTION.replace("12", "13")), False),
+        ("otra alternativa", shot(options=OPTIONS[:3] + ["d) Autenticidad"]), False),
+        ("otra pregunta", shot("¿Cuál es el objetivo principal de un plan de continuidad del negocio?"), False),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coste y aciertos de la caché de respuestas por imagen.")
+    parser.add_argument("--entradas", type=int, default=200, help="Capturas distintas en la caché durante la búsqueda.")
+    parser.add_argument("--repeticiones", type=int, default=10, help="Veces que se mide cada operación.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/results/imagen-<fecha>.json).")
+    args = parser.parse_args()
+
+    results = {}
+    for size, font_size in (((2560, 1100), 34), ((1200, 500), 16)):
+        label = f"{size[0]}x{size[1]}"
+        original, cases = variants(size, font_size)
+        cache = ImageAnswerCache(None, max_entries=args.entradas + 1)
+        for i in range(args.entradas - 1): # Relleno: preguntas distintas con la misma maquetación
+            cache.put(fingerprint(synthetic_screenshot(f"Pregunta de relleno número {i} sobre gestión de riesgos",
+                                                       OPTIONS, size=size, font_size=font_size)), f"relleno {i}", 1000.0)
+        fingerprint_ms, lookup_ms = [], []
+        for _ in range(args.repeticiones):
+            start = time.perf_counter()
+            original_fingerprint = fingerprint(original)
+            fingerprint_ms.append((time.perf_counter() - start) * 1000)
+        cache.put(original_fingerprint, OPTIONS[1], 1000.0)
+        for _ in range(args.repeticiones):
+            start = time.perf_counter()
+            cache.get(original_fingerprint)
+            lookup_ms.append((time.perf_counter() - start) * 1000)
+
+        rows = []
+        for name, image, should_hit in cases:
+            hit = cache.get(fingerprint(image))
+            rows.append({"caso": name, "debe_acertar": should_hit, "acierta": hit is not None and hit[0] == OPTIONS[1]})
+        results[label] = {"huella_p50_ms": percentile(fingerprint_ms, 0.5), "busqueda_p50_ms": percentile(lookup_ms, 0.5),
+                          "casos": rows, "estadisticas": cache.stats_text()}
+
+    for label, row in results.items():
+        print(f"\n{label}: huella p50 {row['huella_p50_ms']:.1f} ms, búsqueda con {args.entradas} entradas "
+              f"p50 {row['busqueda_p50_ms']:.2f} ms")
+        for case in row["casos"]:
+            mark = "ok" if case["acierta"] == case["debe_acertar"] else "MAL"
+            print(f"  {mark:<4}{case['caso']:<18}{'acierta' if case['acierta'] else 'no acierta'}")
+
+    output = args.salida or os.path.join(RESULTS_DIR, f"imagen-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "entradas": args.entradas,
+                   "resultados": results}, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {output}")
+
+
+if __name__ == "__main__":
+    main()
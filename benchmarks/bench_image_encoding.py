@@ -0,0 +1,88 @@
+"""
+Compara configuraciones de codificación de capturas: tiempo de codificación, tamaño y latencia de respuesta.
+
+Por defecto la latencia se mide contra el servidor local (mock_openai_server.py), donde solo influye
+el tamaño de la subida; con --api-real se usa la API de OpenAI (OPENAI_API_KEY) y gpt-4o.
+
+    python benchmarks/bench_image_encoding.py
+    python benchmarks/bench_image_encoding.py --api-real --repeticiones 3
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from openai import OpenAI
+from image_pipeline import encode_image, format_report
+from mock_openai_server import MockOpenAIServer
+from sample_screenshots import load_sample_screenshots
+
+SETTINGS_TO_COMPARE = {
+    "png_original": {"format": "PNG", "max_long_edge": None, "grayscale": False, "autocontrast": False, "byte_budget": None},
+    "png_1600_gris": {"format": "PNG", "max_long_edge": 1600, "grayscale": True, "autocontrast": True, "byte_budget": None},
+    "jpeg_1600_q85": {"format": "JPEG", "max_long_edge": 1600, "grayscale": False, "autocontrast": False, "byte_budget": None},
+    "jpeg_1600_gris_250k": {"format": "JPEG", "max_long_edge": 1600, "grayscale": True, "autocontrast": True, "byte_budget": 250_000},
+    "webp_1600_gris_150k": {"format": "WEBP", "max_long_edge": 1600, "grayscale": True, "autocontrast": True, "byte_budget": 150_000},
+    "jpeg_1024_gris_100k": {"format": "JPEG", "max_long_edge": 1024, "grayscale": True, "autocontrast": True, "byte_budget": 100_000},
+}
+QUESTION = "Esta imagen contiene una pregunta. Responde solo con la letra y el texto de la alternativa correcta."
+
+
+def ask_with_image(client, image_base64, mime_type, model):
+    start = time.perf_counter()
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": [
+            {"type": "text", "text": QUESTION},
+            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_base64}"}},
+        ]}],
+        temperature=0.0,
+        max_tokens=50,
+    )
+    return (time.perf_counter() - start) * 1000, response.choices[0].message.content.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de codificación de capturas de área.")
+    parser.add_argument("--api-real", action="store_true", help="Medir la latencia contra la API de OpenAI.")
+    parser.add_argument("--modelo", default="gpt-4o")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    server = None
+    if args.api_real:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            sys.exit("Falta OPENAI_API_KEY para --api-real.")
+        client = OpenAI(api_key=api_key, http_client=httpx.Client(trust_env=False))
+    else:
+        server = MockOpenAIServer(latency=0.05).start()
+        client = OpenAI(api_key="local", base_url=server.base_url, http_client=httpx.Client(trust_env=False))
+
+    samples = load_sample_screenshots()
+    print(f"{len(samples)} capturas de ejemplo, {args.repeticiones} repeticiones, destino: {'API real' if args.api_real else 'servidor local'}\n")
+    print(f"{'configuración':<24}{'KB medio':>10}{'codif. ms':>11}{'latencia p50':>14}{'latencia máx':>14}")
+    for name, settings in SETTINGS_TO_COMPARE.items():
+        sizes, encode_ms, latencies = [], [], []
+        for sample_name, image in samples:
+            image_base64, mime_type, report = encode_image(image, settings)
+            sizes.append(report["bytes"] / 1024)
+            encode_ms.append(report["total_ms"])
+            for _ in range(args.repeticiones):
+                latency_ms, answer = ask_with_image(client, image_base64, mime_type, args.modelo)
+                latencies.append(latency_ms)
+            if args.api_real:
+                print(f"  {name} / {sample_name}: {format_report(report)} -> {answer}")
+        print(f"{name:<24}{statistics.mean(sizes):>10.0f}{statistics.mean(encode_ms):>11.1f}"
+              f"{statistics.median(latencies):>14.0f}{max(latencies):>14.0f}")
+
+    if server:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
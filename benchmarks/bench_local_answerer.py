@@ -0,0 +1,129 @@
+"""
+Benchmark del respondedor local (local_answerer) con preguntas etiquetadas (labeled_questions.json:
+{"pregunta", "respuesta"} con la letra correcta): precisión de las respuestas que da sin la API,
+cobertura (qué parte de las preguntas responde), acierto de la mejor alternativa cuando se usa sin
+umbrales (sin conexión) y latencia por pregunta. También compara varios umbrales de puntuación y margen.
+
+    python benchmarks/bench_local_answerer.py
+    python benchmarks/bench_local_answerer.py --repeticiones 50 --detalle
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import assistant_core as core
+import local_answerer
+from local_answerer import answer_locally
+
+LABELED_QUESTIONS_PATH = os.path.join(BENCH_DIR, "labeled_questions.json")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+SCORE_THRESHOLDS = (0.4, 0.5, 0.6)
+MARGIN_THRESHOLDS = (0.1, 0.15, 0.25, 0.35)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def evaluate(results, labels, min_score, min_margin):
+    """Respondidas, aciertos entre ellas, precisión y cobertura con unos umbrales dados."""
+    answered = correct = 0
+    for result, label in zip(results, labels):
+        if result is None or result.score < min_score or result.margin < min_margin:
+            continue
+        answered += 1
+        correct += result.letter == label
+    return {"puntuacion_minima": min_score, "margen_minimo": min_margin, "respondidas": answered, "aciertos": correct,
+            "precision": correct / answered if answered else None, "cobertura": answered / len(labels)}
+
+def fmt_ratio(value):
+    return f"{value * 100:.0f}%" if value is not None else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precisión y latencia del respondedor local con preguntas etiquetadas.")
+    parser.add_argument("--pdfs", default=os.path.join(REPO_DIR, "pdfs"), help="Directorio del material de estudio.")
+    parser.add_argument("--preguntas", default=LABELED_QUESTIONS_PATH, help="JSON con preguntas etiquetadas.")
+    parser.add_argument("--repeticiones", type=int, default=20, help="Veces que se responde cada pregunta para medir la latencia.")
+    parser.add_argument("--detalle", action="store_true", help="Muestra la puntuación de cada pregunta.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/results/local-<fecha>.json).")
+    args = parser.parse_args()
+    if not local_answerer.local_answering_available():
+        sys.exit("El respondedor local requiere NumPy (pip install numpy).")
+
+    with open(args.preguntas, encoding="utf-8") as f:
+        labeled = json.load(f)
+    questions = [item["pregunta"] for item in labeled]
+    labels = [item["respuesta"].strip().lower() for item in labeled]
+    core.prepare_corpus(args.pdfs)
+    index = core.global_retrieval_index
+    if index is None:
+        sys.exit("No hay índice de recuperación (¿material vacío?).")
+
+    # Sin umbrales: se guarda la mejor alternativa de cada pregunta y se filtra después con cada umbral
+    answer_locally(questions[0], index) # Calentar (IDF por prefijo, importaciones)
+    results = [answer_locally(question, index, min_score=0.0, min_margin=0.0) for question in questions]
+    latencies = []
+    for question in questions:
+        samples = []
+        for _ in range(args.repeticiones):
+            start = time.perf_counter()
+            answer_locally(question, index)
+            samples.append((time.perf_counter() - start) * 1000)
+        latencies.append(sorted(samples)[len(samples) // 2])
+
+    if args.detalle:
+        print(f"{'':<4}{'punt.':>6}{'margen':>8}  pregunta")
+        for result, label, question in zip(results, labels, questions):
+            if result is None:
+                print(f"{'--':<4}{'':>6}{'':>8}  {question.splitlines()[0][:70]} (no aplica)")
+                continue
+            mark = "ok" if result.letter == label else "MAL"
+            print(f"{mark:<4}{result.score:>6.2f}{result.margin:>8.2f}  {question.splitlines()[0][:70]}")
+
+    applicable = [(result, label) for result, label in zip(results, labels) if result is not None]
+    forced_correct = sum(result.letter == label for result, label in applicable)
+    default = evaluate(results, labels, core.LOCAL_ANSWER_MIN_SCORE, core.LOCAL_ANSWER_MIN_MARGIN)
+    sweep = [evaluate(results, labels, min_score, min_margin)
+             for min_score in SCORE_THRESHOLDS for min_margin in MARGIN_THRESHOLDS]
+
+    print(f"\n{len(questions)} preguntas etiquetadas, {len(applicable)} con alternativas puntuables.")
+    print(f"Umbrales actuales (puntuación >= {core.LOCAL_ANSWER_MIN_SCORE}, margen >= {core.LOCAL_ANSWER_MIN_MARGIN}): "
+          f"{default['respondidas']} respondidas sin la API, precisión {fmt_ratio(default['precision'])}, "
+          f"cobertura {fmt_ratio(default['cobertura'])}.")
+    print(f"Sin umbrales (sin conexión): {forced_correct}/{len(applicable)} aciertos "
+          f"({fmt_ratio(forced_correct / len(applicable) if applicable else None)}).")
+    print(f"Latencia por pregunta: p50 {percentile(latencies, 0.5):.1f} ms, p95 {percentile(latencies, 0.95):.1f} ms, "
+          f"máx. {max(latencies):.1f} ms.")
+    print(f"\n{'puntuación':>11}{'margen':>8}{'respondidas':>13}{'precisión':>11}{'cobertura':>11}")
+    for row in sweep:
+        print(f"{row['puntuacion_minima']:>11.2f}{row['margen_minimo']:>8.2f}{row['respondidas']:>13}"
+              f"{fmt_ratio(row['precision']):>11}{fmt_ratio(row['cobertura']):>11}")
+
+    output = args.salida or os.path.join(RESULTS_DIR, f"local-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "preguntas": len(questions),
+                   "umbrales_actuales": default, "sin_umbrales": {"aciertos": forced_correct, "puntuables": len(applicable)},
+                   "latencia_ms": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95), "max": max(latencies)},
+                   "barrido": sweep,
+                   "detalle": [{"pregunta": question.splitlines()[0], "correcta": label,
+                                "elegida": result.letter if result else None,
+                                "puntuacion": round(result.score, 3) if result else None,
+                                "margen": round(result.margin, 3) if result else None}
+                               for question, label, result in zip(questions, labels, results)]},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark de memoria del material de estudio: el corpus como cadenas de Python (documentos, texto unido
+y pasajes del índice en memoria, una copia del material por prompt) frente al almacén mapeado
+(corpus_store.CorpusStore), con el material multiplicado (por defecto 10 veces el actual) y varias
+peticiones en curso a la vez.
+
+Cada medición es un proceso nuevo: una pasada con tracemalloc (memoria de Python: residente tras la
+carga, con las peticiones en curso y pico) y otra sin él para el RSS del proceso.
+Escenarios: "recuperacion" (el material no cabe y se envían pasajes) y "completo" (--contexto-completo:
+el material entero en cada prompt).
+
+    python benchmarks/bench_memory.py
+    python benchmarks/bench_memory.py --factor 20 --peticiones 16
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+QUESTIONS_PATH = os.path.join(BENCH_DIR, "questions.json")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+MODES = ("cadena", "almacen")
+SCENARIOS = ("recuperacion", "completo")
+MB = 1024 * 1024
+
+
+def rss_bytes():
+    """RSS actual del proceso (Linux) o, si no se puede leer, el máximo alcanzado."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    except ImportError:
+        return None
+
+def replicate(documents, factor):
+    """El material repetido factor veces, con textos distintos (no cadenas compartidas) y nombres únicos."""
+    return [{"filename": f"{k:02d}-{doc['filename']}", "key": f"{doc.get('key')}-{k}",
+             "pages": [f"{page}\n[{k}]" if page else page for page in doc["pages"]]}
+            for k in range(factor) for doc in documents]
+
+def run_child(mode, scenario, pdf_directory, factor, requests, traced):
+    import assistant_core as core
+    from retrieval import RetrievalIndex
+    core.USE_RETRIEVAL = scenario == "recuperacion"
+    with open(QUESTIONS_PATH, encoding="utf-8") as f:
+        questions = json.load(f)
+    base_documents = core.load_pdf_documents(pdf_directory)
+    core.token_counter.count("calentar") # Carga (o descarta) tiktoken antes de medir
+    if traced:
+        tracemalloc.start()
+    rss_start = rss_bytes()
+    documents = replicate(base_documents, factor)
+    del base_documents
+    if mode == "cadena":
+        # Como antes del almacén: los documentos, el texto unido y los pasajes del índice, todo en memoria
+        context = core.join_documents_text(documents)
+        core.global_retrieval_index = RetrievalIndex.from_documents(documents) if core.USE_RETRIEVAL else None
+        if core.global_retrieval_index is not None:
+            core.global_retrieval_index.attach_token_counts(core.token_counter.count)
+        chars = len(context)
+    else:
+        context, core.global_retrieval_index = core.build_corpus(documents)
+        del documents
+        chars = context.chars
+    resident = tracemalloc.get_traced_memory()[0] if traced else None
+    rss_loaded = rss_bytes()
+    in_flight = [core.build_prompt_messages(questions[i % len(questions)], context) for i in range(requests)]
+    result = {"chars": chars, "rss_carga": rss_loaded - rss_start if rss_start is not None else None,
+              "rss_peticiones": rss_bytes() - rss_start if rss_start is not None else None}
+    if traced:
+        current, peak = tracemalloc.get_traced_memory()
+        result.update(residente=resident, con_peticiones=current, pico=peak)
+    del in_flight
+    print(json.dumps(result))
+
+def measure(mode, scenario, args, traced):
+    command = [sys.executable, os.path.abspath(__file__), "--hijo", mode, "--escenario", scenario, "--pdfs", args.pdfs,
+               "--factor", str(args.factor), "--peticiones", str(args.peticiones)]
+    if traced:
+        command.append("--tracemalloc")
+    result = subprocess.run(command, capture_output=True, text=True, timeout=600)
+    if result.returncode != 0:
+        raise RuntimeError(f"La medición falló:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def mb(value):
+    return f"{value / MB:.1f}" if value is not None else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de memoria: corpus en cadenas frente al almacén mapeado.")
+    parser.add_argument("--hijo", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--escenario", choices=SCENARIOS, default="recuperacion", help=argparse.SUPPRESS)
+    parser.add_argument("--tracemalloc", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--pdfs", default=os.path.join(REPO_DIR, "pdfs"), help="Directorio del material de estudio.")
+    parser.add_argument("--factor", type=int, default=10, help="Veces que se repite el material actual.")
+    parser.add_argument("--peticiones", type=int, default=8, help="Prompts en curso a la vez.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/results/memoria-<fecha>.json).")
+    args = parser.parse_args()
+    if args.hijo:
+        run_child(args.hijo, args.escenario, args.pdfs, args.factor, args.peticiones, args.tracemalloc)
+        return
+
+    results = {}
+    for scenario in SCENARIOS:
+        for mode in MODES:
+            traced = measure(mode, scenario, args, traced=True)
+            untraced = measure(mode, scenario, args, traced=False)
+            results[f"{scenario}/{mode}"] = dict(traced, rss_carga=untraced["rss_carga"], rss_peticiones=untraced["rss_peticiones"])
+
+    chars = next(iter(results.values()))["chars"]
+    print(f"\nMaterial x{args.factor} ({chars / 1e6:.1f} M caracteres), {args.peticiones} peticiones en curso. "
+          f"Memoria de Python (tracemalloc) y RSS del proceso, en MB:")
+    print(f"{'escenario':<14}{'modo':<10}{'residente':>11}{'con peticiones':>16}{'pico':>8}{'RSS carga':>11}{'RSS peticiones':>16}")
+    for key, row in results.items():
+        scenario, mode = key.split("/")
+        print(f"{scenario:<14}{mode:<10}{mb(row['residente']):>11}{mb(row['con_peticiones']):>16}{mb(row['pico']):>8}"
+              f"{mb(row['rss_carga']):>11}{mb(row['rss_peticiones']):>16}")
+
+    output = args.salida or os.path.join(RESULTS_DIR, f"memoria-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "factor": args.factor,
+                   "peticiones": args.peticiones, "resultados": results}, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark del enrutado de modelos y la consulta doble contra el servidor local, con una latencia
+distinta para el modelo rápido y el fuerte:
+- fuerte: todas las preguntas al modelo fuerte (sin enrutado),
+- enrutado: cada pregunta al modelo que elige model_router (las de completar al rápido),
+- doble: enrutado + consulta doble (lo que va al fuerte se pide también al rápido).
+Mide por pregunta el tiempo hasta la primera respuesta en pantalla (la preliminar, si la hay) y hasta
+la definitiva, y el desacuerdo entre modelos (el servidor hace que el rápido discrepe en una parte
+de las preguntas, --desacuerdo).
+
+    python benchmarks/bench_models.py
+    python benchmarks/bench_models.py --latencia-rapido 0.1 --latencia-fuerte 1.0 --desacuerdo 0.25
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+QUESTIONS_PATH = os.path.join(BENCH_DIR, "questions.json")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+MODES = ("fuerte", "enrutado", "doble")
+FAST_DISAGREEING_ANSWER = "d) Respuesta distinta del modelo rápido."
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else float("nan")
+
+def run_mode(core, server, mode, questions, context, disagreement, repetitions):
+    core.USE_MODEL_ROUTER = mode != "fuerte"
+    core.HEDGED_REQUESTS = mode == "doble"
+    core.model_stats = core.ModelStats()
+    first_ms, final_ms = [], []
+    for repetition in range(repetitions):
+        for i, question in enumerate(questions):
+            # El rápido discrepa de forma determinista en una proporción de las preguntas
+            disagrees = disagreement and (i + repetition) % round(1 / disagreement) == 0
+            server.config["model_answers"] = {core.FAST_MODEL: FAST_DISAGREEING_ANSWER} if disagrees else {}
+            shown = []
+            start = time.perf_counter()
+            core.get_answer_with_cache(question, context, on_preliminary=lambda _answer: shown.append(time.perf_counter()))
+            end = time.perf_counter()
+            first_ms.append(((shown[0] if shown else end) - start) * 1000)
+            final_ms.append((end - start) * 1000)
+    time.sleep(max(server.config["model_latency"].values()) + 0.2) # Que terminen las consultas rápidas en curso
+    return {"primera_p50": percentile(first_ms, 0.5), "primera_p95": percentile(first_ms, 0.95),
+            "definitiva_p50": percentile(final_ms, 0.5), "definitiva_p95": percentile(final_ms, 0.95),
+            "estadisticas": core.model_stats.summary()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del enrutado de modelos y la consulta doble.")
+    parser.add_argument("--pdfs", default=os.path.join(REPO_DIR, "pdfs"), help="Directorio del material de estudio.")
+    parser.add_argument("--latencia-rapido", type=float, default=0.15, help="Segundos hasta el primer byte del modelo rápido.")
+    parser.add_argument("--latencia-fuerte", type=float, default=0.6, help="Segundos hasta el primer byte del modelo fuerte.")
+    parser.add_argument("--desacuerdo", type=float, default=0.25, help="Proporción de preguntas en que el rápido discrepa.")
+    parser.add_argument("--repeticiones", type=int, default=2, help="Pasadas por las preguntas en cada modo.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/results/modelos-<fecha>.json).")
+    args = parser.parse_args()
+
+    from mock_openai_server import MockOpenAIServer
+    import assistant_core as core
+    with open(QUESTIONS_PATH, encoding="utf-8") as f:
+        questions = json.load(f)
+    server = MockOpenAIServer(model_latency={core.FAST_MODEL: args.latencia_rapido, core.OPENAI_MODEL: args.latencia_fuerte}).start()
+    core.API_KEY = "local"
+    core.OPENAI_BASE_URL = server.base_url
+    core.USE_LOCAL_ANSWERER = False # Todas las preguntas van a la API
+    core.configure_rate_limits(0, 0)
+    results = {}
+    try:
+        context = core.prepare_corpus(args.pdfs)
+        core.start_async_engine()
+        for mode in MODES:
+            results[mode] = run_mode(core, server, mode, questions, context, args.desacuerdo, args.repeticiones)
+    finally:
+        core.stop_async_engine()
+        server.stop()
+
+    print(f"\n{len(questions)} preguntas x {args.repeticiones}; servidor local: {core.FAST_MODEL} {args.latencia_rapido * 1000:.0f} ms, "
+          f"{core.OPENAI_MODEL} {args.latencia_fuerte * 1000:.0f} ms; el rápido discrepa en ~{args.desacuerdo * 100:.0f}%.")
+    print(f"{'modo':<10}{'primera p50':>13}{'primera p95':>13}{'definitiva p50':>16}{'definitiva p95':>16}{'desacuerdo':>12}")
+    for mode, row in results.items():
+        stats = row["estadisticas"]
+        disagreement = f"{stats['desacuerdos']}/{stats['dobles']}" if stats["dobles"] else "-"
+        print(f"{mode:<10}{row['primera_p50']:>13.0f}{row['primera_p95']:>13.0f}{row['definitiva_p50']:>16.0f}"
+              f"{row['definitiva_p95']:>16.0f}{disagreement:>12}")
+    for mode, row in results.items():
+        for model, stats in row["estadisticas"]["modelos"].items():
+            print(f"  {mode:<10}{model:<14}{stats['llamadas']:>4} llamadas, p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms")
+
+    output = args.salida or os.path.join(RESULTS_DIR, f"modelos-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "latencia_rapido": args.latencia_rapido,
+                   "latencia_fuerte": args.latencia_fuerte, "desacuerdo": args.desacuerdo, "repeticiones": args.repeticiones,
+                   "resultados": results}, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark de la vigilancia de región (region_watcher) con una página sintética de preguntas que se
+desplaza: cada pregunta llega con un desplazamiento suave de varios fotogramas y luego se queda quieta,
+con un cursor que parpadea. Las capturas salen de fotogramas ya dibujados (grab sustituido), así que se
+mide solo lo que añade la vigilancia: el coste por captura (CPU del hilo) y cuántas preguntas se envían
+(debería ser una por pregunta: ni los fotogramas del desplazamiento ni el cursor cuentan), además del
+retraso entre que la pregunta se queda quieta y se envía (el debounce).
+
+    python benchmarks/bench_region_watch.py
+    python benchmarks/bench_region_watch.py --fps 10 --estable 0.3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+
+from PIL import Image, ImageDraw
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from region_watcher import RegionWatcher, WatchStats, region_watch_available
+from sample_screenshots import synthetic_screenshot, SYNTHETIC_QUESTIONS
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+SCROLL_FRAMES = 6 # Fotogramas que dura el desplazamiento hasta la pregunta siguiente
+CARET_PERIOD = 4 # El cursor cambia cada tantos fotogramas
+
+
+def scripted_frames(size, font_size, questions, still_frames):
+    """Fotogramas BGRA de la vista: [(bytes, índice de la pregunta visible o None si se está desplazando)]."""
+    pages = [synthetic_screenshot(question, options, size=size, font_size=font_size) for question, options in questions]
+    page = Image.new("RGB", (size[0], size[1] * len(pages)))
+    for i, image in enumerate(pages):
+        page.paste(image, (0, i * size[1]))
+    frames = []
+    def add(top, question_index, frame_number):
+        view = page.crop((0, top, size[0], top + size[1]))
+        if frame_number // CARET_PERIOD % 2: # Cursor de texto parpadeando
+            ImageDraw.Draw(view).rectangle([size[0] // 2, size[1] - 80, size[0] // 2 + 2, size[1] - 50], fill=(0, 0, 0))
+        frames.append((view.convert("RGBA").tobytes("raw", "BGRA"), question_index))
+    for i in range(len(pages)):
+        if i:
+            for step in range(1, SCROLL_FRAMES + 1):
+                add(round((i - 1 + step / (SCROLL_FRAMES + 1)) * size[1]), None, len(frames))
+        for _ in range(still_frames):
+            add(i * size[1], i, len(frames))
+    return frames
+
+def run_scenario(size, font_size, questions, fps, stable_seconds, threshold):
+    still_frames = int(fps * (stable_seconds + 0.5)) # Cada pregunta se queda quieta algo más que el debounce
+    frames = scripted_frames(size, font_size, questions, still_frames)
+    position = {"frame": 0, "settled_at": {}}
+    done = threading.Event()
+    submissions = []
+
+    def grab():
+        index = min(position["frame"], len(frames) - 1)
+        position["frame"] += 1
+        if position["frame"] >= len(frames):
+            done.set()
+        raw, question_index = frames[index]
+        if question_index is not None:
+            position["settled_at"].setdefault(question_index, time.perf_counter())
+        return raw, size
+
+    def on_change(image, captured_at):
+        question_index = frames[min(position["frame"], len(frames)) - 1][1]
+        settled = position["settled_at"].get(question_index)
+        submissions.append({"pregunta": question_index, "tamano": image.size,
+                            "retraso_ms": (captured_at - settled) * 1000 if settled is not None else None})
+
+    stats = WatchStats()
+    watcher = RegionWatcher({"top": 0, "left": 0, "width": size[0], "height": size[1]}, on_change,
+                            captures_per_second=fps, change_threshold=threshold, stable_seconds=stable_seconds,
+                            grab=grab, stats=stats).start()
+    done.wait(len(frames) / fps * 3 + 5)
+    watcher.stop()
+    summary = stats.summary()
+    delays = [row["retraso_ms"] for row in submissions if row["retraso_ms"] is not None]
+    return {"fotogramas": len(frames), "preguntas": len(questions), "enviadas": len(submissions),
+            "enviadas_por_pregunta": [row["pregunta"] for row in submissions],
+            "cpu_media_ms": summary["cpu_media_ms"], "captura_p50_ms": summary["captura_p50_ms"],
+            "captura_p95_ms": summary["captura_p95_ms"],
+            "retraso_debounce_ms": sum(delays) / len(delays) if delays else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coste por captura y envíos de la vigilancia de región.")
+    parser.add_argument("--fps", type=float, default=20.0, help="Capturas por segundo (alto para que el benchmark sea corto).")
+    parser.add_argument("--estable", type=float, default=0.5, help="Segundos que el contenido debe quedarse quieto.")
+    parser.add_argument("--umbral", type=float, default=0.005, help="Proporción de píxeles que deben cambiar.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/results/vigilancia-<fecha>.json).")
+    args = parser.parse_args()
+    if not region_watch_available():
+        sys.exit("La vigilancia de región requiere NumPy (pip install numpy).")
+
+    results = {}
+    for size, font_size in (((1200, 500), 16), ((2560, 1100), 34)):
+        label = f"{size[0]}x{size[1]}"
+        results[label] = run_scenario(size, font_size, SYNTHETIC_QUESTIONS, args.fps, args.estable, args.umbral)
+        row = results[label]
+        ok = row["enviadas_por_pregunta"] == list(range(row["preguntas"]))
+        print(f"{label}: {row['fotogramas']} capturas, {row['enviadas']} enviadas para {row['preguntas']} preguntas "
+              f"({'ok' if ok else 'MAL: ' + str(row['enviadas_por_pregunta'])}); por captura CPU {row['cpu_media_ms']:.2f} ms, "
+              f"p50 {row['captura_p50_ms']:.2f} ms, p95 {row['captura_p95_ms']:.2f} ms; "
+              f"de quieta a enviada {row['retraso_debounce_ms']:.0f} ms (debounce {args.estable * 1000:.0f} ms)")
+
+    output = args.salida or os.path.join(RESULTS_DIR, f"vigilancia-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "fps": args.fps, "estable": args.estable,
+                   "umbral": args.umbral, "resultados": results}, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {output}")
+
+
+if __name__ == "__main__":
+    main()
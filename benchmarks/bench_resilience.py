@@ -0,0 +1,162 @@
+"""
+Comprobación de la resiliencia de las llamadas a la API (resilience) contra el servidor local con fallos
+inyectados (MockOpenAIServer.inject_failures), con el cliente síncrono y con el motor asíncrono:
+- 429 con Retry-After: se espera al menos lo indicado y el reintento funciona;
+- 5xx y conexión cortada: un reintento y la respuesta llega;
+- clave inválida (401) y cuota agotada: fallan al primer intento, sin reintentar;
+- cortacircuitos: tras el umbral de fallos seguidos se abre y la siguiente petición lanza
+  CircuitOpenError sin llegar al servidor;
+- streaming cortado después de mostrar texto parcial: no se reintenta.
+Termina con error si algún caso no se comporta como se espera.
+
+    python benchmarks/bench_resilience.py
+    python benchmarks/bench_resilience.py --motor sincrono
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from mock_openai_server import MockOpenAIServer
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+RETRY_AFTER_SECONDS = 0.4 # Retry-After de los 429 del servidor local
+BREAKER_THRESHOLD = 3
+CONTEXT = "Material de prueba: la transferencia del riesgo consiste en contratar un seguro."
+QUESTION = "¿Qué estrategia consiste en contratar un seguro?\na) Mitigación\nb) Transferencia"
+
+
+def run_case(core, server, name, failures, expect, streaming=False, breaker_threshold=None):
+    """
+    Ejecuta get_openai_answer con los fallos inyectados y comprueba el resultado. expect: {"ok": bool,
+    "tipo": tipo de ApiError, "peticiones": peticiones que deben llegar al servidor, "espera_min": segundos}.
+    """
+    from resilience import ApiError, CircuitBreaker, RateLimiter, ResilientCaller
+    core.resilient_caller = ResilientCaller(RateLimiter(None, None),
+                                            CircuitBreaker(failure_threshold=breaker_threshold or 100, reset_seconds=30))
+    server.inject_failures(*failures)
+    partials = []
+    requests_before = server.requests_received
+    start = time.perf_counter()
+    answer, error = None, None
+    try:
+        answer = core.get_openai_answer(QUESTION, CONTEXT, on_partial=partials.append if streaming else None)
+    except ApiError as e:
+        error = e
+    elapsed = time.perf_counter() - start
+    requests = server.requests_received - requests_before
+    with server.httpd.lock:
+        server.httpd.failures.clear() # Lo que no se llegó a consumir no debe afectar al caso siguiente
+    problems = []
+    if expect["ok"] and error is not None:
+        problems.append(f"falló ({error.kind}: {error})")
+    if not expect["ok"] and error is None:
+        problems.append("no falló")
+    if error is not None and expect.get("tipo") and error.kind != expect["tipo"]:
+        problems.append(f"tipo {error.kind} en lugar de {expect['tipo']}")
+    if requests != expect["peticiones"]:
+        problems.append(f"{requests} peticiones en lugar de {expect['peticiones']}")
+    if elapsed < expect.get("espera_min", 0):
+        problems.append(f"esperó {elapsed:.2f} s, menos que Retry-After ({expect['espera_min']:g} s)")
+    if streaming and not partials:
+        problems.append("no llegó texto parcial")
+    return {"caso": name, "ok": not problems, "problemas": problems, "peticiones": requests,
+            "segundos": round(elapsed, 3), "error": error.kind if error is not None else None,
+            "respuesta": answer, "parciales": len(partials)}
+
+def run_breaker_case(core, server):
+    """Fallos 5xx seguidos hasta el umbral: la llamada falla y la siguiente no llega al servidor."""
+    from resilience import CircuitOpenError
+    first = run_case(core, server, "cortacircuitos: se abre", [500] * BREAKER_THRESHOLD,
+                     {"ok": False, "tipo": "server", "peticiones": BREAKER_THRESHOLD}, breaker_threshold=BREAKER_THRESHOLD)
+    breaker = core.resilient_caller.breaker
+    requests_before = server.requests_received
+    problems = []
+    if breaker.state != "abierto":
+        problems.append(f"estado {breaker.state} tras {BREAKER_THRESHOLD} fallos")
+    try:
+        core.get_openai_answer(QUESTION, CONTEXT)
+        problems.append("la petición con el circuito abierto no falló")
+    except CircuitOpenError:
+        pass
+    except Exception as e:
+        problems.append(f"{type(e).__name__} en lugar de CircuitOpenError")
+    if server.requests_received != requests_before:
+        problems.append("la petición con el circuito abierto llegó al servidor")
+    second = {"caso": "cortacircuitos: CircuitOpenError", "ok": not problems, "problemas": problems,
+              "peticiones": server.requests_received - requests_before}
+    return [first, second]
+
+def run_engine(core, server, engine):
+    from async_engine import AsyncOpenAIEngine
+    core.client = None
+    core.async_engine = AsyncOpenAIEngine("local", base_url=server.base_url).start() if engine == "asincrono" else None
+    try:
+        results = [
+            run_case(core, server, "429 con Retry-After", [429],
+                     {"ok": True, "peticiones": 2, "espera_min": RETRY_AFTER_SECONDS}),
+            run_case(core, server, "500 y luego bien", [500], {"ok": True, "peticiones": 2}),
+            run_case(core, server, "conexión cortada y luego bien", ["corte"], {"ok": True, "peticiones": 2}),
+            run_case(core, server, "clave inválida (401)", [401], {"ok": False, "tipo": "auth", "peticiones": 1}),
+            run_case(core, server, "cuota agotada", ["cuota"], {"ok": False, "tipo": "quota", "peticiones": 1}),
+            run_case(core, server, "corte tras texto parcial", ["parcial"],
+                     {"ok": False, "tipo": "connection", "peticiones": 1}, streaming=True),
+            run_case(core, server, "corte antes del texto (streaming)", ["corte"], {"ok": True, "peticiones": 2}, streaming=True),
+        ]
+        results += run_breaker_case(core, server)
+    finally:
+        core.stop_async_engine()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reintentos, Retry-After y cortacircuitos contra el servidor local con fallos.")
+    parser.add_argument("--motor", choices=["ambos", "sincrono", "asincrono"], default="ambos",
+                        help="Cliente con el que se prueba.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/results/resiliencia-<fecha>.json).")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(retry_after=RETRY_AFTER_SECONDS, token_delay=0.01).start()
+    # assistant_core lee la clave y la URL al importarse: deben apuntar al servidor local antes del import
+    os.environ["OPENAI_API_KEY"] = "local"
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    import assistant_core as core
+    from prompt_builder import TokenCounter
+    core.token_counter = TokenCounter(core.OPENAI_MODEL)
+    core.STREAMING_ENABLED = True
+
+    engines = ["sincrono", "asincrono"] if args.motor == "ambos" else [args.motor]
+    results = {}
+    try:
+        for engine in engines:
+            results[engine] = run_engine(core, server, engine)
+    finally:
+        server.stop()
+
+    failed = 0
+    for engine, rows in results.items():
+        print(f"\nMotor {engine}:")
+        for row in rows:
+            failed += not row["ok"]
+            detail = f" ({'; '.join(row['problemas'])})" if row["problemas"] else ""
+            timing = f", {row['segundos']:.2f} s" if "segundos" in row else ""
+            print(f"  {'ok' if row['ok'] else 'MAL':<4}{row['caso']:<36}{row['peticiones']} peticiones{timing}{detail}")
+
+    output = args.salida or os.path.join(RESULTS_DIR, f"resiliencia-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "resultados": results}, f, ensure_ascii=False, indent=2)
+    print(f"\n{'Todos los casos se comportan como se espera' if not failed else f'{failed} casos fallan'}.")
+    print(f"Resultados guardados en {output}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark del arranque: tiempo hasta que la interfaz puede mostrarse, hasta que el material está cargado
+y hasta la primera respuesta, en frío (sin caché de texto extraído) y en caliente (con caché).
+
+Cada medición es un proceso nuevo de Python (las importaciones cuentan de verdad) que reproduce el
+arranque de main.py contra el servidor local, con una pregunta que llega nada más abrirse la interfaz:
+- escalonado: el arranque actual (interfaz enseguida, material en segundo plano; la pregunta espera),
+- secuencial: el arranque anterior (material y motor primero, interfaz después).
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeticiones 5 --latencia 0.3
+"""
+import time
+STARTED_AT = time.perf_counter() # Antes de cualquier otra importación (modo --hijo)
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+MODES = ("escalonado", "secuencial")
+MILESTONES = ("interfaz", "material", "primera_respuesta")
+QUESTION = "¿Qué estrategia de control del riesgo consiste en contratar un seguro?\na) Mitigación\nb) Aceptación\nc) Transferencia\nd) Evitación"
+
+
+def run_child(mode, pdf_directory):
+    """Un arranque medido (en este proceso). Imprime los hitos en ms desde el inicio del proceso."""
+    sys.path.insert(0, REPO_DIR)
+    marks = {}
+    def mark(name):
+        marks[name] = round((time.perf_counter() - STARTED_AT) * 1000, 1)
+
+    try:
+        import main as app # Lo que importa la app antes de abrir la ventana (requiere tkinter, pystray y pynput)
+        core = app.core
+        imported = "main"
+    except ImportError:
+        import assistant_core as core
+        imported = "assistant_core"
+    core.PDF_DIRECTORY = pdf_directory
+    if mode == "secuencial":
+        core.start_async_engine()
+        context = core.prepare_corpus()
+        mark("material")
+        mark("interfaz")
+    else:
+        core.start_background_loading(on_ready=lambda _text: mark("material"))
+        mark("interfaz")
+        context = core.wait_for_corpus() # La pregunta que llega enseguida espera al material
+    mark("importaciones_" + imported)
+    core.get_openai_answer(QUESTION, context)
+    mark("primera_respuesta")
+    core.stop_async_engine()
+    print(json.dumps(marks))
+
+def measure(mode, pdf_directory, env):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--hijo", mode, "--pdfs", pdf_directory],
+                            capture_output=True, text=True, env=env, timeout=300)
+    if result.returncode != 0:
+        raise RuntimeError(f"El arranque medido falló:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del arranque en frío y en caliente.")
+    parser.add_argument("--hijo", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--pdfs", default=os.path.join(REPO_DIR, "pdfs"), help="Directorio del material de estudio.")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Arranques por modo y estado.")
+    parser.add_argument("--latencia", type=float, default=0.2, help="Segundos hasta el primer byte del servidor local.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/results/arranque-<fecha>.json).")
+    args = parser.parse_args()
+    if args.hijo:
+        run_child(args.hijo, args.pdfs)
+        return
+
+    sys.path.insert(0, REPO_DIR)
+    from mock_openai_server import MockOpenAIServer
+    from pdf_extraction import get_cache_dir
+    server = MockOpenAIServer(latency=args.latencia).start()
+    env = dict(os.environ, OPENAI_API_KEY="local", OPENAI_BASE_URL=server.base_url)
+    work_dir = tempfile.mkdtemp(prefix="bench-arranque-")
+    pdf_directory = os.path.join(work_dir, "pdfs")
+    # Copia sin la caché: así "en frío" no borra la caché real del usuario
+    shutil.copytree(args.pdfs, pdf_directory, ignore=shutil.ignore_patterns(os.path.basename(get_cache_dir(args.pdfs))))
+    samples = {} # (modo, estado) -> {hito: [ms]}
+    try:
+        for _ in range(args.repeticiones):
+            for mode in MODES:
+                shutil.rmtree(get_cache_dir(pdf_directory), ignore_errors=True)
+                for state in ("frio", "caliente"): # El arranque en frío deja la caché para el siguiente
+                    marks = measure(mode, pdf_directory, env)
+                    for name, ms in marks.items():
+                        samples.setdefault((mode, state), {}).setdefault(name, []).append(ms)
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\nMediana de {args.repeticiones} arranques (ms desde el inicio del proceso), servidor local con "
+          f"{args.latencia * 1000:.0f} ms de latencia:")
+    print(f"{'modo':<12}{'estado':<10}" + "".join(f"{name:>20}" for name in MILESTONES))
+    summary = {}
+    for (mode, state), marks in samples.items():
+        row = {name: median(values) for name, values in marks.items()}
+        summary[f"{mode}/{state}"] = row
+        print(f"{mode:<12}{state:<10}" + "".join(f"{row.get(name, float('nan')):>20.0f}" for name in MILESTONES))
+
+    output = args.salida or os.path.join(RESULTS_DIR, f"arranque-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "repeticiones": args.repeticiones,
+                   "latencia": args.latencia, "resumen": summary}, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Capturas de ejemplo para los benchmarks: PNGs de benchmarks/screenshots/ o, si no hay, capturas sintéticas."""
+import os
+from PIL import Image, ImageDraw, ImageFont
+
+SCREENSHOTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "screenshots")
+
+SYNTHETIC_QUESTIONS = [
+    ("¿Cuál de los siguientes principios garantiza que la información no sea modificada sin autorización?",
+     ["a) Confidencialidad", "b) Integridad", "c) Disponibilidad", "d) No repudio"]),
+    ("En la gestión de riesgos, el proceso de identificar activos, amenazas y vulnerabilidades se denomina:",
+     ["a) Tratamiento del riesgo", "b) Evaluación del riesgo", "c) Aceptación del riesgo", "d) Transferencia del riesgo"]),
+    ("Complete: el marco de ciberseguridad publicado por el ____ organiza sus funciones en Identificar, Proteger, Detectar, Responder y Recuperar.",
+     []),
+]
+
+
+def synthetic_screenshot(question, options, size=(2560, 1100), font_size=34):
+    """Dibuja una pregunta tipo examen a resolución de pantalla de alta densidad."""
+    image = Image.new("RGB", size, (250, 250, 252))
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.load_default(size=font_size)
+    except TypeError: # Pillow antiguo: fuente bitmap de tamaño fijo
+        font = ImageFont.load_default()
+    draw.rectangle([40, 40, size[0] - 40, size[1] - 40], outline=(200, 200, 210), width=3)
+    y = 90
+    words = question.split()
+    line = ""
+    for word in words:
+        candidate = f"{line} {word}".strip()
+        if draw.textlength(candidate, font=font) > size[0] - 200:
+            draw.text((100, y), line, fill=(20, 20, 30), font=font)
+            y += font_size + 18
+            line = word
+        else:
+            line = candidate
+    draw.text((100, y), line, fill=(20, 20, 30), font=font)
+    y += font_size * 2
+    for option in options:
+        draw.ellipse([100, y + 6, 100 + font_size - 8, y + font_size - 2], outline=(90, 90, 110), width=3)
+        draw.text((100 + font_size + 20, y), option, fill=(40, 40, 60), font=font)
+        y += font_size + 30
+    return image
+
+
+def load_sample_screenshots():
+    """Devuelve [(nombre, PIL.Image)] con las capturas reales si existen, si no las sintéticas."""
+    samples = []
+    if os.path.isdir(SCREENSHOTS_DIR):
+        for name in sorted(os.listdir(SCREENSHOTS_DIR)):
+            if name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
+                with Image.open(os.path.join(SCREENSHOTS_DIR, name)) as img:
+                    samples.append((name, img.convert("RGB")))
+    if not samples:
+        samples = [(f"sintetica_{i + 1}", synthetic_screenshot(q, opts)) for i, (q, opts) in enumerate(SYNTHETIC_QUESTIONS)]
+    return samples
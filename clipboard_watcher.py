@@ -0,0 +1,231 @@
+import logging
+import sys
+import time
+import select
+
+from profiler import checkpoint as profiler_checkpoint
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración por defecto del observador del portapapeles ---
+DEBOUNCE_SECONDS = 0.3 # Copias seguidas dentro de esta ventana se agrupan en una sola
+POLL_MIN_SECONDS = 0.15 # Intervalo de sondeo tras actividad reciente
+POLL_MAX_SECONDS = 2.0 # Intervalo de sondeo máximo cuando el portapapeles está inactivo
+POLL_BACKOFF_FACTOR = 1.5 # Crecimiento del intervalo en cada sondeo sin cambios
+SEQUENCE_POLL_SECONDS = 0.05 # Windows: leer el número de secuencia es casi gratis, se consulta a menudo
+BACKENDS = ("auto", "windows", "xfixes", "polling")
+
+
+class PollingBackend:
+    """Sondeo con intervalo adaptativo: rápido tras un cambio y cada vez más lento en reposo."""
+    name = "polling"
+
+    def __init__(self, read_clipboard, min_interval=POLL_MIN_SECONDS, max_interval=POLL_MAX_SECONDS):
+        self.read_clipboard = read_clipboard
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.last_value = None
+        self.value_is_fresh = False # El último sondeo ya leyó el contenido actual
+        self.reads = 0
+
+    def wait_for_change(self, timeout):
+        """Espera (como mucho timeout) y devuelve True si el contenido cambió."""
+        time.sleep(min(self.interval, timeout))
+        previous = self.last_value
+        value = self._read_now()
+        self.value_is_fresh = True
+        changed = previous is not None and value != previous
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * POLL_BACKOFF_FACTOR, self.max_interval)
+        return changed
+
+    def read(self):
+        # Reutilizar la lectura del último sondeo para no lanzar otra lectura (subproceso en Linux)
+        if self.value_is_fresh:
+            self.value_is_fresh = False
+            return self.last_value
+        return self._read_now()
+
+    def _read_now(self):
+        self.reads += 1
+        self.last_value = self.read_clipboard()
+        return self.last_value
+
+    def close(self):
+        pass
+
+
+class WindowsSequenceBackend:
+    """Windows: consulta GetClipboardSequenceNumber (sin leer el contenido) y solo lee si cambió."""
+    name = "windows"
+
+    def __init__(self, read_clipboard):
+        import ctypes
+        self.read_clipboard = read_clipboard
+        self._get_sequence = ctypes.windll.user32.GetClipboardSequenceNumber
+        self.sequence = self._get_sequence()
+        self.reads = 0
+
+    def wait_for_change(self, timeout):
+        time.sleep(min(SEQUENCE_POLL_SECONDS, timeout))
+        sequence = self._get_sequence()
+        if sequence != self.sequence:
+            self.sequence = sequence
+            return True
+        return False
+
+    def read(self):
+        self.reads += 1
+        return self.read_clipboard()
+
+    def close(self):
+        pass
+
+
+class XFixesBackend:
+    """X11: recibe eventos XFixes SetSelectionOwnerNotify cuando alguien toma el portapapeles."""
+    name = "xfixes"
+
+    def __init__(self, read_clipboard, selections=("CLIPBOARD",)):
+        from Xlib import display as xdisplay
+        from Xlib.ext import xfixes
+        self.read_clipboard = read_clipboard
+        self.display = xdisplay.Display()
+        if not self.display.has_extension("XFIXES"):
+            self.display.close()
+            raise RuntimeError("El servidor X no tiene la extensión XFIXES")
+        self.display.xfixes_query_version()
+        root = self.display.screen().root
+        for selection in selections:
+            atom = self.display.get_atom(selection)
+            self.display.xfixes_select_selection_input(root, atom, xfixes.XFixesSetSelectionOwnerNotifyMask)
+        self.display.flush()
+        self.reads = 0
+
+    def wait_for_change(self, timeout):
+        changed = False
+        if not self.display.pending_events():
+            readable, _, _ = select.select([self.display.fileno()], [], [], timeout)
+            if not readable:
+                return False
+        while self.display.pending_events():
+            event = self.display.next_event()
+            if (event.type, getattr(event, "sub_code", None)) == self.display.extension_event.SetSelectionOwnerNotify:
+                changed = True
+        return changed
+
+    def read(self):
+        self.reads += 1
+        return self.read_clipboard()
+
+    def close(self):
+        self.display.close()
+
+
+def create_backend(name, read_clipboard, min_interval=POLL_MIN_SECONDS, max_interval=POLL_MAX_SECONDS):
+    """
+    Crea el backend pedido. Con "auto" prueba el nativo de la plataforma
+    (Windows: número de secuencia, Linux: XFixes) y si falla usa el sondeo adaptativo.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de portapapeles desconocido: {name} (opciones: {', '.join(BACKENDS)})")
+    candidates = []
+    if name == "auto":
+        if sys.platform == "win32":
+            candidates.append("windows")
+        elif sys.platform.startswith("linux"):
+            candidates.append("xfixes")
+    elif name != "polling":
+        candidates.append(name)
+    for candidate in candidates:
+        try:
+            if candidate == "windows":
+                return WindowsSequenceBackend(read_clipboard)
+            return XFixesBackend(read_clipboard)
+        except Exception as e:
+            logger.warning("No se pudo iniciar el backend de portapapeles '%s': %s. Usando sondeo adaptativo.", candidate, e)
+    return PollingBackend(read_clipboard, min_interval=min_interval, max_interval=max_interval)
+
+
+class ClipboardWatcher:
+    """
+    Detecta cambios del portapapeles con el backend elegido, agrupa las copias rápidas
+    (debounce) y entrega el valor final a on_change(valor).
+    Mide la latencia de detección, las lecturas del portapapeles y el uso de CPU del hilo.
+    """
+
+    def __init__(self, backend, on_change, debounce_seconds=DEBOUNCE_SECONDS, is_active=lambda: True,
+                 paused_sleep_seconds=1.0):
+        self.backend = backend
+        self.on_change = on_change
+        self.debounce_seconds = debounce_seconds
+        self.is_active = is_active
+        self.paused_sleep_seconds = paused_sleep_seconds
+        self.wakeups = 0
+        self.changes = 0
+        self.collapsed = 0 # Cambios absorbidos por el debounce
+        self.detection_ms = [] # Desde la primera señal de cambio hasta la entrega (incluye el debounce)
+        self.cpu_seconds = 0.0
+        self.started_at = None
+
+    def run(self, should_continue):
+        """Bucle bloqueante; termina cuando should_continue() devuelve False."""
+        self.started_at = time.perf_counter()
+        cpu_start = time.thread_time()
+        was_active = True
+        try:
+            while should_continue():
+                profiler_checkpoint()
+                if not self.is_active():
+                    was_active = False
+                    time.sleep(self.paused_sleep_seconds)
+                    continue
+                if not was_active:
+                    # Al reanudar se entrega lo que se haya copiado durante la pausa
+                    was_active = True
+                    self._deliver(time.perf_counter())
+                    continue
+                self.wakeups += 1
+                if self.backend.wait_for_change(self.paused_sleep_seconds):
+                    first_signal_time = time.perf_counter()
+                    # Debounce: esperar a que no haya más cambios durante la ventana
+                    deadline = first_signal_time + self.debounce_seconds
+                    while should_continue():
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            break
+                        if self.backend.wait_for_change(remaining):
+                            self.collapsed += 1
+                            deadline = time.perf_counter() + self.debounce_seconds
+                    self._deliver(first_signal_time)
+                self.cpu_seconds = time.thread_time() - cpu_start
+        finally:
+            self.cpu_seconds = time.thread_time() - cpu_start
+            self.backend.close()
+            logger.info("Observador del portapapeles detenido. %s", self.stats_text())
+
+    def _deliver(self, first_signal_time):
+        try:
+            value = self.backend.read()
+        except Exception as e:
+            logger.warning("No se pudo leer el portapapeles: %s", e)
+            return
+        read_done = time.perf_counter()
+        self.detection_ms.append((read_done - first_signal_time) * 1000)
+        self.detection_ms = self.detection_ms[-100:]
+        self.changes += 1
+        self.on_change(value)
+
+    def stats_text(self):
+        """Resumen de métricas para comparar backends."""
+        elapsed_min = max((time.perf_counter() - (self.started_at or time.perf_counter())) / 60, 1e-9)
+        avg_detection = sum(self.detection_ms) / len(self.detection_ms) if self.detection_ms else 0.0
+        text = (f"Backend {self.backend.name}: {self.changes} cambios, {self.collapsed} agrupados por debounce, "
+                f"detección media {avg_detection:.1f} ms, {self.backend.reads / elapsed_min:.1f} lecturas/min, "
+                f"{self.wakeups / elapsed_min:.0f} despertares/min, CPU {self.cpu_seconds * 1000 / elapsed_min:.1f} ms/min")
+        if isinstance(self.backend, PollingBackend):
+            text += f", intervalo actual {self.backend.interval * 1000:.0f} ms"
+        return text
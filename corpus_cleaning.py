@@ -0,0 +1,260 @@
+import re
+import zlib
+import logging
+import unicodedata
+from collections import Counter
+
+try:
+    import numpy as np # Opcional: firmas MinHash vectorizadas (sin NumPy se calculan como en answer_cache)
+except ImportError:
+    np = None
+
+from answer_cache import normalize_text, minhash_signature, estimate_similarity, MINHASH_PERMUTATIONS, SHINGLE_SIZE
+from corpus_store import PAGE_SEPARATOR
+from retrieval import STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración de la limpieza del material ---
+# Una línea corta es plantilla (encabezado, pie, código del curso, rótulo de la diapositiva) si se repite
+# en al menos esta proporción de las páginas de su PDF...
+REPEATED_LINE_PAGE_FRACTION = 0.5
+REPEATED_LINE_MIN_PAGES = 3 # ...y en al menos tantas páginas (un PDF más corto no tiene plantilla detectable)
+# ...o si aparece en todos los PDFs del material (portada con curso, ciclo y docente)
+REPEATED_LINE_DOCUMENT_FRACTION = 1.0
+REPEATED_LINE_MIN_DOCUMENTS = 3
+MAX_BOILERPLATE_LINE_CHARS = 100 # Las líneas más largas son contenido aunque se repitan (las cubre la deduplicación)
+# Deduplicación de párrafos: se conserva la primera aparición (en el orden del material) y se quitan las demás
+MIN_DUPLICATE_BLOCK_WORDS = 8 # Los párrafos más cortos se repiten legítimamente ("Ejemplo:", una definición breve)
+NEAR_DUPLICATE_THRESHOLD = 0.9 # Similitud de Jaccard estimada (MinHash) para considerar dos párrafos iguales
+LSH_BANDS = 16 # Bandas de la firma MinHash para encontrar candidatos sin comparar todos los pares
+# Un número suelto solo se quita como número de página entre las primeras o últimas líneas de la página
+# (o si coincide con el número de la página): en medio puede ser contenido ("2024", una alternativa "3")
+PAGE_NUMBER_EDGE_LINES = 2
+
+_PAGE_NUMBER_RE = re.compile(r"^(?:(?:p[aá]g(?:ina)?\.?|page|slide|diapositiva)\s*)?(\d{1,4})(?:\s*(?:/|de|of)\s*\d{1,4})?$",
+                             re.IGNORECASE)
+_HYPHENATION_RE = re.compile(r"(\w)-[ \t]*\n[ \t]*([a-záéíóúüñ])") # "seguri-\ndad" -> "seguridad"
+# pypdf separa a veces una mayúscula de su palabra por el espaciado ("T echnology", "T ools"). Solo
+# consonantes ("A", "E", "I", "O", "U" e "Y" son palabras por sí solas) seguidas de al menos 3 minúsculas;
+# _join_split_capital descarta además las que siguen a una letra suelta de verdad ("C es", "P un", "X tiene")
+_SPLIT_CAPITAL_RE = re.compile(r"\b([B-DF-HJ-NP-TV-XZ]) ([a-záéíóúñ]{3,})\b")
+_WORD_RE = re.compile(r"\w+")
+_SPACES_RE = re.compile(r"[ \t]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n") # Igual que retrieval: los pasajes se arman con estos párrafos
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# Con NumPy: coeficientes menores que 2^31 para que a * crc32 + b quepa en uint64 antes del módulo
+if np is not None:
+    _SIGNATURE_A = np.array([(i * 0x9E3779B1 + 0x7F4A7C15) % (1 << 31) or 1 for i in range(1, MINHASH_PERMUTATIONS + 1)], dtype=np.uint64)
+    _SIGNATURE_B = np.array([(i * 0x85EBCA77 + 0xC2B2AE3D) % (1 << 31) for i in range(1, MINHASH_PERMUTATIONS + 1)], dtype=np.uint64)
+
+
+def normalize_page(text):
+    """
+    Corrige los artefactos de la extracción en el texto de una página: ligaduras (NFKC: "ﬁ" -> "fi"),
+    palabras cortadas con guion al final de línea, mayúsculas separadas de su palabra y espacios
+    repetidos o al final de las líneas.
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text)
+    text = _HYPHENATION_RE.sub(r"\1\2", text)
+    text = _join_split_capitals(text)
+    lines = [_SPACES_RE.sub(" ", line).strip() for line in text.splitlines()]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+def _join_split_capitals(text):
+    """
+    Une las mayúsculas separadas por pypdf ("T echnology" -> "Technology") salvo que lo que sigue sea una
+    palabra por sí sola: una palabra vacía ("C es", "P un") o una que aparece suelta en otra parte del
+    mismo texto, a menos que la palabra unida también aparezca ("T ools" con "tools" y "Tools" en la página).
+    """
+    splits = Counter(match.group(2) for match in _SPLIT_CAPITAL_RE.finditer(text))
+    if not splits:
+        return text
+    words = Counter(word.lower() for word in _WORD_RE.findall(text))
+
+    def join(match):
+        capital, fragment = match.groups()
+        joined = capital + fragment
+        if normalize_text(fragment) in STOPWORDS:
+            return match.group(0)
+        if words[fragment] > splits[fragment] and not words[joined.lower()]:
+            return match.group(0)
+        return joined
+    return _SPLIT_CAPITAL_RE.sub(join, text)
+
+def is_page_number(line, position=0, line_count=1, page_number=None):
+    """
+    Líneas que solo numeran la página: "12", "12 / 40", "Página 3 de 17", "Slide 4". position es la posición
+    de la línea entre las líneas con texto de la página (line_count en total): fuera de las primeras o
+    últimas PAGE_NUMBER_EDGE_LINES solo cuenta si el número coincide con page_number.
+    """
+    match = _PAGE_NUMBER_RE.match(line)
+    if not match:
+        return False
+    at_edge = position < PAGE_NUMBER_EDGE_LINES or position >= line_count - PAGE_NUMBER_EDGE_LINES
+    return at_edge or (page_number is not None and int(match.group(1)) == page_number)
+
+def block_signature(key):
+    """Firma MinHash de los shingles de palabras de un párrafo normalizado (una fila de NumPy por shingle)."""
+    if np is None:
+        return minhash_signature(key)
+    words = key.split()
+    if len(words) < SHINGLE_SIZE:
+        shingles = {key}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((hashes[:, None] * _SIGNATURE_A + _SIGNATURE_B) % np.uint64(_MERSENNE_PRIME)).min(axis=0).tolist()
+
+def line_key(line):
+    """Clave de una línea para contar repeticiones: sin mayúsculas, acentos ni puntuación ("Sources:" = "Sources")."""
+    return normalize_text(line) if len(line) <= MAX_BOILERPLATE_LINE_CHARS else ""
+
+def find_boilerplate_lines(keys_by_document):
+    """
+    Claves de las líneas que son plantilla: {índice del documento: claves}. keys_by_document son las
+    claves (line_key) de las líneas de cada página de cada documento.
+    """
+    document_counts = Counter() # clave -> documentos en los que aparece
+    per_document = []
+    for pages in keys_by_document:
+        page_counts = Counter()
+        for keys in pages:
+            page_counts.update({key for key in keys if key})
+        document_counts.update(page_counts.keys())
+        pages_with_text = sum(1 for keys in pages if keys)
+        min_pages = max(REPEATED_LINE_MIN_PAGES, REPEATED_LINE_PAGE_FRACTION * pages_with_text)
+        per_document.append({key for key, count in page_counts.items() if count >= min_pages}
+                            if pages_with_text >= REPEATED_LINE_MIN_PAGES else set())
+    shared = set()
+    if len(keys_by_document) >= REPEATED_LINE_MIN_DOCUMENTS:
+        min_documents = max(REPEATED_LINE_MIN_DOCUMENTS, REPEATED_LINE_DOCUMENT_FRACTION * len(keys_by_document))
+        shared = {key for key, count in document_counts.items() if count >= min_documents}
+    return {i: keys | shared for i, keys in enumerate(per_document)}
+
+
+class DuplicateFinder:
+    """
+    Párrafos ya vistos del material: exactos por su texto normalizado y casi iguales por MinHash
+    (las firmas se reparten en LSH_BANDS bandas y solo se comparan los párrafos que coinciden en alguna).
+    """
+
+    def __init__(self, threshold=NEAR_DUPLICATE_THRESHOLD, bands=LSH_BANDS):
+        self.threshold = threshold
+        self.rows = MINHASH_PERMUTATIONS // bands
+        self.exact = set()
+        self.signatures = []
+        self.buckets = {} # (banda, valores de la banda) -> índices en signatures
+
+    def _bands(self, signature):
+        return [(start, tuple(signature[start:start + self.rows])) for start in range(0, len(signature), self.rows)]
+
+    def seen(self, key):
+        """True si la clave (texto normalizado) repite un párrafo anterior; si no, la registra y devuelve False."""
+        if key in self.exact:
+            return True
+        signature = block_signature(key)
+        bands = self._bands(signature)
+        candidates = {i for band in bands for i in self.buckets.get(band, ())}
+        if any(estimate_similarity(signature, self.signatures[i]) >= self.threshold for i in candidates):
+            return True
+        self.exact.add(key)
+        for band in bands:
+            self.buckets.setdefault(band, []).append(len(self.signatures))
+        self.signatures.append(signature)
+        return False
+
+
+class CleaningReport:
+    """Caracteres (y tokens, si se contaron) de cada PDF antes y después de la limpieza, y qué se quitó."""
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, filename, chars_before, chars_after, lines_removed, blocks_removed, pages_emptied,
+            tokens_before=None, tokens_after=None):
+        self.rows.append({"archivo": filename, "caracteres_antes": chars_before, "caracteres_despues": chars_after,
+                          "lineas_quitadas": lines_removed, "parrafos_duplicados": blocks_removed,
+                          "paginas_vaciadas": pages_emptied, "tokens_antes": tokens_before, "tokens_despues": tokens_after})
+
+    def totals(self):
+        total = {"archivo": "total"}
+        for field in ("caracteres_antes", "caracteres_despues", "lineas_quitadas", "parrafos_duplicados", "paginas_vaciadas"):
+            total[field] = sum(row[field] for row in self.rows)
+        counted = self.rows and all(row["tokens_antes"] is not None for row in self.rows)
+        total["tokens_antes"] = sum(row["tokens_antes"] for row in self.rows) if counted else None
+        total["tokens_despues"] = sum(row["tokens_despues"] for row in self.rows) if counted else None
+        return total
+
+    @staticmethod
+    def reduction(before, after):
+        return (1 - after / before) * 100 if before else 0.0
+
+    def row_text(self, row):
+        text = (f"{row['caracteres_antes']} -> {row['caracteres_despues']} caracteres "
+                f"(-{self.reduction(row['caracteres_antes'], row['caracteres_despues']):.1f}%)")
+        if row["tokens_antes"] is not None:
+            text += (f", {row['tokens_antes']} -> {row['tokens_despues']} tokens "
+                     f"(-{self.reduction(row['tokens_antes'], row['tokens_despues']):.1f}%)")
+        return (text + f"; {row['lineas_quitadas']} líneas de plantilla, {row['parrafos_duplicados']} párrafos duplicados, "
+                f"{row['paginas_vaciadas']} páginas vaciadas")
+
+    def stats_text(self):
+        return f"{len(self.rows)} PDFs, {self.row_text(self.totals())}"
+
+    def table_lines(self):
+        """Una línea por PDF y el total, para el registro o la consola."""
+        return [f"{row['archivo']}: {self.row_text(row)}" for row in self.rows + [self.totals()]]
+
+
+def clean_documents(documents, count_tokens=None):
+    """
+    Limpia el material extraído ([{"filename", "pages", "key"}]): corrige los artefactos de cada página,
+    quita las líneas de plantilla y los números de página, y deja solo la primera aparición de cada
+    párrafo repetido (exacto o casi igual, también entre PDFs distintos). Cada documento conserva su
+    número de páginas (las que quedan sin texto pasan a ""), así que los números de página no cambian.
+    Con count_tokens(texto) el informe incluye los tokens de cada PDF antes y después.
+    Devuelve (documentos limpios, CleaningReport).
+    """
+    normalized = [[normalize_page(page).splitlines() for page in doc["pages"]] for doc in documents]
+    keys_by_document = [[[line_key(line) for line in lines] for lines in pages] for pages in normalized]
+    boilerplate = find_boilerplate_lines(keys_by_document)
+    duplicates = DuplicateFinder()
+    report = CleaningReport()
+    cleaned_documents = []
+    for i, (doc, pages) in enumerate(zip(documents, normalized)):
+        lines_removed = blocks_removed = pages_emptied = 0
+        cleaned_pages = []
+        for page_number, (page_lines, page_keys) in enumerate(zip(pages, keys_by_document[i]), start=1):
+            lines = []
+            line_count = sum(1 for line in page_lines if line)
+            position = 0
+            for line, key in zip(page_lines, page_keys):
+                if line and (key in boilerplate[i] or is_page_number(line, position, line_count, page_number)):
+                    lines_removed += 1
+                else:
+                    lines.append(line)
+                position += bool(line)
+            blocks = []
+            for block in _PARAGRAPH_SPLIT_RE.split("\n".join(lines)):
+                block = block.strip()
+                if not block:
+                    continue
+                key = normalize_text(block)
+                if len(key.split()) >= MIN_DUPLICATE_BLOCK_WORDS and duplicates.seen(key):
+                    blocks_removed += 1
+                    continue
+                blocks.append(block)
+            cleaned_page = "\n\n".join(blocks)
+            pages_emptied += bool(page_lines) and not cleaned_page
+            cleaned_pages.append(cleaned_page)
+        cleaned_documents.append({"filename": doc["filename"], "pages": cleaned_pages, "key": doc.get("key")})
+        raw_text = PAGE_SEPARATOR.join(page for page in doc["pages"] if page)
+        cleaned_text = PAGE_SEPARATOR.join(page for page in cleaned_pages if page)
+        tokens = (count_tokens(raw_text), count_tokens(cleaned_text)) if count_tokens else (None, None)
+        report.add(doc["filename"], len(raw_text), len(cleaned_text), lines_removed, blocks_removed, pages_emptied, *tokens)
+    return cleaned_documents, report
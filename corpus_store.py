@@ -0,0 +1,232 @@
+import os
+import mmap
+import array
+import logging
+import tempfile
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración del almacén del material ---
+PAGE_SEPARATOR = "\n\n---\n\n" # El mismo separador que join_documents_text entre páginas
+ENCODING = "utf-8"
+ENCODING_ERRORS = "surrogatepass" # pypdf puede devolver sustitutos sueltos: que no rompan la escritura
+FILE_PREFIX = "corpus-"
+
+
+class ChunkRecord:
+    """
+    Pasaje del almacén. Solo guarda su posición: el archivo, la página y el texto se leen de las tablas
+    y del archivo mapeado al pedirlos. Mismos atributos que retrieval.Chunk.
+    """
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def filename(self):
+        return self.store.filenames[self.store.chunk_docs[self.index]]
+
+    @property
+    def page(self):
+        return self.store.chunk_pages[self.index]
+
+    @property
+    def text(self):
+        return self.store.chunk_text(self.index)
+
+    @property
+    def chars(self):
+        return self.store.chunk_chars[self.index]
+
+
+class ChunkRecords:
+    """Secuencia de los pasajes del almacén; los ChunkRecord se crean al acceder (no hay una lista en memoria)."""
+    __slots__ = ("store",)
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store.chunk_starts)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("pasaje fuera de rango")
+        return ChunkRecord(self.store, index)
+
+    def __iter__(self):
+        return (ChunkRecord(self.store, i) for i in range(len(self)))
+
+
+class PageList:
+    """Páginas de un documento del almacén, como secuencia de textos leídos del archivo mapeado."""
+    __slots__ = ("store", "first", "count")
+
+    def __init__(self, store, first, count):
+        self.store = store
+        self.first = first
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("página fuera de rango")
+        return self.store.page_text(self.first + index)
+
+    def __iter__(self):
+        return (self.store.page_text(self.first + i) for i in range(self.count))
+
+
+def _release(buffer, path):
+    """Cierra el mapeo y borra el archivo (si sigue existiendo) cuando el almacén deja de usarse."""
+    if isinstance(buffer, mmap.mmap):
+        buffer.close()
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class CorpusStore:
+    """
+    Material de estudio en un archivo mapeado en memoria en lugar de cadenas de Python:
+    - primero el texto completo (páginas no vacías unidas con PAGE_SEPARATOR, igual que join_documents_text),
+    - después el texto de cada pasaje del índice de recuperación.
+    Las tablas de posiciones son array compactos (bytes por página/pasaje, no objetos). Las páginas y los
+    pasajes se leen como cortes del archivo: el sistema comparte esas páginas de memoria y puede
+    descartarlas, y cada petición decodifica solo lo que envía.
+    El almacén es inmutable; una recarga construye otro y el anterior se libera cuando nadie lo usa.
+    """
+
+    def __init__(self):
+        self.filenames = []
+        self.keys = []
+        self.doc_pages = array.array("I") # Primera página de cada documento (+ total al final)
+        self.page_starts = array.array("Q") # Byte inicial de cada página en el archivo
+        self.page_lengths = array.array("I") # Bytes de cada página (0 = página sin texto)
+        self.chunk_starts = array.array("Q")
+        self.chunk_lengths = array.array("I")
+        self.chunk_chars = array.array("I") # Caracteres de cada pasaje (para presupuestar sin decodificarlo)
+        self.chunk_pages = array.array("I")
+        self.chunk_docs = array.array("I")
+        self.text_bytes = 0 # Tamaño en bytes del texto completo (al principio del archivo)
+        self.chars = 0 # Caracteres del texto completo
+        self.token_count = None # Tokens del texto completo, fijados por quien construye el almacén
+        self.path = None
+        self.buffer = b""
+        self.chunks = ChunkRecords(self)
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    @classmethod
+    def build(cls, documents, chunks=(), directory=None):
+        """
+        Escribe documents ([{"filename", "pages", "key"}]) y chunks (pasajes con filename/page/text) en un
+        archivo nuevo en directory (None = directorio temporal del sistema) y lo mapea en memoria.
+        """
+        store = cls()
+        separator = PAGE_SEPARATOR.encode(ENCODING)
+        doc_index = {}
+        fd, path = tempfile.mkstemp(prefix=FILE_PREFIX, suffix=".bin", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                offset = 0
+                for doc in documents:
+                    doc_index[doc["filename"]] = len(store.filenames)
+                    store.filenames.append(doc["filename"])
+                    store.keys.append(doc.get("key"))
+                    store.doc_pages.append(len(store.page_starts))
+                    for page_text in doc["pages"]:
+                        if not page_text:
+                            store.page_starts.append(offset)
+                            store.page_lengths.append(0)
+                            continue
+                        if offset:
+                            f.write(separator)
+                            offset += len(separator)
+                            store.chars += len(PAGE_SEPARATOR)
+                        data = page_text.encode(ENCODING, ENCODING_ERRORS)
+                        store.page_starts.append(offset)
+                        store.page_lengths.append(len(data))
+                        f.write(data)
+                        offset += len(data)
+                        store.chars += len(page_text)
+                store.doc_pages.append(len(store.page_starts))
+                store.text_bytes = offset
+                for chunk in chunks:
+                    text = chunk.text
+                    data = text.encode(ENCODING, ENCODING_ERRORS)
+                    store.chunk_starts.append(offset)
+                    store.chunk_lengths.append(len(data))
+                    store.chunk_chars.append(len(text))
+                    store.chunk_pages.append(chunk.page)
+                    store.chunk_docs.append(doc_index[chunk.filename])
+                    f.write(data)
+                    offset += len(data)
+            store._map(path, offset)
+        except BaseException:
+            _release(store.buffer, path)
+            raise
+        return store
+
+    def _map(self, path, size):
+        if size:
+            with open(path, "rb") as f:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # El mapeo conserva su propio descriptor
+        if os.name != "nt":
+            os.remove(path) # En POSIX el archivo sigue accesible mientras esté mapeado y no queda nada en disco
+            path = None
+        self.path = path # En Windows no se puede borrar mientras está mapeado: lo borra _release
+        weakref.finalize(self, _release, self.buffer, path)
+
+    def _decode(self, start, length):
+        return self.buffer[start:start + length].decode(ENCODING, ENCODING_ERRORS)
+
+    def page_text(self, index):
+        return self._decode(self.page_starts[index], self.page_lengths[index])
+
+    def chunk_text(self, index):
+        return self._decode(self.chunk_starts[index], self.chunk_lengths[index])
+
+    def full_text(self):
+        """El texto completo del material (una cadena nueva en cada llamada; ver cached)."""
+        return self._decode(0, self.text_bytes)
+
+    def prefix_text(self, max_bytes):
+        """Como mucho los primeros max_bytes del texto completo (sin cortar un carácter por la mitad)."""
+        return self.buffer[:min(max_bytes, self.text_bytes)].decode(ENCODING, "ignore")
+
+    def documents(self):
+        """Los documentos del almacén ({"filename", "pages", "key"}), con las páginas leídas del archivo."""
+        return [{"filename": filename, "key": key,
+                 "pages": PageList(self, self.doc_pages[i], self.doc_pages[i + 1] - self.doc_pages[i])}
+                for i, (filename, key) in enumerate(zip(self.filenames, self.keys))]
+
+    def cached(self, name, build):
+        """
+        Valor derivado del almacén calculado una sola vez (p.ej. el mensaje de material del prompt):
+        las peticiones lo comparten en lugar de armar cada una su copia.
+        """
+        with self._cache_lock:
+            if name not in self._cache:
+                self._cache[name] = build()
+            return self._cache[name]
+
+    def memory_text(self):
+        """Resumen de tamaños: archivo mapeado frente a las tablas que sí viven en la memoria de Python."""
+        tables = sum(table.itemsize * len(table) for table in (
+            self.doc_pages, self.page_starts, self.page_lengths, self.chunk_starts, self.chunk_lengths,
+            self.chunk_chars, self.chunk_pages, self.chunk_docs))
+        return (f"{len(self.filenames)} PDFs, {len(self.page_starts)} páginas, {len(self.chunk_starts)} pasajes; "
+                f"archivo mapeado {len(self.buffer) / 1024:.0f} KB, tablas {tables / 1024:.1f} KB")
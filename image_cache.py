@@ -0,0 +1,230 @@
+import os
+import json
+import zlib
+import base64
+import logging
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+try:
+    import numpy as np # Opcional: acelera el hash y la búsqueda por distancia de Hamming
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración de la caché de respuestas por imagen ---
+IMAGE_CACHE_MAX_ENTRIES = 200 # Límite LRU de capturas guardadas
+HASH_SIZE = 16 # dHash de 16x16 = 256 bits (más fino que el clásico de 8x8: preguntas parecidas no coinciden)
+MAX_HAMMING_DISTANCE = 8 # Bits distintos (de 256) para considerar dos capturas la misma
+MAX_SIZE_RATIO = 1.15 # Capturas de tamaños muy distintos no son la misma región aunque se parezcan
+# El dHash no distingue "control 12" de "control 13": cada candidato se verifica con la máscara de tinta
+# (píxeles de texto) del contenido, y solo se reutiliza la respuesta si casi no cambia ningún píxel
+INK_THRESHOLD = 48 # Diferencia de gris con el fondo a partir de la cual un píxel es tinta
+MASK_MAX_WIDTH = 640 # Ancho máximo de la máscara de tinta (a más, más sensible a cambios de un carácter)
+MAX_MASK_DIFF = 3 # Píxeles de la máscara que pueden cambiar (un carácter distinto cambia decenas; la pantalla no tiene ruido)
+CACHE_FILE_VERSION = 1
+
+
+class ImageFingerprint:
+    """Huella de una captura: dHash y máscara de tinta del contenido (sin márgenes) y tamaño del contenido."""
+    __slots__ = ("hash", "mask", "mask_size", "size")
+
+    def __init__(self, image_hash, mask, mask_size, size):
+        self.hash = image_hash
+        self.mask = mask
+        self.mask_size = tuple(mask_size)
+        self.size = tuple(size)
+
+
+def ink_table(background):
+    """Tabla para Image.point: 255 para los grises que se alejan del fondo más de INK_THRESHOLD (tinta), 0 para el resto."""
+    return [255 if abs(value - background) > INK_THRESHOLD else 0 for value in range(256)]
+
+def content_crop(image):
+    """
+    La captura en escala de grises recortada al contenido (lo que no es del color de fondo dominante):
+    volver a seleccionar la misma pregunta con otro margen da el mismo recorte. Devuelve (recorte, fondo).
+    """
+    gray = image.convert("L")
+    histogram = gray.reduce(4).histogram() if min(gray.size) >= 64 else gray.histogram() # El fondo domina también reducida
+    background = histogram.index(max(histogram))
+    box = gray.point(ink_table(background)).getbbox()
+    return (gray.crop(box) if box else gray), background
+
+def ink_mask(gray, background, max_width=MASK_MAX_WIDTH):
+    """Máscara de tinta (1 bit por píxel, filas empaquetadas) de un recorte reducido a max_width de ancho."""
+    if gray.width > max_width:
+        gray = gray.resize((max_width, max(1, round(gray.height * max_width / gray.width))), resample=Image.BOX)
+    mask = gray.point(ink_table(background)).convert("1")
+    return mask.tobytes(), mask.size
+
+def fingerprint(image):
+    """Huella (ImageFingerprint) de una captura PIL para buscarla en la caché."""
+    gray, background = content_crop(image)
+    mask, mask_size = ink_mask(gray, background)
+    return ImageFingerprint(dhash(gray), mask, mask_size, gray.size)
+
+def dhash(image, hash_size=HASH_SIZE):
+    """
+    Hash perceptual por diferencias (dHash) de una imagen PIL: la captura reducida a escala de grises de
+    (hash_size + 1) x hash_size y un bit por cada par de píxeles vecinos (1 si el derecho es más claro).
+    Resiste la recompresión y pequeños cambios de brillo; devuelve hash_size² bits como bytes.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), resample=Image.BOX)
+    if np is not None:
+        pixels = np.asarray(small, dtype=np.int16)
+        return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes()
+    pixels = list(small.getdata())
+    width = hash_size + 1
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[row * width + col + 1] > pixels[row * width + col])
+    return value.to_bytes(hash_size * hash_size // 8, "big")
+
+def hamming_distance(hash_a, hash_b):
+    return bin(int.from_bytes(hash_a, "big") ^ int.from_bytes(hash_b, "big")).count("1")
+
+def similar_size(size_a, size_b, max_ratio=MAX_SIZE_RATIO):
+    return all(max(a, b) <= min(a, b) * max_ratio for a, b in zip(size_a, size_b))
+
+def same_ink(entry, image_fingerprint, max_diff=MAX_MASK_DIFF):
+    """True si la máscara de tinta de la entrada y la de la huella son del mismo tamaño y casi idénticas."""
+    return (entry["mask_size"] == image_fingerprint.mask_size
+            and hamming_distance(entry["mask"], image_fingerprint.mask) <= max_diff)
+
+
+class ImageAnswerCache:
+    """
+    Caché LRU de respuestas a capturas de área, indexada por dHash: una captura cuyo contenido es igual
+    o casi igual (distancia de Hamming <= max_distance, tamaño parecido y la misma máscara de tinta) a uno
+    ya respondido reutiliza la respuesta sin OCR, sin codificar la imagen y sin llamar a la API. Cada
+    entrada guarda también cuánto tardó la respuesta original, para estimar el tiempo ahorrado.
+    """
+
+    def __init__(self, path=None, max_entries=IMAGE_CACHE_MAX_ENTRIES, max_distance=MAX_HAMMING_DISTANCE):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.entries = OrderedDict() # hash en hex -> {"hash", "size", "mask", "mask_size", "answer", "ms"}
+        self.lock = threading.Lock()
+        self._matrix = None # Hashes de las entradas como matriz de bytes (NumPy), reconstruida al cambiar
+        self._matrix_keys = []
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0 # Candidatos del dHash descartados por la máscara de tinta (texto distinto)
+        self.saved_ms = 0.0
+        if path:
+            self.load()
+
+    def get(self, image_fingerprint):
+        """Devuelve (respuesta, ms que tardó la original, distancia) de la captura más parecida, o None."""
+        with self.lock:
+            key, distance = self._nearest_locked(image_fingerprint)
+            entry = self.entries.get(key) if key is not None else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.saved_ms += entry["ms"]
+            return entry["answer"], entry["ms"], distance
+
+    def _nearest_locked(self, image_fingerprint):
+        """Clave de la entrada más cercana dentro de max_distance, de tamaño parecido y con la misma tinta, y su distancia."""
+        if not self.entries:
+            return None, None
+        image_hash = image_fingerprint.hash
+        if np is not None:
+            if self._matrix is None:
+                self._matrix_keys = list(self.entries)
+                self._matrix = np.frombuffer(b"".join(self.entries[k]["hash"] for k in self._matrix_keys),
+                                             dtype=np.uint8).reshape(len(self._matrix_keys), -1)
+            target = np.frombuffer(image_hash, dtype=np.uint8)
+            distances = np.unpackbits(self._matrix ^ target, axis=1).sum(axis=1)
+            candidates = ((int(distances[i]), self._matrix_keys[i]) for i in np.argsort(distances, kind="stable")
+                          if distances[i] <= self.max_distance)
+        else:
+            candidates = sorted((hamming_distance(image_hash, entry["hash"]), key) for key, entry in self.entries.items()
+                                if len(entry["hash"]) == len(image_hash))
+        for distance, key in candidates:
+            if distance > self.max_distance:
+                break
+            entry = self.entries[key]
+            if not similar_size(entry["size"], image_fingerprint.size):
+                continue
+            if same_ink(entry, image_fingerprint):
+                return key, distance
+            self.rejected += 1
+            logger.debug("Captura casi igual a una de la caché (distancia %d) pero con otro texto: no se reutiliza.", distance)
+        return None, None
+
+    def put(self, image_fingerprint, answer, elapsed_ms):
+        """Guarda la respuesta de una captura (y lo que tardó en obtenerse) y persiste la caché en disco."""
+        key = image_fingerprint.hash.hex()
+        with self.lock:
+            self.entries[key] = {"hash": image_fingerprint.hash, "size": image_fingerprint.size,
+                                 "mask": image_fingerprint.mask, "mask_size": image_fingerprint.mask_size,
+                                 "answer": answer, "ms": elapsed_ms}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False) # Expulsar la menos usada recientemente
+            self._matrix = None
+            if self.path:
+                self._save_locked()
+
+    def stats_text(self):
+        """Texto corto con la tasa de aciertos y el tiempo ahorrado estimado."""
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0.0
+        rejected = f", {self.rejected} casi iguales con otro texto" if self.rejected else ""
+        return f"{self.hits}/{lookups} aciertos ({rate:.0f}%){rejected}, ~{self.saved_ms / 1000:.1f} s ahorrados"
+
+    def clear(self):
+        """Vacía la caché en memoria y en disco."""
+        with self.lock:
+            self.entries.clear()
+            self._matrix = None
+            if self.path and os.path.isfile(self.path):
+                os.remove(self.path)
+
+    def load(self):
+        """Carga la caché desde disco (ignora archivos inexistentes, corruptos o de otra versión)."""
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CACHE_FILE_VERSION or data.get("hash_size") != HASH_SIZE:
+                return
+            for item in data.get("entries", [])[-self.max_entries:]:
+                image_hash = bytes.fromhex(item["hash"])
+                self.entries[item["hash"]] = {"hash": image_hash, "size": tuple(item["size"]),
+                                              "mask": zlib.decompress(base64.b64decode(item["mask"])),
+                                              "mask_size": tuple(item["mask_size"]),
+                                              "answer": item["answer"], "ms": float(item.get("ms", 0.0))}
+            logger.info("Caché de respuestas por imagen cargada: %s entradas.", len(self.entries))
+        except (OSError, ValueError, KeyError, TypeError, zlib.error) as e:
+            logger.warning("No se pudo cargar la caché de respuestas por imagen (%s): %s", self.path, e)
+
+    def _save_locked(self):
+        """Escribe la caché a disco de forma atómica (debe llamarse con el lock tomado)."""
+        data = {
+            "version": CACHE_FILE_VERSION,
+            "hash_size": HASH_SIZE,
+            # En orden LRU: la última es la usada más recientemente
+            # La máscara de tinta se guarda comprimida (casi todo es fondo) y en base64
+            "entries": [{"hash": key, "size": list(e["size"]), "answer": e["answer"], "ms": round(e["ms"], 1),
+                         "mask": base64.b64encode(zlib.compress(e["mask"])).decode("ascii"), "mask_size": list(e["mask_size"])}
+                        for key, e in self.entries.items()],
+        }
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("No se pudo guardar la caché de respuestas por imagen: %s", e)
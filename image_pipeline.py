@@ -0,0 +1,119 @@
+import io
+import time
+import base64
+from PIL import Image, ImageOps
+
+# --- Configuración por defecto de la codificación de capturas ---
+# Las capturas de preguntas son texto: 1600 px en el lado largo se leen bien y pesan mucho menos
+# que una captura completa de una pantalla de alta densidad.
+DEFAULT_SETTINGS = {
+    "max_long_edge": 1600, # Píxeles del lado largo tras reescalar (None = sin reescalar)
+    "grayscale": True, # Convertir a escala de grises (el color rara vez importa en una pregunta)
+    "autocontrast": True, # Normalizar el contraste para texto más legible tras reducir
+    "format": "JPEG", # "PNG", "JPEG" o "WEBP"
+    "quality": 85, # Calidad inicial para JPEG/WEBP
+    "min_quality": 45, # Calidad mínima antes de empezar a reducir resolución
+    "byte_budget": 250_000, # Tamaño máximo del archivo codificado (antes de base64); None = sin límite
+}
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+QUALITY_STEP = 10
+DOWNSCALE_STEP = 0.8 # Factor de reducción cuando la calidad mínima no basta para el presupuesto
+MIN_LONG_EDGE = 480 # No reducir por debajo de esto: el texto dejaría de ser legible
+
+
+def _encode(image, image_format, quality):
+    buffered = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffered, format="PNG", optimize=False)
+    elif image_format == "JPEG":
+        image.save(buffered, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buffered, format=image_format, quality=quality, method=4)
+    return buffered.getvalue()
+
+def _resize_long_edge(image, long_edge):
+    width, height = image.size
+    scale = long_edge / max(width, height)
+    if scale >= 1:
+        return image
+    return image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+def prepare_image(image_pil, settings=None):
+    """
+    Reescala y normaliza la captura según la configuración.
+    Devuelve (imagen, tiempos_ms) con los tiempos de cada etapa.
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    timings = {}
+    image = image_pil
+
+    start = time.perf_counter()
+    if settings["max_long_edge"]:
+        image = _resize_long_edge(image, settings["max_long_edge"])
+    timings["reescalado"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    if settings["grayscale"]:
+        image = ImageOps.grayscale(image)
+    if settings["autocontrast"]:
+        image = ImageOps.autocontrast(image, cutoff=1)
+    if settings["format"] == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    timings["normalizacion"] = (time.perf_counter() - start) * 1000
+    return image, timings
+
+def encode_image(image_pil, settings=None):
+    """
+    Prepara y codifica una captura intentando no superar el presupuesto de bytes:
+    primero baja la calidad (formatos con pérdida) y, si no basta, la resolución.
+    Devuelve (base64, tipo_mime, informe) donde informe tiene tiempos por etapa y tamaños.
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    image_format = settings["format"].upper()
+    if image_format not in MIME_TYPES:
+        raise ValueError(f"Formato de imagen no soportado: {image_format}")
+    total_start = time.perf_counter()
+    image, timings = prepare_image(image_pil, settings)
+
+    start = time.perf_counter()
+    quality = settings["quality"]
+    data = _encode(image, image_format, quality)
+    attempts = 1
+    budget = settings["byte_budget"]
+    while budget and len(data) > budget:
+        if image_format != "PNG" and quality - QUALITY_STEP >= settings["min_quality"]:
+            quality -= QUALITY_STEP
+        elif max(image.size) * DOWNSCALE_STEP >= MIN_LONG_EDGE:
+            image = _resize_long_edge(image, int(max(image.size) * DOWNSCALE_STEP))
+        else:
+            break # Presupuesto inalcanzable sin perder legibilidad: se envía lo mejor conseguido
+        data = _encode(image, image_format, quality)
+        attempts += 1
+    timings["codificacion"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    image_base64 = base64.b64encode(data).decode("utf-8")
+    timings["base64"] = (time.perf_counter() - start) * 1000
+
+    report = {
+        "original_size": image_pil.size,
+        "final_size": image.size,
+        "format": image_format,
+        "quality": quality if image_format != "PNG" else None,
+        "bytes": len(data),
+        "base64_chars": len(image_base64),
+        "attempts": attempts,
+        "over_budget": bool(budget and len(data) > budget),
+        "timings_ms": timings,
+        "total_ms": (time.perf_counter() - total_start) * 1000,
+    }
+    return image_base64, MIME_TYPES[image_format], report
+
+def format_report(report):
+    """Línea de log con tamaños y tiempos por etapa."""
+    stages = ", ".join(f"{name} {ms:.1f} ms" for name, ms in report["timings_ms"].items())
+    quality = f" q{report['quality']}" if report["quality"] else ""
+    budget_note = " (supera el presupuesto)" if report["over_budget"] else ""
+    return (f"{report['original_size'][0]}x{report['original_size'][1]} -> {report['final_size'][0]}x{report['final_size'][1]} "
+            f"{report['format']}{quality}, {report['bytes'] / 1024:.0f} KB{budget_note} en {report['total_ms']:.1f} ms "
+            f"({stages}; {report['attempts']} intento(s))")
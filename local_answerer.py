@@ -0,0 +1,166 @@
+import re
+import time
+import logging
+import weakref
+
+try:
+    import numpy as np # Opcional: sin NumPy no hay respuestas locales (todo va a la API)
+except ImportError:
+    np = None
+
+from answer_cache import split_options
+from retrieval import tokenize, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración del respondedor local ---
+MIN_SCORE = 0.5 # Puntuación mínima (0-1) de la mejor alternativa para responder sin la API
+MIN_MARGIN = 0.25 # Ventaja mínima de la mejor alternativa sobre la segunda
+CANDIDATE_PASSAGES = 12 # Pasajes del índice BM25 entre los que se buscan las alternativas
+WINDOW_LINES = 3 # Líneas consecutivas de un pasaje que forman una ventana (una diapositiva parte las frases en líneas)
+STEM_FLOOR = 0.25 # Peso de una ventana que no menciona nada del enunciado (0 = solo cuentan las que sí)
+STEM_PREFIX = 6 # Los términos se recortan a este prefijo: "mitigation"/"mitigacion" y plurales coinciden
+
+# Alternativas que dependen de las demás ("todas las anteriores") y enunciados negados ("¿cuál NO...?"):
+# puntuar cada alternativa por separado daría justo la respuesta contraria, así que se dejan a la API
+_DEPENDENT_OPTION_RE = re.compile(r"\b(todas|ninguna|ambas|all of the above|none of the above|both)\b")
+# (un "no" cualquiera no basta: "garantiza que la información no sea modificada" no pide la incorrecta)
+_NEGATED_STEM_RE = re.compile(r"\b(excepto|salvo|except|incorrect[ao]?|fals[ao]|false|no (es|son|corresponde|pertenece"
+                              r"|se considera|incluye)|is not|are not|does not|not (a|an|one|true|part)\b)")
+_EMPHASIZED_NEGATION_RE = re.compile(r"\b(NO|NOT|EXCEPTO|EXCEPT|SALVO)\b") # "¿Cuál NO es...?"
+_LINE_SPLIT_RE = re.compile(r"\n|(?<=[.;])\s+")
+
+_prefix_idf_cache = weakref.WeakKeyDictionary() # índice -> {prefijo: idf}, se calcula una vez por índice
+
+
+class LocalAnswer:
+    """
+    Resultado del respondedor local: la alternativa mejor puntuada (letra y texto), su puntuación,
+    la ventaja sobre la segunda y si supera los umbrales (confident). Si no es confiable, reason
+    explica por qué y la respuesta solo sirve como último recurso sin conexión.
+    """
+    __slots__ = ("letter", "text", "score", "margin", "scores", "confident", "reason", "ms")
+
+    def __init__(self, letter, text, score, margin, scores, confident, reason=None, ms=0.0):
+        self.letter = letter
+        self.text = text
+        self.score = score
+        self.margin = margin
+        self.scores = scores
+        self.confident = confident
+        self.reason = reason
+        self.ms = ms
+
+    @property
+    def answer(self):
+        """La respuesta con el formato que piden las instrucciones del prompt: "b) texto de la alternativa"."""
+        return f"{self.letter}) {self.text}"
+
+    def summary_text(self):
+        scores = " ".join(f"{letter}={score:.2f}" for letter, score in self.scores)
+        return f"{self.answer} (puntuación {self.score:.2f}, margen {self.margin:.2f}; {scores})"
+
+
+def local_answering_available():
+    return np is not None
+
+def stem_terms(text):
+    """Términos del texto recortados a STEM_PREFIX caracteres, sin repetir y en orden de aparición."""
+    return list(dict.fromkeys(term[:STEM_PREFIX] for term in tokenize(text)))
+
+def prefix_idf(index):
+    """IDF de cada prefijo de término del índice (el mayor de los términos que lo comparten)."""
+    idf = _prefix_idf_cache.get(index)
+    if idf is None:
+        idf = {}
+        for term, value in index.idf.items():
+            prefix = term[:STEM_PREFIX]
+            if value > idf.get(prefix, 0.0):
+                idf[prefix] = value
+        _prefix_idf_cache[index] = idf
+    return idf
+
+def candidate_windows(index, query, top_k=CANDIDATE_PASSAGES, window_lines=WINDOW_LINES):
+    """Ventanas de líneas consecutivas de los pasajes más relevantes para query (texto de cada una)."""
+    windows = []
+    for chunk_id, _score in index.search(query, top_k=top_k):
+        lines = [line.strip() for line in _LINE_SPLIT_RE.split(index.chunks[chunk_id].text) if line.strip()]
+        if len(lines) <= window_lines:
+            windows.append(" ".join(lines))
+            continue
+        windows += [" ".join(lines[i:i + window_lines]) for i in range(len(lines) - window_lines + 1)]
+    return windows
+
+def score_options(stem, options, windows, idf):
+    """
+    Puntuación (0-1) de cada alternativa: la mejor ventana del material según qué parte de la alternativa
+    contiene (términos ponderados por IDF) multiplicada por cuánto del enunciado aparece en ella.
+    Los términos del enunciado no cuentan para las alternativas y los que comparten varias alternativas
+    se reparten entre ellas, para que decida lo que las distingue. Devuelve un array por alternativa.
+    """
+    stem_set = set(stem_terms(stem))
+    option_terms = [[term for term in stem_terms(text) if term not in stem_set] for _letter, text in options]
+    vocabulary = {}
+    for term in list(stem_set) + [term for terms in option_terms for term in terms]:
+        vocabulary.setdefault(term, len(vocabulary))
+    default_idf = max(idf.values(), default=1.0) # Un término que no está en el material pesa como el más raro
+    weights = np.array([idf.get(term, default_idf) for term in vocabulary], dtype=np.float64)
+
+    # Ventanas x términos: 1 si la ventana contiene el término
+    incidence = np.zeros((len(windows), len(vocabulary)), dtype=np.float64)
+    for row, window in enumerate(windows):
+        columns = [vocabulary[term] for term in set(stem_terms(window)) if term in vocabulary]
+        incidence[row, columns] = 1.0
+
+    option_matrix = np.zeros((len(options), len(vocabulary)), dtype=np.float64)
+    for row, terms in enumerate(option_terms):
+        option_matrix[row, [vocabulary[term] for term in terms]] = 1.0
+    shared = option_matrix.sum(axis=0)
+    option_matrix *= weights / np.maximum(shared, 1.0)
+    option_totals = option_matrix.sum(axis=1)
+    option_coverage = (incidence @ option_matrix.T) / np.maximum(option_totals, 1e-9) # ventanas x alternativas
+
+    stem_vector = np.zeros(len(vocabulary), dtype=np.float64)
+    stem_vector[[vocabulary[term] for term in stem_set]] = 1.0
+    stem_vector *= weights
+    stem_total = stem_vector.sum()
+    stem_coverage = incidence @ stem_vector / stem_total if stem_total else np.ones(len(windows))
+
+    relevance = (STEM_FLOOR + (1 - STEM_FLOOR) * stem_coverage)[:, None]
+    return (option_coverage * relevance).max(axis=0)
+
+def answer_locally(question, index, min_score=MIN_SCORE, min_margin=MIN_MARGIN):
+    """
+    Intenta responder una pregunta de opción múltiple con el material (índice de recuperación).
+    Devuelve None si no aplica (sin NumPy, sin índice, sin alternativas, enunciado negado o alternativas
+    del tipo "todas las anteriores"); si no, un LocalAnswer, confiable o no según los umbrales.
+    """
+    if np is None or index is None or not index.chunks:
+        return None
+    started = time.perf_counter()
+    stem, options = split_options(question)
+    if not options:
+        return None
+    if _NEGATED_STEM_RE.search(normalize_text(stem)) or _EMPHASIZED_NEGATION_RE.search(stem):
+        logger.debug("Respuesta local descartada: enunciado negado.")
+        return None
+    if any(_DEPENDENT_OPTION_RE.search(normalize_text(text)) for _letter, text in options):
+        logger.debug("Respuesta local descartada: alternativas que dependen de las demás.")
+        return None
+    windows = candidate_windows(index, question)
+    if not windows:
+        return None
+    scores = score_options(stem, options, windows, prefix_idf(index))
+    order = np.argsort(-scores, kind="stable")
+    best = int(order[0])
+    best_score = float(scores[best])
+    margin = best_score - (float(scores[order[1]]) if len(order) > 1 else 0.0)
+    reason = None
+    if best_score < min_score:
+        reason = f"puntuación {best_score:.2f} < {min_score:.2f}"
+    elif margin < min_margin:
+        reason = f"margen {margin:.2f} < {min_margin:.2f}"
+    letter, text = options[best]
+    return LocalAnswer(letter, text, best_score, margin,
+                       [(option_letter, round(float(score), 3)) for (option_letter, _text), score in zip(options, scores)],
+                       confident=reason is None, reason=reason, ms=(time.perf_counter() - started) * 1000)
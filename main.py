@@ -1,21 +1,33 @@
 import os
 import time
+STARTUP_STARTED_AT = time.perf_counter() # Referencia para medir el arranque (ver mark_startup)
 import tkinter as tk
 import threading
-from dotenv import load_dotenv
-from openai import OpenAI
-from pypdf import PdfReader
 import pyperclip # Descomentado
-import httpx
-import mss # Para capturas de pantalla
-from PIL import Image, ImageDraw # Para procesar la imagen capturada y crear el icono
-import io # Para manejar streams de bytes (para la imagen)
-import base64 # Para codificar la imagen para la API
+# mss (capturas), PIL (imagen e icono), pynput (clics globales), pystray (bandeja), openai y pypdf
+# se importan donde se usan: así la ventana aparece sin esperar a que carguen (ver preload_modules)
 # import keyboard # Comentado temporalmente
 import signal # Para manejar Ctrl+C
 import sys # Para sys.exit
-from pynput import mouse # Para escuchar clics del mouse globales
-import pystray # Para el icono en la bandeja del sistema
+import importlib # Para precargar módulos en segundo plano (ver preload_modules)
+import argparse # Para las opciones de línea de comandos
+import logging # Registro por niveles (ver configure_logging)
+import multiprocessing # Para la extracción paralela de PDFs
+from answer_cache import AnswerCache # Caché de respuestas con detección de casi-duplicados
+from image_cache import ImageAnswerCache, fingerprint # Caché de respuestas a capturas de área por hash perceptual
+import assistant_core as core # Material de estudio, prompt y llamadas a OpenAI (sin interfaz)
+from assistant_core import get_routed_answer, get_answer_with_cache, encode_image_to_base64, format_display_text
+from request_scheduler import RequestScheduler, RequestCancelled # Cola de peticiones con "gana la última"
+from resilience import ApiError # Fallos de la API ya clasificados (tras reintentos)
+from ocr import ocr_available, extract_question_text, PathStats # OCR local opcional (Tesseract)
+from clipboard_watcher import ClipboardWatcher, create_backend as create_clipboard_backend # Cambios del portapapeles
+from region_watcher import RegionWatcher, WatchStats, region_watch_available # Vigilancia de una región fija de la pantalla
+from ui_dispatcher import UiDispatcher # Cola única (con fusión por fotograma) de las actualizaciones de la ventana
+import profiler # Perfilado bajo demanda (cProfile/muestreo + tracemalloc) de todos los hilos
+from tracing import Tracer, configure_logging, span # Trazas por etapa (JSONL) y métricas (Prometheus)
+MODULES_LOADED_AT = time.perf_counter()
+
+logger = logging.getLogger("asistente")
 
 # Bandera global para controlar la ejecución de hilos
 app_running = True
@@ -35,72 +47,52 @@ mouse_listener = None
 selecting_area = False # Bandera para indicar si estamos en modo selección
 
 # --- Configuración ---
-PDF_DIRECTORY = "pdfs"
 # Márgenes globales para el posicionamiento de la ventana
 MARGIN_PERCENT_X = 0.01  # 1% de margen desde el borde derecho
 MARGIN_PERCENT_Y = 0.01  # 1% de margen desde el borde inferior
 
-PROMPT_INSTRUCTIONS = """
-Tu tarea principal es responder la pregunta proporcionada de la manera más precisa y concisa posible.
-
-Considera los siguientes tipos de pregunta:
-
-1. PREGUNTA CON OPCIONES MÚLTIPLES EXPLÍCITAS (ej: con a), b), c)):
-   - Identifica la alternativa correcta.
-   - RESPONDE ÚNICAMENTE con la letra de la alternativa y el texto completo de esa alternativa (ej: "a) El proceso de transformación digital.", "b) Se refiere a la capacidad de adaptación.").
-
-2. PREGUNTA DIRECTA O DE CONOCIMIENTO (que busca una única respuesta fáctica, sin opciones explícitas en la pregunta):
-   - Proporciona la respuesta correcta y concisa.
-   - FORMATEA ESTA RESPUESTA COMO SI FUERA LA PRIMERA ALTERNATIVA, utilizando "a)" seguido de la respuesta (ej: si la pregunta es "¿Color del cielo?", responde "a) Azul").
-
-3. PREGUNTA PARA COMPLETAR LA ORACIÓN (ej: "El sol sale por el ____."):
-   - Proporciona la palabra o frase corta que completa correctamente la oración.
-
-
-En todos los casos, DEBES proporcionar una respuesta y seguir ESTRICTAMENTE este orden de prioridad para la información:
-1. EXCLUSIVAMENTE el material de estudio adjunto (PDFs).
-2. Si se proporciona una imagen, basa tu respuesta PRINCIPALMENTE en la imagen, complementada por el material de estudio.
-3. Solo como ÚLTIMO RECURSO, si la información no está en el material ni en la imagen, usa tu conocimiento general.
-
-NO INCLUYAS EXPLICACIONES, saludos, ni ningún otro texto adicional. Solo la respuesta directa según el tipo de pregunta y formato especificado.
-
-Material de estudio adjunto (PDFs):
----
-{pdf_context}
----
-
-Pregunta del usuario (y posible imagen adjunta):
----
-{user_question}
----
-
-RESPUESTA (según el tipo de pregunta, ver instrucciones arriba):
-"""
-POLL_INTERVAL_SECONDS = 1 # Segundos entre chequeos del portapapeles
+POLL_INTERVAL_SECONDS = 1 # Segundos entre chequeos mientras el monitoreo está en pausa
+# Detección de cambios del portapapeles: "auto" usa el mecanismo nativo (Windows: número de secuencia,
+# Linux: eventos XFixes) y si no está disponible, sondeo con intervalo adaptativo
+CLIPBOARD_BACKEND = "auto" # "auto", "windows", "xfixes" o "polling"
+CLIPBOARD_DEBOUNCE_SECONDS = 0.3 # Copias seguidas dentro de esta ventana se agrupan en una sola pregunta
+CLIPBOARD_POLL_MIN_SECONDS = 0.15 # Sondeo: intervalo tras actividad reciente
+CLIPBOARD_POLL_MAX_SECONDS = 2.0 # Sondeo: intervalo máximo en reposo
+MAX_CONCURRENT_REQUESTS = 2 # Peticiones simultáneas a la API como máximo
+# OCR local de capturas de área: si lee la pregunta con confianza suficiente se envía como texto
+# (más rápido y barato que la imagen). Requiere pytesseract y Tesseract instalados.
+USE_OCR = True
+OCR_MIN_CONFIDENCE = 80 # Confianza media mínima (0-100) para fiarse del texto leído
+OCR_MIN_CHARS = 15 # Menos texto que esto probablemente no es una pregunta completa
+TESSERACT_CMD = os.getenv("TESSERACT_CMD") # Ruta al ejecutable si no está en el PATH (p.ej. en Windows)
+# Pregunta que acompaña a la captura en el camino de imagen, adaptada para ambos tipos de pregunta
+AREA_IMAGE_QUESTION = "Esta imagen contiene una pregunta (puede ser de opción múltiple o para completar). Analiza la imagen y, utilizando también el material de estudio adjunto, proporciona la respuesta correcta y concisa. Si es de opción múltiple, responde con la letra y las primeras palabras de la alternativa. Si es para completar, responde solo con la palabra o frase corta que completa la oración."
+# Vigilancia de región: se selecciona una vez y cada pregunta nueva que aparece en ella se responde sola
+WATCH_CAPTURES_PER_SECOND = 4.0
+WATCH_CHANGE_THRESHOLD = 0.005 # Proporción de píxeles que deben cambiar (respecto a la última pregunta enviada)
+WATCH_STABLE_SECONDS = 0.5 # El contenido nuevo debe quedarse quieto este tiempo antes de enviarse
+# Registro y trazas: cada petición se mide por etapas (detección, captura, codificación, prompt, API, copia, etiqueta)
+LOG_LEVEL = "INFO" # "DEBUG" muestra también los pasos internos de captura y selección
+LOG_FILE = None # Ruta de un archivo de log adicional (None = solo consola)
+TRACING_ENABLED = True # False (o --sin-trazas) mantiene las métricas solo en memoria
+TRACE_DIRECTORY = "telemetria"
+TRACE_JSONL_FILENAME = "spans.jsonl" # Un tramo por línea
+METRICS_FILENAME = "metricas.prom" # Formato de texto de Prometheus (p.ej. para el textfile collector)
 WINDOW_WIDTH = 200 # Ancho de la ventana
 WINDOW_HEIGHT = 50 # Alto de la ventana (reducido al quitar el botón)
+IDLE_LABEL_TEXT = "Esperando..."
+LOADING_LABEL_TEXT = "Cargando material..." # Mientras el material se carga en segundo plano
+RELOADING_LABEL_TEXT = "Recargando material..." # Al detectar cambios en el directorio de PDFs
+RELOAD_STATUS_SECONDS = 3 # Tiempo que se ve el resultado de una recarga antes de volver al texto anterior
 # SCREENSHOT_HOTKEY = "ctrl+alt+s" # Comentado temporalmente
 
-# --- Carga de Clave API ---
-load_dotenv()
-API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    raise ValueError("No se encontró la variable de entorno OPENAI_API_KEY. Asegúrate de que esté en el archivo .env")
-
-# Inicializar OpenAI con un cliente httpx personalizado
-# Esto puede ayudar a evitar problemas con la configuración de proxies del entorno.
-try:
-    custom_httpx_client = httpx.Client(trust_env=False)
-    client = OpenAI(api_key=API_KEY, http_client=custom_httpx_client)
-except Exception as e_httpx:
-    print(f"Error al inicializar OpenAI con httpx.Client(trust_env=False): {e_httpx}")
-    print("Intentando inicialización simple de OpenAI (puede fallar si el problema de proxy persiste)...")
-    client = OpenAI(api_key=API_KEY) # Fallback a la original si la nueva falla por otra razón
-
 # --- Funciones ---
 
-def force_window_to_bottom_right_corner(window_obj):
-    """Fuerza la ventana a la esquina inferior derecha y la mantiene encima, intentándolo dos veces."""
+def force_window_to_bottom_right_corner(window_obj, force=True):
+    """
+    Fuerza la ventana a la esquina inferior derecha y la mantiene encima, intentándolo dos veces.
+    Sin force no hace nada si la ventana ya está ahí (cada respuesta de área la pide; no hace falta moverla).
+    """
     if not (window_obj and window_obj.winfo_exists()):
         return
 
@@ -114,7 +106,9 @@ def force_window_to_bottom_right_corner(window_obj):
     y = screen_height - WINDOW_HEIGHT - margin_y_pixels
     
     new_geometry = f"{WINDOW_WIDTH}x{WINDOW_HEIGHT}+{x}+{y}"
-    
+    if not force and getattr(window_obj, "last_known_geometry", None) == new_geometry:
+        return
+
     # Primer intento
     window_obj.geometry(new_geometry)
     window_obj.attributes("-topmost", True)
@@ -129,104 +123,31 @@ def force_window_to_bottom_right_corner(window_obj):
     window_obj.last_known_geometry = new_geometry # Actualizar con la posición forzada
     # print(f"Ventana forzada (doble intento) a: {new_geometry}") # Para depuración
 
-def extract_text_from_pdfs(directory):
-    """Extrae texto de todos los archivos PDF en el directorio especificado."""
-    all_text = []
-    print(f"Buscando PDFs en: {os.path.abspath(directory)}")
-    if not os.path.isdir(directory):
-        print(f"Error: El directorio '{directory}' no existe.")
-        return ""
-    try:
-        for filename in os.listdir(directory):
-            if filename.lower().endswith(".pdf"):
-                filepath = os.path.join(directory, filename)
-                print(f"Procesando: {filename}...")
-                try:
-                    reader = PdfReader(filepath)
-                    for page in reader.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            all_text.append(page_text)
-                    print(f"Texto extraído de {filename}.")
-                except Exception as e:
-                    print(f"Error al leer {filename}: {e}")
-        print("Extracción de texto de PDFs completada.")
-        return "\n\n---\n\n".join(all_text) # Separador entre textos de PDFs
-    except Exception as e:
-        print(f"Error al listar el directorio '{directory}': {e}")
-        return ""
-
-def encode_image_to_base64(image_pil):
-    """Codifica un objeto PIL.Image a base64 string."""
-    buffered = io.BytesIO()
-    image_pil.save(buffered, format="PNG") # Guardar como PNG en memoria
-    img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-    return img_str
-
 def take_screenshot():
     """Toma una captura de la pantalla principal y la devuelve como objeto PIL.Image."""
-    print("take_screenshot: Iniciando captura...")
+    import mss # Para capturas de pantalla
+    from PIL import Image
+    logger.debug("take_screenshot: Iniciando captura...")
     try:
         with mss.mss() as sct:
             monitor = sct.monitors[1]
-            print(f"take_screenshot: Capturando monitor {monitor}")
+            logger.debug("take_screenshot: Capturando monitor %s", monitor)
             sct_img = sct.grab(monitor)
-            print("take_screenshot: Captura de datos raw completada.")
+            logger.debug("take_screenshot: Captura de datos raw completada.")
             # Convertir a PIL Image
             # MSS captura en BGRA. Pillow espera RGB o RGBA. sct_img.rgb da los bytes RGB.
             img = Image.frombytes('RGB', (sct_img.width, sct_img.height), sct_img.rgb, 'raw', 'BGR')
-            print("take_screenshot: Conversión a PIL.Image completada.")
+            logger.debug("take_screenshot: Conversión a PIL.Image completada.")
             return img
     except mss.exception.ScreenShotError as e_mss:
-        print(f"Error específico de MSS al tomar la captura de pantalla: {e_mss}")
+        logger.error("Error específico de MSS al tomar la captura de pantalla: %s", e_mss)
         if e_mss.details and "Xlib" in str(e_mss.details): # Ejemplo para Linux Xlib
-            print("Esto podría ser un problema con Xlib. Asegúrate de que el entorno gráfico esté accesible.")
+            logger.error("Esto podría ser un problema con Xlib. Asegúrate de que el entorno gráfico esté accesible.")
         return None
     except Exception as e:
-        print(f"Error general al tomar la captura de pantalla: {e}")
-        import traceback
-        traceback.print_exc() # Imprimir el traceback completo para más detalles
+        logger.exception("Error general al tomar la captura de pantalla: %s", e) # Incluye el traceback completo
         return None
 
-def get_openai_answer(question, context, image_base64=None): # Modificado para aceptar imagen
-    """Obtiene la respuesta de OpenAI."""
-    full_prompt_text = PROMPT_INSTRUCTIONS.format(pdf_context=context, user_question=question)
-    
-    messages_payload = [
-        {"role": "system", "content": "Eres un asistente experto que responde preguntas de opción múltiple basándose en material de estudio o imágenes proporcionadas."}
-    ]
-    
-    user_content = [{"type": "text", "text": full_prompt_text}]
-    
-    if image_base64:
-        user_content.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/png;base64,{image_base64}"
-            }
-        })
-        print("Enviando pregunta e imagen a OpenAI (gpt-4o)...")
-    else:
-        print("Enviando pregunta a OpenAI (gpt-4o)...")
-
-    messages_payload.append({"role": "user", "content": user_content})
-
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages_payload,
-            temperature=0.0, # Temperatura bajada para respuestas más deterministas
-            max_tokens=250
-        )
-        answer = response.choices[0].message.content.strip()
-        print(f"Respuesta recibida (completa): {answer}")
-        return answer
-    except Exception as e:
-        print(f"Error al llamar a la API de OpenAI: {e}")
-        if "safety" in str(e).lower(): # Manejo específico para errores de seguridad de imagen
-            return "Error: La imagen fue bloqueada por política de seguridad."
-        return "Error API"
-
 def setup_answer_window():
     """Configura la ventana flotante para mostrar la respuesta."""
     root = tk.Tk()
@@ -244,7 +165,7 @@ def setup_answer_window():
     root.attributes('-transparentcolor', default_bg)
 
     # Etiqueta para mostrar la respuesta, con fondo transparente y texto negro
-    answer_label = tk.Label(root, text="Esperando...", font=("Arial", 10, "normal"),
+    answer_label = tk.Label(root, text=IDLE_LABEL_TEXT if core.corpus_ready.is_set() else LOADING_LABEL_TEXT, font=("Arial", 10, "normal"),
                             wraplength=WINDOW_WIDTH-10, bg=default_bg, fg="black") # fg cambiado a "black", peso de fuente especificado
     answer_label.pack(expand=True, fill="both", padx=5, pady=5) # pady ajustado
     root.answer_label = answer_label # Hacer la etiqueta accesible desde root
@@ -253,7 +174,7 @@ def setup_answer_window():
     # Modificada para integrarse con pystray
     def quit_app_tk_part(): # Solo la parte de Tkinter
         global app_running
-        print("Cerrando parte de Tkinter...")
+        logger.info("Cerrando parte de Tkinter...")
         app_running = False # Indicar a otros hilos que deben detenerse
         
         if root and root.winfo_exists():
@@ -281,12 +202,15 @@ def setup_answer_window():
     answer_label.bind('<Button-1>', save_last_click_pos)
     answer_label.bind('<B1-Motion>', dragging)
 
-    # Función para actualizar el texto (segura para hilos)
+    # Función para actualizar el texto (desde el hilo de Tk; los demás hilos usan root.ui.label)
     def update_label(text):
-        if root and root.winfo_exists(): # Asegurarse de que la ventana exista
+        if root and root.winfo_exists() and answer_label.cget("text") != text: # Sin trabajo si el texto no cambia
             answer_label.config(text=text)
 
     root.update_label = update_label # Adjuntar función para acceso externo
+    # Los hilos de trabajo no llaman a root.after directamente: todo pasa por esta cola, que el hilo de Tk
+    # vacía una vez por fotograma aplicando solo el último texto y la última colocación pendientes
+    root.ui = UiDispatcher(root, update_label, lambda force: force_window_to_bottom_right_corner(root, force=force))
     return root
 
 # --- Funciones relacionadas con pystray y manejo de la aplicación ---
@@ -297,7 +221,7 @@ def toggle_clipboard_monitoring_action():
     global clipboard_monitoring_active, tray_icon
     clipboard_monitoring_active = not clipboard_monitoring_active
     status = "activado" if clipboard_monitoring_active else "pausado"
-    print(f"Monitoreo del portapapeles {status}.")
+    logger.info("Monitoreo del portapapeles %s.", status)
     # Si el icono existe y el menú se puede actualizar (pystray lo hace si el texto del item es una función)
     if tray_icon:
         pass # El texto del menú se actualizará automáticamente si es una función lambda
@@ -310,13 +234,23 @@ def toggle_text_color_action():
     new_color = "black" if text_color_is_black else "white"
 
     if global_answer_window_root and global_answer_window_root.winfo_exists() and hasattr(global_answer_window_root, 'answer_label'):
-        global_answer_window_root.after(0, lambda: global_answer_window_root.answer_label.config(fg=new_color))
-        print(f"Color del texto cambiado a: {new_color}")
+        global_answer_window_root.ui.call(lambda: global_answer_window_root.answer_label.config(fg=new_color))
+        logger.info("Color del texto cambiado a: %s", new_color)
     else:
-        print("No se pudo cambiar el color del texto: la ventana o la etiqueta no están disponibles.")
+        logger.warning("No se pudo cambiar el color del texto: la ventana o la etiqueta no están disponibles.")
+
+def clear_answer_cache_action():
+    """Vacía las cachés de respuestas, por texto y por imagen (en memoria y en disco)."""
+    if core.answer_cache is not None:
+        core.answer_cache.clear()
+        logger.info("Caché de respuestas vaciada.")
+    if core.image_cache is not None:
+        core.image_cache.clear()
+        logger.info("Caché de respuestas por imagen vaciada.")
 
 def create_icon_image():
     """Crea una imagen simple para el icono de la bandeja."""
+    from PIL import Image, ImageDraw
     width = 64
     height = 64
     # Fondo transparente, color del icono blanco/gris
@@ -331,35 +265,40 @@ def create_icon_image():
 
 def start_area_selection_mode_thread_safe():
     """Inicia la selección de área de forma segura para hilos (llamada desde pystray)."""
+    start_area_selection(process_selected_area)
+
+def start_area_selection(on_region, status_text="Procesando área..."):
+    """Selección de un área con dos clics (esquinas); la región se pasa a on_region(región, ventana) en otro hilo."""
     global selecting_area, selection_coords, mouse_listener, global_answer_window_root
+    from pynput import mouse # Para escuchar clics del mouse globales (ya precargado por preload_modules)
     
     if selecting_area:
-        print("Ya se está en modo de selección.")
+        logger.info("Ya se está en modo de selección.")
         if global_answer_window_root and global_answer_window_root.winfo_exists():
-            global_answer_window_root.after(0, global_answer_window_root.update_label, "Selección activa")
+            global_answer_window_root.ui.label("Selección activa")
         return
 
-    print("Modo Selección de Área: Activado. Haz clic para la primera esquina.")
+    logger.info("Modo Selección de Área: Activado. Haz clic para la primera esquina.")
     if global_answer_window_root and global_answer_window_root.winfo_exists():
-        global_answer_window_root.after(0, global_answer_window_root.update_label, "Clic 1ª esquina")
+        global_answer_window_root.ui.label("Clic 1ª esquina")
     
     selecting_area = True
     selection_coords = []
     
     if global_answer_window_root and global_answer_window_root.winfo_exists():
-        global_answer_window_root.after(0, global_answer_window_root.withdraw) # Ocultar ventana
+        global_answer_window_root.ui.call(global_answer_window_root.withdraw) # Ocultar ventana
 
     def on_click(x, y, button, pressed):
-        global selection_coords, selecting_area, mouse_listener, global_answer_window_root, global_pdf_text_context
+        global selection_coords, selecting_area, mouse_listener, global_answer_window_root
         if pressed and selecting_area and button == mouse.Button.left:
             selection_coords.append((x, y))
-            print(f"Clic detectado en: ({x}, {y})")
+            logger.debug("Clic detectado en: (%s, %s)", x, y)
             
             if len(selection_coords) == 1:
-                print("Primera esquina registrada. Haz clic para la segunda esquina.")
+                logger.info("Primera esquina registrada. Haz clic para la segunda esquina.")
             
             elif len(selection_coords) == 2:
-                print("Segunda esquina registrada. Procesando área seleccionada...")
+                logger.info("Segunda esquina registrada. Procesando área seleccionada...")
                 selecting_area = False
                 
                 if mouse_listener:
@@ -370,11 +309,11 @@ def start_area_selection_mode_thread_safe():
                     def show_and_force_position():
                         if not (global_answer_window_root and global_answer_window_root.winfo_exists()): return
                         global_answer_window_root.deiconify()
-                        # Forzar posición después de un breve retardo para asegurar que deiconify se complete
-                        global_answer_window_root.after(20, lambda: force_window_to_bottom_right_corner(global_answer_window_root))
-                        global_answer_window_root.update_label("Procesando área...") # Actualizar etiqueta después de deiconify
+                        # Forzar posición en el fotograma siguiente, para asegurar que deiconify se complete
+                        global_answer_window_root.ui.place(force=True)
+                        global_answer_window_root.update_label(status_text) # Actualizar etiqueta después de deiconify
                     
-                    global_answer_window_root.after(0, show_and_force_position)
+                    global_answer_window_root.ui.call(show_and_force_position)
 
                 x1, y1 = selection_coords[0]
                 x2, y2 = selection_coords[1]
@@ -385,34 +324,83 @@ def start_area_selection_mode_thread_safe():
                 }
                 
                 if region["width"] == 0 or region["height"] == 0:
-                    print("Error: El área seleccionada tiene ancho o alto cero.")
+                    logger.error("El área seleccionada tiene ancho o alto cero.")
                     if global_answer_window_root and global_answer_window_root.winfo_exists():
-                        global_answer_window_root.after(0, global_answer_window_root.update_label, "Error: Área 0")
+                        global_answer_window_root.ui.label("Error: Área 0")
                     selection_coords = []
                     return False
 
-                print(f"Región calculada para mss: {region}")
-                threading.Thread(target=process_selected_area, args=(region, global_pdf_text_context, global_answer_window_root), daemon=True).start()
+                logger.debug("Región calculada para mss: %s", region)
+                threading.Thread(target=on_region, args=(region, global_answer_window_root), daemon=True).start()
                 return False # Detener listener
         return True
 
     mouse_listener = mouse.Listener(on_click=on_click)
     mouse_listener.start()
-    print("Listener de mouse iniciado para selección de área.")
+    logger.debug("Listener de mouse iniciado para selección de área.")
+
+def toggle_region_watch_action():
+    """Empieza a vigilar una región (se selecciona con dos clics, como un área) o deja de vigilarla."""
+    if region_watcher is not None and region_watcher.running():
+        stop_region_watch()
+        if global_answer_window_root and global_answer_window_root.winfo_exists():
+            global_answer_window_root.ui.label("Vigilancia detenida")
+        return
+    if not region_watch_available():
+        logger.warning("La vigilancia de región requiere NumPy (pip install numpy).")
+        if global_answer_window_root and global_answer_window_root.winfo_exists():
+            global_answer_window_root.ui.label("Falta NumPy")
+        return
+    logger.info("Vigilancia de región: selecciona la región (la ventana de respuesta no debe quedar dentro).")
+    start_area_selection(start_region_watch, status_text="Vigilando región...")
+
+def start_region_watch(region_details, root_window):
+    """Vigila la región: cada pregunta nueva (contenido distinto y ya quieto) se responde como un área."""
+    global region_watcher
+    stop_region_watch()
+    region_watcher = RegionWatcher(region_details, lambda image, captured_at: process_watched_capture(image, captured_at, root_window),
+                                   captures_per_second=WATCH_CAPTURES_PER_SECOND, change_threshold=WATCH_CHANGE_THRESHOLD,
+                                   stable_seconds=WATCH_STABLE_SECONDS, stats=watch_stats).start()
+
+def stop_region_watch():
+    global region_watcher
+    if region_watcher is not None:
+        region_watcher.stop()
+        region_watcher = None
+
+def toggle_profiling_action(mode):
+    """Inicia un perfilado del proceso en el modo indicado o, si ya hay uno en curso, lo detiene y guarda sus archivos."""
+    if profiler.active_session() is not None:
+        paths = profiler.stop_session()
+        if paths:
+            logger.info("Perfil guardado: %s", ", ".join(os.path.abspath(path) for path in paths.values()))
+        text = "Perfilado guardado"
+    else:
+        profiler.start_session(mode)
+        logger.info("Perfilado %s iniciado; se guarda en %s al detenerlo.", mode, os.path.abspath(profiler.PROFILE_DIRECTORY))
+        text = f"Perfilando ({mode})..."
+    if global_answer_window_root and global_answer_window_root.winfo_exists():
+        global_answer_window_root.ui.label(text)
+
+def profiling_menu_text(item=None):
+    session = profiler.active_session()
+    if session is None:
+        return "Perfilar (cProfile + memoria)"
+    return f"Detener Perfilado ({session.mode}, {session.elapsed_seconds():.0f} s)"
 
 def toggle_window_visibility():
     """Muestra u oculta la ventana de respuesta."""
     if global_answer_window_root and global_answer_window_root.winfo_exists():
         if global_answer_window_root.state() == 'withdrawn':
             global_answer_window_root.deiconify() # Mostrar primero
-            # Luego, forzar posición y topmost con un pequeño retardo
-            global_answer_window_root.after(20, lambda: force_window_to_bottom_right_corner(global_answer_window_root))
-            print("Ventana de respuesta mostrada y reposicionada.")
+            # Luego, forzar posición y topmost en el fotograma siguiente
+            global_answer_window_root.ui.place(force=True)
+            logger.info("Ventana de respuesta mostrada y reposicionada.")
         else:
             global_answer_window_root.withdraw()
-            print("Ventana de respuesta oculta.")
+            logger.info("Ventana de respuesta oculta.")
     else:
-        print("La ventana de respuesta no está disponible para mostrar/ocultar.")
+        logger.warning("La ventana de respuesta no está disponible para mostrar/ocultar.")
 
 
 def quit_app_combined(icon_param=None, tk_root_param=None):
@@ -421,26 +409,44 @@ def quit_app_combined(icon_param=None, tk_root_param=None):
     if not app_running: # Evitar múltiples llamadas
         return
         
-    print("Cerrando aplicación (combinado)...")
+    logger.info("Cerrando aplicación (combinado)...")
     app_running = False
 
     # Detener el listener de mouse si está activo
     global mouse_listener
     if mouse_listener and mouse_listener.is_alive():
-        print("Deteniendo listener de mouse...")
+        logger.info("Deteniendo listener de mouse...")
         mouse_listener.stop()
+    stop_region_watch()
+    if profiler.active_session() is not None:
+        paths = profiler.stop_session()
+        logger.info("Perfil guardado al salir: %s", ", ".join(os.path.abspath(path) for path in paths.values()))
+
+    # Cancelar las peticiones pendientes o en curso
+    request_scheduler.shutdown()
+    core.stop_corpus_watcher()
+    tracer.close() # Escribe las trazas pendientes y las métricas finales
+    logger.info("%s", core.resilient_caller.stats_text())
+    logger.info("%s", core.model_stats.stats_text())
+    if core.image_cache is not None:
+        logger.info("Caché por imagen: %s", core.image_cache.stats_text())
+    if watch_stats.captures:
+        logger.info("Vigilancia de región: %s", watch_stats.stats_text())
+    if global_answer_window_root is not None:
+        logger.info("%s", global_answer_window_root.ui.stats_text())
+    core.stop_async_engine()
 
     # Detener el icono de la bandeja
     # El icono que se pasa puede ser el que se usa en el menú o el global
     actual_icon = icon_param if icon_param else tray_icon
     if actual_icon:
-        print("Deteniendo icono de la bandeja...")
+        logger.info("Deteniendo icono de la bandeja...")
         actual_icon.stop()
     
     # Detener Tkinter
     actual_tk_root = tk_root_param if tk_root_param else global_answer_window_root
     if actual_tk_root and actual_tk_root.winfo_exists():
-        print("Cerrando ventana de Tkinter...")
+        logger.info("Cerrando ventana de Tkinter...")
         # La función quit_app_tk_part ya se encarga de root.quit y root.destroy
         # Pero necesitamos asegurarnos de que se llame desde el hilo correcto
         actual_tk_root.after(0, actual_tk_root.destroy) # Destruir es más directo aquí
@@ -448,7 +454,7 @@ def quit_app_combined(icon_param=None, tk_root_param=None):
         # Esto es delicado; idealmente, el hilo de Tkinter se uniría.
         # Como es un hilo demonio, sys.exit() lo terminará.
     
-    print("Saliendo del script...")
+    logger.info("Saliendo del script...")
     # sys.exit(0) no siempre es necesario si pystray.stop() libera el hilo principal
     # y los hilos demonio se cierran. Pero para asegurar...
     # Damos un pequeño tiempo para que los hilos terminen
@@ -460,171 +466,506 @@ def quit_app_combined(icon_param=None, tk_root_param=None):
 
 # --- Fin de funciones pystray ---
 
-def check_clipboard(pdf_context, root):
-    """Verifica el portapapeles y procesa nuevo texto."""
-    print("Iniciando monitoreo del portapapeles...")
-    global app_running, clipboard_monitoring_active, last_copied_by_app
+def mark_startup(milestone, at=None, **attrs):
+    """
+    Registra un hito del arranque (ventana, bandeja, material, primera respuesta) como tramo de la traza
+    'arranque', medido desde el inicio del proceso. Cada hito cuenta solo la primera vez; la traza se
+    cierra con la primera respuesta mostrada.
+    """
+    with startup_lock:
+        if startup_trace is None or milestone in startup_marks:
+            return
+        startup_marks[milestone] = at = at or time.perf_counter()
+    startup_trace.record(milestone, STARTUP_STARTED_AT, at, **attrs)
+    logger.info("Arranque: %s a los %.0f ms.", milestone, (at - STARTUP_STARTED_AT) * 1000)
+    if milestone == "primera_respuesta":
+        startup_trace.finish(material="caliente" if core.corpus_cache_warm else "frio")
+
+def show_idle_state(root):
+    """Cambia 'Cargando material...' por el estado de espera una vez cargado (sin pisar una respuesta)."""
+    def apply():
+        if root.winfo_exists() and root.answer_label.cget("text") == LOADING_LABEL_TEXT:
+            root.update_label(IDLE_LABEL_TEXT if core.API_KEY else "Falta OPENAI_API_KEY")
+    if root and root.winfo_exists():
+        root.ui.call(apply)
+
+def on_corpus_ready(corpus):
+    """Llamada desde el hilo de carga cuando el material (CorpusStore, None si falló) y el motor de la API están listos."""
+    mark_startup("material", chars=corpus.chars if corpus is not None else 0, cache="caliente" if core.corpus_cache_warm else "frio")
+    show_idle_state(global_answer_window_root)
+    if app_running:
+        core.start_corpus_watcher(on_reload_start=on_corpus_reload_start, on_reload_done=on_corpus_reload_done)
+    preload_modules()
+
+def show_reload_status(root, text, final=False):
+    """
+    Muestra el estado de una recarga del material en la etiqueta. El resultado final (final=True) se
+    retira a los RELOAD_STATUS_SECONDS, volviendo al texto anterior si nadie ha cambiado la etiqueta.
+    """
+    def apply():
+        global label_before_reload, reload_status_shown
+        if not root.winfo_exists():
+            return
+        current = root.answer_label.cget("text")
+        if current != reload_status_shown: # Si se ve un estado de recarga anterior, se conserva el texto de antes
+            label_before_reload = current
+        root.update_label(text)
+        reload_status_shown = text
+        if final:
+            root.after(int(RELOAD_STATUS_SECONDS * 1000), restore, text)
+    def restore(status_text):
+        global reload_status_shown
+        if root.winfo_exists() and reload_status_shown == status_text and root.answer_label.cget("text") == status_text:
+            root.update_label(label_before_reload)
+            reload_status_shown = None
+    if root and root.winfo_exists():
+        root.ui.call(apply)
+
+def on_corpus_reload_start(added, changed, removed):
+    """Llamada desde el observador de PDFs al detectar cambios, antes de re-extraerlos."""
+    show_reload_status(global_answer_window_root, RELOADING_LABEL_TEXT)
+
+def on_corpus_reload_done(summary, error):
+    """Llamada desde el observador de PDFs al terminar la recarga (summary de core.reload_corpus)."""
+    if error is not None:
+        show_reload_status(global_answer_window_root, "Error al recargar material", final=True)
+        return
+    counts = f"+{len(summary['added'])} ~{len(summary['changed'])} -{len(summary['removed'])}"
+    show_reload_status(global_answer_window_root, f"Material recargado ({counts})", final=True)
+
+def preload_modules():
+    """Importa en segundo plano lo que la primera selección de área necesitará, para que no lo pague ella."""
+    try:
+        importlib.import_module("mss")
+        importlib.import_module("pynput.mouse")
+        importlib.import_module("image_pipeline")
+    except ImportError as e:
+        logger.warning("No se pudo precargar un módulo: %s", e)
+
+def context_for_request(request, root):
+    """
+    Material para una petición. Si llega antes de que termine la carga en segundo plano, espera
+    (mostrándolo en la etiqueta) en el hilo de la petición; una pregunta más nueva la reemplaza.
+    Se lee en cada petición (no al crear el hilo), así que tras una recarga ya se usa el material nuevo.
+    """
+    if core.corpus_ready.is_set():
+        return core.corpus_text
+    logger.info("Pregunta recibida mientras se carga el material: esperando a que termine.")
+    if root and root.winfo_exists():
+        request.publish(root.ui.label, LOADING_LABEL_TEXT)
+    with span("espera_material"):
+        return core.wait_for_corpus(cancel_event=request.cancelled)
+
+def traced_request(trace, fn):
+    """
+    Envuelve fn(request, *args) para el planificador: registra la espera en cola, ejecuta fn con la
+    traza activa (los tramos de prompt/API/copia se asocian solos) y cierra la traza si se cancela o falla.
+    """
+    def run(request, *args):
+        trace.record("cola", request.submitted_at, request.started_at or time.perf_counter(), request_id=request.request_id)
+        with trace.activate():
+            try:
+                return fn(request, *args)
+            except RequestCancelled:
+                trace.finish(resultado="cancelada")
+                raise
+            except Exception:
+                trace.finish(resultado="error")
+                raise
+    return run
+
+def show_answer_traced(root, trace, text, after_update=None, **attrs):
+    """
+    Muestra la respuesta en la etiqueta desde el hilo de Tk; el tramo 'etiqueta' va de encolar a aplicar
+    la actualización. La traza se cierra (resultado ok) cuando la respuesta ya está en pantalla.
+    """
+    queued_at = time.perf_counter()
+    def apply():
+        if root.winfo_exists():
+            root.update_label(text)
+            if after_update:
+                after_update()
+        trace.record("etiqueta", queued_at, time.perf_counter())
+        trace.finish(resultado="ok", **attrs)
+        mark_startup("primera_respuesta")
+    if root and root.winfo_exists():
+        root.ui.call(apply)
+    else:
+        trace.finish(resultado="ok", **attrs)
+
+def publish_preliminary_answer(request, root, answer):
+    """
+    Consulta doble: la respuesta del modelo rápido se copia y se muestra ya, sin cerrar la traza;
+    la definitiva (la del modelo fuerte) la reemplaza después si es distinta.
+    """
+    def publish():
+        global last_copied_by_app
+        with span("preliminar", chars=len(answer)):
+            try:
+                pyperclip.copy(answer)
+                logger.info("Respuesta preliminar copiada al portapapeles: '%s'", answer[:50] + "..." if len(answer) > 50 else answer)
+                last_copied_by_app = answer
+            except pyperclip.PyperclipException as e_copy:
+                logger.error("Error al copiar la respuesta preliminar al portapapeles: %s", e_copy)
+                last_copied_by_app = None
+            if root and root.winfo_exists():
+                root.ui.label(format_display_text(answer))
+    request.publish(publish)
+
+def show_api_error(request, root, trace, error):
+    """
+    Muestra un fallo de la API en la etiqueta (p.ej. "Rate limited (20 s)") sin tocar el portapapeles:
+    lo que el usuario copió sigue ahí y no se confunde un error con una respuesta.
+    """
+    if root and root.winfo_exists():
+        request.publish(root.ui.label, error.display_text)
+    trace.finish(resultado=error.kind)
+
+def show_unconfirmed_answer(request, root, trace, answer):
+    """
+    Muestra una respuesta local sin confirmar (la API no estaba disponible) marcada en la etiqueta y sin
+    copiarla al portapapeles: no supera los umbrales del respondedor local y puede ser incorrecta.
+    """
+    if root and root.winfo_exists():
+        request.publish(root.ui.label, format_display_text(answer, confirmed=False))
+    trace.finish(resultado="sin_confirmar")
+
+def read_clipboard_safe():
+    """Lee el portapapeles; devuelve None si pyperclip no puede acceder a él."""
+    try:
+        return pyperclip.paste()
+    except pyperclip.PyperclipException:
+        return None
+
+def check_clipboard(root):
+    """Observa el portapapeles (por eventos o sondeo adaptativo) y procesa nuevo texto."""
+    logger.info("Iniciando monitoreo del portapapeles...")
+    global app_running, clipboard_monitoring_active, last_copied_by_app, clipboard_watcher
     recent_value = ""
     try:
         # Intentar obtener el valor inicial sin fallar si no está disponible
         recent_value = pyperclip.paste()
     except pyperclip.PyperclipException as e:
-        print(f"Advertencia: No se pudo acceder al portapapeles al inicio: {e} (esto puede ser normal si está vacío o en uso).")
-        print("Asegúrate de que 'xclip' o 'xsel' estén instalados si usas Linux, o que los permisos sean correctos.")
+        logger.warning("No se pudo acceder al portapapeles al inicio: %s (esto puede ser normal si está vacío o en uso).", e)
+        logger.warning("Asegúrate de que 'xclip' o 'xsel' estén instalados si usas Linux, o que los permisos sean correctos.")
     except Exception as e_init_paste: # Captura otras posibles excepciones de pyperclip.paste()
-        print(f"Error inesperado al intentar leer el portapapeles inicialmente: {e_init_paste}")
+        logger.error("Error inesperado al intentar leer el portapapeles inicialmente: %s", e_init_paste)
 
-    while app_running: # Verificar la bandera global
+    def handle_clipboard_value(current_value):
+        """Recibe el valor del portapapeles ya agrupado por el debounce del observador."""
+        nonlocal recent_value
+        global last_copied_by_app
         try:
-            if not clipboard_monitoring_active:
-                time.sleep(POLL_INTERVAL_SECONDS) # Ahorrar CPU, pero seguir comprobando app_running
-                continue # Saltar el procesamiento del portapapeles si está pausado
-
-            if root and not root.winfo_exists():
-                print("Ventana de Tkinter no disponible, deteniendo monitoreo de portapapeles en este hilo.")
-                break 
-
-            current_value = pyperclip.paste()
-            if current_value != recent_value and current_value.strip():
-                if current_value == last_copied_by_app:
-                    print("Ignorando el texto del portapapeles ya que fue copiado por la aplicación.")
-                    recent_value = current_value # Actualizar recent_value para evitar reprocesar si no hay más cambios
-                else:
-                    # Es un nuevo texto genuino del usuario/otra app
-                    print("\n--- Nuevo texto detectado en portapapeles ---")
-                    print(f"Texto copiado: '{current_value[:100]}...'")
-                    
-                    # Guardar el valor actual como el que se está procesando
-                    text_to_process = current_value 
-                    # Actualizar recent_value para la próxima comparación
-                    recent_value = current_value 
-                    # Resetear la bandera, ya que este texto no fue puesto por nuestra app
-                    last_copied_by_app = None 
-
+            if not current_value or current_value == recent_value or not current_value.strip():
+                return
+            if current_value == last_copied_by_app:
+                logger.debug("Ignorando el texto del portapapeles ya que fue copiado por la aplicación.")
+                recent_value = current_value # Actualizar recent_value para evitar reprocesar si no hay más cambios
+                return
+
+            # Es un nuevo texto genuino del usuario/otra app
+            trace = tracer.start_trace("portapapeles")
+            detected_at = time.perf_counter()
+            # Desde la primera señal de cambio hasta la entrega (incluye el debounce del observador)
+            detection_ms = clipboard_watcher.detection_ms[-1] if clipboard_watcher and clipboard_watcher.detection_ms else 0.0
+            trace.record("deteccion", detected_at - detection_ms / 1000, detected_at, chars=len(current_value),
+                         backend=clipboard_watcher.backend.name if clipboard_watcher else None)
+            logger.info("--- Nuevo texto detectado en portapapeles ---")
+            logger.debug("Texto copiado: '%s...'", current_value[:100])
+            logger.debug("Portapapeles: %s", clipboard_watcher.stats_text())
+
+            # Guardar el valor actual como el que se está procesando
+            text_to_process = current_value
+            # Actualizar recent_value para la próxima comparación
+            recent_value = current_value
+            # Resetear la bandera, ya que este texto no fue puesto por nuestra app
+            last_copied_by_app = None
+
+            if root and root.winfo_exists():
+                root.ui.label("Procesando texto...")
+
+            # Definir y lanzar el hilo SOLO si es un nuevo texto genuino
+            def process_clipboard_in_thread(request, text_for_openai):
+                def show_partial(partial_text):
+                    request.raise_if_cancelled() # Cortar el streaming si ya hay una pregunta más reciente
                     if root and root.winfo_exists():
-                        root.after(0, root.update_label, "Procesando texto...")
-
-                    # Definir y lanzar el hilo SOLO si es un nuevo texto genuino
-                    def process_clipboard_in_thread(text_for_openai):
-                        global last_copied_by_app # Necesario para actualizarla desde el hilo
-                        
-                        answer = get_openai_answer(text_for_openai, pdf_context)
-                        display_text = answer[:16] + "..." + answer[-13:] if len(answer) > 27 else answer
-                        
-                        if root and root.winfo_exists():
-                            root.after(0, root.update_label, display_text)
-                        
+                        request.publish(root.ui.label, format_display_text(partial_text))
+
+                context = context_for_request(request, root)
+                try:
+                    answer, confirmed = get_answer_with_cache(
+                        text_for_openai, context, on_partial=show_partial, cancel_event=request.cancelled,
+                        on_preliminary=lambda fast_answer: publish_preliminary_answer(request, root, fast_answer))
+                except ApiError as e:
+                    show_api_error(request, root, trace, e)
+                    return
+                if not confirmed:
+                    show_unconfirmed_answer(request, root, trace, answer)
+                    return
+                display_text = format_display_text(answer)
+
+                def publish_answer():
+                    global last_copied_by_app # Necesario para actualizarla desde el hilo
+                    trace.add_pending() # La traza termina cuando se hayan hecho la copia y la actualización de la etiqueta
+                    show_answer_traced(root, trace, display_text)
+
+                    with span("copia", chars=len(answer)):
                         try:
                             pyperclip.copy(answer)
-                            print(f"Respuesta completa copiada al portapapeles: '{answer[:50]}...'" if len(answer) > 50 else f"Respuesta completa copiada al portapapeles: '{answer}'")
+                            logger.info("Respuesta completa copiada al portapapeles: '%s'", answer[:50] + "..." if len(answer) > 50 else answer)
                             last_copied_by_app = answer # Guardar lo que la app copió
                         except pyperclip.PyperclipException as e_copy:
-                            print(f"Error al copiar la respuesta al portapapeles: {e_copy}")
+                            logger.error("Error al copiar la respuesta al portapapeles: %s", e_copy)
                             last_copied_by_app = None # Resetear si falla la copia
+                    trace.finish()
 
-                    if app_running: # Asegurarse de que app_running no haya cambiado antes de iniciar nuevo hilo
-                        threading.Thread(target=process_clipboard_in_thread, args=(text_to_process,), daemon=True).start()
-            
-        except pyperclip.PyperclipException:
-            pass 
-        except Exception as e:
-            print(f"Error inesperado en el bucle de monitoreo del portapapeles: {e}")
-            # Considerar un pequeño retardo aquí si los errores son muy rápidos y repetitivos
-            time.sleep(POLL_INTERVAL_SECONDS) # Esperar antes de reintentar en caso de error grave
-        
-        time.sleep(POLL_INTERVAL_SECONDS) # Intervalo normal de sondeo
-    print("Monitoreo del portapapeles detenido.")
+                if not request.publish(publish_answer):
+                    logger.info("Respuesta descartada (petición #%s reemplazada por una más reciente).", request.request_id)
+                    trace.finish(resultado="descartada")
 
-def process_selected_area(region_details, pdf_context_for_area, root_window):
+            if app_running: # Asegurarse de que app_running no haya cambiado antes de encolar la petición
+                request_scheduler.submit("portapapeles", traced_request(trace, process_clipboard_in_thread), text_to_process)
+        except Exception as e:
+            logger.error("Error inesperado en el monitoreo del portapapeles: %s", e)
+
+    def should_keep_watching():
+        if root and not root.winfo_exists():
+            logger.warning("Ventana de Tkinter no disponible, deteniendo monitoreo de portapapeles en este hilo.")
+            return False
+        return app_running # Verificar la bandera global
+
+    backend = create_clipboard_backend(CLIPBOARD_BACKEND, read_clipboard_safe,
+                                       min_interval=CLIPBOARD_POLL_MIN_SECONDS, max_interval=CLIPBOARD_POLL_MAX_SECONDS)
+    logger.info("Backend de portapapeles: %s", backend.name)
+    clipboard_watcher = ClipboardWatcher(
+        backend,
+        handle_clipboard_value,
+        debounce_seconds=CLIPBOARD_DEBOUNCE_SECONDS,
+        is_active=lambda: clipboard_monitoring_active,
+        paused_sleep_seconds=POLL_INTERVAL_SECONDS # Ahorrar CPU en pausa, pero seguir comprobando app_running
+    )
+    clipboard_watcher.run(should_keep_watching)
+    logger.info("Monitoreo del portapapeles detenido.")
+
+def read_question_with_ocr(screenshot_pil, root_window):
+    """
+    Intenta leer la pregunta de la captura con el OCR local.
+    Devuelve el texto si la confianza es suficiente, o None para usar el camino de imagen.
+    """
+    if not USE_OCR or not ocr_available(TESSERACT_CMD):
+        return None
+    if root_window and root_window.winfo_exists():
+        root_window.ui.label("Leyendo texto...")
+    with span("ocr") as ocr_span:
+        try:
+            text, confidence, elapsed_ms = extract_question_text(screenshot_pil)
+        except Exception as e:
+            logger.warning("Error en el OCR local: %s. Usando la imagen.", e)
+            area_path_stats.record_attempt(fell_back=True)
+            ocr_span.set(accepted=False)
+            return None
+        accepted = confidence >= OCR_MIN_CONFIDENCE and len(text) >= OCR_MIN_CHARS
+        ocr_span.set(chars=len(text), confidence=round(confidence, 1), accepted=accepted)
+    area_path_stats.record_attempt(fell_back=not accepted)
+    logger.info("OCR local: %d caracteres, confianza %.0f en %.0f ms -> %s.", len(text), confidence, elapsed_ms,
+                "camino de texto" if accepted else "se usará la imagen")
+    return text if accepted else None
+
+def process_selected_area(region_details, root_window):
     """Toma captura de una región específica, la procesa y obtiene respuesta de OpenAI."""
-    print(f"\n--- Procesando área seleccionada: {region_details} ---")
-    
-    # Pregunta para la imagen, adaptada para ambos tipos de pregunta
-    question_for_image = "Esta imagen contiene una pregunta (puede ser de opción múltiple o para completar). Analiza la imagen y, utilizando también el material de estudio adjunto, proporciona la respuesta correcta y concisa. Si es de opción múltiple, responde con la letra y las primeras palabras de la alternativa. Si es para completar, responde solo con la palabra o frase corta que completa la oración."
-    print(f"Usando pregunta para la imagen: '{question_for_image}'")
+    logger.info("--- Procesando área seleccionada: %s ---", region_details)
 
     if root_window and root_window.winfo_exists():
-        root_window.after(0, root_window.update_label, "Capturando área...")
-
-    # Tomar captura de la región
-    screenshot_pil = take_screenshot_region(region_details)
-
-    if screenshot_pil:
-        if root_window and root_window.winfo_exists():
-            root_window.after(0, root_window.update_label, "Procesando imagen...")
-        
-        print("process_selected_area: Codificando imagen a base64...")
-        image_b64 = encode_image_to_base64(screenshot_pil)
-        print("process_selected_area: Imagen codificada. Preparando para enviar a OpenAI.")
-        
-        def get_and_show_answer_area():
-            global last_copied_by_app
-            answer = get_openai_answer(question_for_image, pdf_context_for_area, image_base64=image_b64)
-            display_text = answer[:16] + "..." + answer[-13:] if len(answer) > 27 else answer
-            
+        root_window.ui.label("Capturando área...")
+
+    trace = tracer.start_trace("area")
+    with trace.activate():
+        # Tomar captura de la región
+        with span("captura", size=f"{region_details['width']}x{region_details['height']}"):
+            screenshot_pil = take_screenshot_region(region_details)
+        if screenshot_pil:
+            answer_area_screenshot(trace, screenshot_pil, root_window)
+        else:
+            logger.error("process_selected_area: Falló la captura de la región (screenshot_pil es None).")
+            trace.finish(resultado="error")
+            if root_window and root_window.winfo_exists():
+                root_window.ui.label("Error área")
+
+def process_watched_capture(screenshot_pil, captured_at, root_window):
+    """Responde una captura de la región vigilada (ya tomada por el RegionWatcher) y mide de la captura a la respuesta."""
+    trace = tracer.start_trace("vigilancia")
+    trace.record("captura", captured_at, time.perf_counter())
+    with trace.activate():
+        answer_area_screenshot(trace, screenshot_pil, root_window,
+                               on_shown=lambda: watch_stats.record_answer((time.perf_counter() - captured_at) * 1000))
+
+def answer_area_screenshot(trace, screenshot_pil, root_window, on_shown=None):
+    """Respuesta de una captura de área: de la caché por imagen si ya se respondió, si no por OCR o imagen."""
+    logger.debug("Usando pregunta para la imagen: '%s'", AREA_IMAGE_QUESTION)
+    image_fingerprint, cached = lookup_image_cache(screenshot_pil)
+    if cached is not None:
+        request_scheduler.submit("área", traced_request(trace, publish_area_answer), trace, root_window, cached[0], "cache_imagen",
+                                 on_shown)
+    else:
+        prepare_area_question(trace, screenshot_pil, AREA_IMAGE_QUESTION, root_window, image_fingerprint=image_fingerprint,
+                              on_shown=on_shown)
+
+def lookup_image_cache(screenshot_pil):
+    """
+    Huella (dHash y máscara de tinta) de la captura y la respuesta guardada para ella en la caché por imagen:
+    (huella, (respuesta, ms de la original, distancia)) o (huella, None). Sin caché por imagen devuelve (None, None).
+    """
+    if core.image_cache is None:
+        return None, None
+    lookup_start = time.perf_counter()
+    with span("hash_imagen") as hash_span:
+        image_fingerprint = fingerprint(screenshot_pil)
+        cached = core.image_cache.get(image_fingerprint)
+        hash_span.set(hit=cached is not None, distance=cached[2] if cached else None)
+    lookup_ms = (time.perf_counter() - lookup_start) * 1000
+    if cached is not None:
+        answer, original_ms, distance = cached
+        logger.info("Respuesta de área desde la caché por imagen en %.1f ms (distancia %d, ~%.0f ms ahorrados): %s [%s]",
+                    lookup_ms, distance, original_ms - lookup_ms, answer, core.image_cache.stats_text())
+    else:
+        logger.debug("Caché por imagen: captura nueva (%.1f ms) [%s]", lookup_ms, core.image_cache.stats_text())
+    return image_fingerprint, cached
+
+def publish_area_answer(request, trace, root_window, answer, answer_path, on_shown=None):
+    """
+    Copia la respuesta de un área al portapapeles y la muestra en la etiqueta, si la petición sigue vigente.
+    on_shown() se llama (desde el hilo de Tk) cuando la respuesta ya está en pantalla.
+    """
+    display_text = format_display_text(answer)
+
+    def after_update():
+        root_window.ui.place() # Solo mueve la ventana si no está ya en la esquina
+        if on_shown:
+            on_shown()
+
+    def publish_answer():
+        global last_copied_by_app
+        with span("copia", chars=len(answer)):
             try:
                 pyperclip.copy(answer)
-                print(f"Respuesta completa de área copiada al portapapeles: '{answer[:50]}...'" if len(answer) > 50 else f"Respuesta completa de área copiada al portapapeles: '{answer}'")
+                logger.info("Respuesta completa de área copiada al portapapeles: '%s'", answer[:50] + "..." if len(answer) > 50 else answer)
                 last_copied_by_app = answer # Guardar lo que la app copió
             except pyperclip.PyperclipException as e_copy:
-                print(f"Error al copiar la respuesta de área al portapapeles: {e_copy}")
+                logger.error("Error al copiar la respuesta de área al portapapeles: %s", e_copy)
                 last_copied_by_app = None # Resetear si falla la copia
 
-            if root_window and root_window.winfo_exists():
-                # Función para actualizar etiqueta y luego reaplicar geometría
-                def update_and_reapply_geometry():
-                    if not root_window.winfo_exists(): return # Comprobación extra
-                    root_window.update_label(display_text)
-                    
-                    # Forzar la posición y topmost después de actualizar la etiqueta (primer intento)
-                    force_window_to_bottom_right_corner(root_window)
-                
-                root_window.after(0, update_and_reapply_geometry)
-        
-        threading.Thread(target=get_and_show_answer_area, daemon=True).start()
+        # Actualizar la etiqueta y luego reaplicar geometría: forzar la posición y topmost
+        show_answer_traced(root_window, trace, display_text, after_update=after_update, path=answer_path)
+
+    if not request.publish(publish_answer):
+        logger.info("Respuesta de área descartada (petición #%s reemplazada por una más reciente).", request.request_id)
+        trace.finish(resultado="descartada")
+
+def prepare_area_question(trace, screenshot_pil, question_for_image, root_window, image_fingerprint=None, on_shown=None):
+    """
+    Elige el camino (OCR o imagen) para una captura y encola la petición que obtiene y muestra la respuesta.
+    Con image_fingerprint (huella de la captura) la respuesta se guarda en la caché por imagen.
+    """
+    area_start = time.perf_counter()
+    ocr_question = read_question_with_ocr(screenshot_pil, root_window)
+
+    if ocr_question:
+        # Camino rápido: la pregunta leída por OCR va por el camino de solo texto
+        answer_path = "ocr"
+        def compute_answer(context, show_partial, cancel_event, on_preliminary):
+            return get_answer_with_cache(ocr_question, context, on_partial=show_partial, cancel_event=cancel_event,
+                                         on_preliminary=on_preliminary)
     else:
-        print("process_selected_area: Falló la captura de la región (screenshot_pil es None).")
         if root_window and root_window.winfo_exists():
-            root_window.after(0, root_window.update_label, "Error área")
+            root_window.ui.label("Procesando imagen...")
+
+        logger.debug("process_selected_area: Codificando imagen a base64...")
+        image_b64, image_mime = encode_image_to_base64(screenshot_pil)
+        logger.debug("process_selected_area: Imagen codificada. Preparando para enviar a OpenAI.")
+        answer_path = "imagen"
+        def compute_answer(context, show_partial, cancel_event, on_preliminary):
+            answer = get_routed_answer(question_for_image, context, image_base64=image_b64, on_partial=show_partial,
+                                       image_mime=image_mime, cancel_event=cancel_event, on_preliminary=on_preliminary)
+            return answer, True
+
+    def get_and_show_answer_area(request):
+        def show_partial(partial_text):
+            request.raise_if_cancelled() # Cortar el streaming si ya hay una pregunta más reciente
+            if root_window and root_window.winfo_exists():
+                request.publish(root_window.ui.label, format_display_text(partial_text))
+
+        context = context_for_request(request, root_window)
+        try:
+            answer, confirmed = compute_answer(context, show_partial, request.cancelled,
+                                               lambda fast_answer: publish_preliminary_answer(request, root_window, fast_answer))
+        except ApiError as e:
+            show_api_error(request, root_window, trace, e)
+            return
+        if not confirmed: # Ni a la caché por imagen ni al portapapeles
+            show_unconfirmed_answer(request, root_window, trace, answer)
+            return
+        elapsed_ms = (time.perf_counter() - area_start) * 1000
+        area_path_stats.record_latency(answer_path, elapsed_ms)
+        logger.info("Área respondida por el camino '%s'. %s", answer_path, area_path_stats.stats_text())
+        if image_fingerprint is not None and core.image_cache is not None:
+            core.image_cache.put(image_fingerprint, answer, elapsed_ms)
+        publish_area_answer(request, trace, root_window, answer, answer_path, on_shown)
+
+    request_scheduler.submit("área", traced_request(trace, get_and_show_answer_area))
 
 # Nueva función para capturar solo una región
 def take_screenshot_region(region_dict):
     """Toma una captura de la región especificada y la devuelve como objeto PIL.Image."""
-    print(f"take_screenshot_region: Iniciando captura de región {region_dict}...")
+    import mss # Para capturas de pantalla
+    from PIL import Image
+    logger.debug("take_screenshot_region: Iniciando captura de región %s...", region_dict)
     try:
         with mss.mss() as sct:
             # region_dict ya debe tener {"top", "left", "width", "height"}
             sct_img = sct.grab(region_dict)
-            print("take_screenshot_region: Captura de datos raw de región completada.")
+            logger.debug("take_screenshot_region: Captura de datos raw de región completada.")
             img = Image.frombytes('RGB', (sct_img.width, sct_img.height), sct_img.rgb, 'raw', 'BGR')
-            print("take_screenshot_region: Conversión a PIL.Image completada.")
+            logger.debug("take_screenshot_region: Conversión a PIL.Image completada.")
             return img
     except mss.exception.ScreenShotError as e_mss:
-        print(f"Error específico de MSS al tomar la captura de la región: {e_mss}")
+        logger.error("Error específico de MSS al tomar la captura de la región: %s", e_mss)
         return None
     except Exception as e:
-        print(f"Error general al tomar la captura de la región: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error general al tomar la captura de la región: %s", e)
         return None
 
 # Variables globales para pasar a la callback del botón (simplificación temporal)
-global_pdf_text_context = None
+clipboard_watcher = None # Observador del portapapeles (ClipboardWatcher), creado en check_clipboard
+# Planificador de peticiones: concurrencia limitada y las preguntas nuevas reemplazan a las anteriores
+request_scheduler = RequestScheduler(max_workers=MAX_CONCURRENT_REQUESTS)
+area_path_stats = PathStats() # Latencia por camino (ocr/imagen) de las preguntas por área
+tracer = Tracer() # Métricas solo en memoria; al iniciar se reemplaza por uno que escribe en TRACE_DIRECTORY
 global_answer_window_root = None
 # tray_icon ya está definido arriba
+startup_trace = None # Traza 'arranque' (ver mark_startup), creada al iniciar
+startup_marks = {} # hito -> time.perf_counter()
+startup_lock = threading.Lock()
+label_before_reload = None # Texto de la etiqueta antes de mostrar el estado de una recarga (ver show_reload_status)
+reload_status_shown = None
+
+region_watcher = None # Vigilancia de región activa (RegionWatcher), creada desde la bandeja
+watch_stats = WatchStats() # Coste por captura y latencia de captura a respuesta de la vigilancia (acumulado)
 
 # --- Manejador de Señal para Ctrl+C ---
 def signal_handler(sig, frame):
-    print('\nCtrl+C detectado! Intentando cerrar la aplicación...')
+    logger.info('Ctrl+C detectado! Intentando cerrar la aplicación...')
     quit_app_combined() # Usar la función combinada
 
 # --- Funciones para ejecutar Tkinter en un hilo ---
 def run_tkinter_app():
-    global global_answer_window_root, global_pdf_text_context
+    global global_answer_window_root
     
-    print("Configurando ventana de respuesta en hilo de Tkinter...")
+    logger.debug("Configurando ventana de respuesta en hilo de Tkinter...")
     answer_window = setup_answer_window()
     global_answer_window_root = answer_window
+    answer_window.after(0, mark_startup, "ventana") # Primera vuelta del bucle: la ventana ya se ve
+    if core.corpus_ready.is_set():
+        show_idle_state(answer_window) # El material terminó de cargar mientras se creaba la ventana
     
     # Adjuntar referencia a quit_app_combined para ser llamada desde Tkinter (e.g. Escape)
     # El lambda necesita acceso al icono de la bandeja, que se crea después.
@@ -634,45 +975,137 @@ def run_tkinter_app():
     # Iniciar monitoreo del portapapeles después de que la ventana esté lista
     # y pasar la referencia correcta de la ventana
     if app_running: # Solo si la app sigue corriendo
-        clipboard_thread = threading.Thread(target=check_clipboard, args=(global_pdf_text_context, global_answer_window_root), daemon=True)
+        clipboard_thread = threading.Thread(target=check_clipboard, args=(global_answer_window_root,), daemon=True)
         clipboard_thread.start()
-        print("Hilo de monitoreo de portapapeles iniciado desde hilo de Tkinter.")
+        logger.debug("Hilo de monitoreo de portapapeles iniciado desde hilo de Tkinter.")
 
     tkinter_ready_event.set() # Indicar que Tkinter está listo
-    print("Iniciando bucle principal de Tkinter (mainloop)...")
+    logger.debug("Iniciando bucle principal de Tkinter (mainloop)...")
     try:
         answer_window.mainloop()
     except Exception as e_mainloop:
-        print(f"Error durante mainloop de Tkinter: {e_mainloop}")
+        logger.error("Error durante mainloop de Tkinter: %s", e_mainloop)
     finally:
-        print("Bucle principal de Tkinter finalizado.")
+        logger.debug("Bucle principal de Tkinter finalizado.")
         # Asegurarse de que si mainloop termina (p.ej. por error), la app se cierre.
         # quit_app_combined() # Esto podría causar problemas si ya se está cerrando.
 
 # --- Ejecución Principal ---
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Necesario en Windows si se empaqueta como ejecutable
+    parser = argparse.ArgumentParser(description="Asistente GPT con material de estudio en PDF.")
+    parser.add_argument("--limpiar-cache", action="store_true",
+                        help="Elimina la caché de texto extraído de los PDFs y las de respuestas (por texto y por imagen), y termina.")
+    parser.add_argument("--sin-cache", action="store_true",
+                        help="Extrae el texto de los PDFs sin leer ni escribir la caché.")
+    parser.add_argument("--workers", type=int, default=core.EXTRACTION_WORKERS,
+                        help="Procesos para extraer los PDFs (0 = uno por núcleo, 1 = secuencial).")
+    parser.add_argument("--portapapeles", choices=["auto", "windows", "xfixes", "polling"], default=CLIPBOARD_BACKEND,
+                        help="Mecanismo para detectar cambios del portapapeles.")
+    parser.add_argument("--recarga-pdfs", choices=["auto", "windows", "inotify", "polling", "no"], default=core.PDF_WATCH_BACKEND or "no",
+                        help="Mecanismo para detectar PDFs añadidos, modificados o eliminados ('no' desactiva la recarga en caliente).")
+    parser.add_argument("--motor-sincrono", action="store_true",
+                        help="Usa el cliente síncrono original en lugar del motor asíncrono HTTP/2.")
+    parser.add_argument("--sin-ocr", action="store_true",
+                        help="Envía siempre la captura como imagen, sin intentar el OCR local.")
+    parser.add_argument("--contexto-completo", action="store_true",
+                        help="Envía el material completo en cada pregunta en lugar de los pasajes recuperados.")
+    parser.add_argument("--sin-limpieza", action="store_true",
+                        help="Usa el texto de los PDFs tal como se extrae (sin quitar plantillas ni párrafos repetidos).")
+    parser.add_argument("--modelo-rapido", default=core.FAST_MODEL,
+                        help="Modelo para las peticiones sencillas (y el rápido de la consulta doble).")
+    parser.add_argument("--modelo-fuerte", default=core.OPENAI_MODEL, help="Modelo para las peticiones complejas (imágenes, opción múltiple).")
+    parser.add_argument("--sin-enrutado", action="store_true",
+                        help="Envía todas las peticiones al modelo fuerte.")
+    parser.add_argument("--consulta-doble", action="store_true",
+                        help="Pide al modelo rápido y al fuerte a la vez: muestra la respuesta rápida y la corrige si la fuerte difiere.")
+    parser.add_argument("--sin-respuestas-locales", action="store_true",
+                        help="Envía todas las preguntas a la API, sin intentar responder las de opción múltiple con el material.")
+    parser.add_argument("--sin-cache-imagenes", action="store_true",
+                        help="Envía cada captura de área aunque sea igual a una ya respondida (sin caché por hash perceptual).")
+    parser.add_argument("--vigilancia-fps", type=float, default=WATCH_CAPTURES_PER_SECOND,
+                        help="Capturas por segundo de la región vigilada.")
+    parser.add_argument("--vigilancia-umbral", type=float, default=WATCH_CHANGE_THRESHOLD,
+                        help="Proporción (0-1) de píxeles que deben cambiar en la región vigilada para enviar una pregunta nueva.")
+    parser.add_argument("--vigilancia-estable", type=float, default=WATCH_STABLE_SECONDS,
+                        help="Segundos que el contenido nuevo de la región vigilada debe quedarse quieto antes de enviarse.")
+    parser.add_argument("--perfilar", choices=profiler.MODES,
+                        help="Perfila desde el arranque hasta salir (o hasta detenerlo en la bandeja); archivos en 'perfiles'.")
+    parser.add_argument("--log-nivel", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default=LOG_LEVEL,
+                        help="Nivel mínimo de los mensajes de registro.")
+    parser.add_argument("--log-archivo", default=LOG_FILE, help="Escribe también el registro en este archivo.")
+    parser.add_argument("--sin-trazas", action="store_true",
+                        help="No escribe las trazas (JSONL) ni el archivo de métricas en disco.")
+    args = parser.parse_args()
+    configure_logging(args.log_nivel, args.log_archivo)
+
+    if args.limpiar_cache:
+        from pdf_extraction import clear_cache # Extracción de PDFs con caché en disco
+        clear_cache(core.PDF_DIRECTORY)
+        AnswerCache(core.ANSWER_CACHE_PATH).clear()
+        logger.info("Caché de respuestas eliminada: %s", os.path.abspath(core.ANSWER_CACHE_PATH))
+        ImageAnswerCache(core.IMAGE_CACHE_PATH).clear()
+        logger.info("Caché de respuestas por imagen eliminada: %s", os.path.abspath(core.IMAGE_CACHE_PATH))
+        sys.exit(0)
+
     signal.signal(signal.SIGINT, signal_handler) # Registrar el manejador para Ctrl+C
 
-    print("Cargando texto de los PDFs...")
-    pdf_text_context = extract_text_from_pdfs(PDF_DIRECTORY)
-    global_pdf_text_context = pdf_text_context # Asignar a la variable global
+    if args.sin_trazas:
+        TRACING_ENABLED = False
+    if TRACING_ENABLED:
+        tracer = Tracer(jsonl_path=os.path.join(TRACE_DIRECTORY, TRACE_JSONL_FILENAME),
+                        metrics_path=os.path.join(TRACE_DIRECTORY, METRICS_FILENAME))
+        logger.info("Trazas en %s (%s y %s).", os.path.abspath(TRACE_DIRECTORY), TRACE_JSONL_FILENAME, METRICS_FILENAME)
+
+    if args.perfilar:
+        profiler.start_session(args.perfilar)
+    startup_trace = tracer.start_trace("arranque")
+    mark_startup("importaciones", at=MODULES_LOADED_AT)
+    if not core.API_KEY:
+        logger.error("%s", core.MISSING_API_KEY_MESSAGE)
+
+    CLIPBOARD_BACKEND = args.portapapeles
+    if args.contexto_completo:
+        core.USE_RETRIEVAL = False
+    if args.sin_limpieza:
+        core.USE_CORPUS_CLEANING = False
+    if args.sin_ocr:
+        USE_OCR = False
+    if args.sin_respuestas_locales:
+        core.USE_LOCAL_ANSWERER = False
+    if args.sin_cache_imagenes:
+        core.USE_IMAGE_CACHE = False
+    WATCH_CAPTURES_PER_SECOND = args.vigilancia_fps
+    WATCH_CHANGE_THRESHOLD = args.vigilancia_umbral
+    WATCH_STABLE_SECONDS = args.vigilancia_estable
+    core.FAST_MODEL = args.modelo_rapido
+    core.OPENAI_MODEL = args.modelo_fuerte
+    core.USE_MODEL_ROUTER = not args.sin_enrutado
+    core.HEDGED_REQUESTS = args.consulta_doble
+    if args.motor_sincrono:
+        core.USE_ASYNC_ENGINE = False
+    core.PDF_WATCH_BACKEND = None if args.recarga_pdfs == "no" else args.recarga_pdfs
+    core.open_answer_cache()
+    core.open_image_cache()
+    # Lo lento (importar openai, precalentar la conexión, extraer los PDFs) va a un hilo aparte:
+    # la ventana y la bandeja se muestran enseguida y las preguntas que lleguen antes esperan al material
+    logger.info("Cargando el material de estudio en segundo plano...")
+    core.start_background_loading(use_cache=not args.sin_cache, workers=args.workers, on_ready=on_corpus_ready)
 
-    if not pdf_text_context:
-        print("Advertencia: No se pudo cargar texto de los PDFs. El asistente podría no tener contexto de clase.")
-    
     # Iniciar Tkinter en un hilo separado
     tkinter_thread = threading.Thread(target=run_tkinter_app, daemon=True)
     tkinter_thread.start()
     
-    print("Esperando a que la GUI de Tkinter esté lista...")
+    logger.debug("Esperando a que la GUI de Tkinter esté lista...")
     tkinter_ready_event.wait() # Esperar a que la ventana de Tkinter esté configurada
-    print("GUI de Tkinter lista.")
+    logger.debug("GUI de Tkinter lista.")
 
     if not global_answer_window_root:
-        print("Error: La ventana de Tkinter no se inicializó correctamente. Saliendo.")
+        logger.error("La ventana de Tkinter no se inicializó correctamente. Saliendo.")
         sys.exit(1)
 
     # Configurar y ejecutar el icono de la bandeja del sistema en el hilo principal
+    import pystray # Para el icono en la bandeja del sistema
     icon_image = create_icon_image()
     
     # Crear los items del menú
@@ -684,6 +1117,10 @@ if __name__ == "__main__":
             default=True, # Marcar como acción por defecto
             visible=True # Asegurar que sea visible en el menú de clic derecho también
         ),
+        pystray.MenuItem(
+            lambda item=None: f"Dejar de Vigilar Región ({watch_stats.stats_text()})" if region_watcher is not None else "Vigilar Región",
+            toggle_region_watch_action
+        ),
         pystray.MenuItem('Mostrar/Ocultar Ventana', toggle_window_visibility),
         pystray.MenuItem(
             # Aceptar un argumento opcional (item) que pystray podría pasar al generar el texto del menú
@@ -691,6 +1128,16 @@ if __name__ == "__main__":
             toggle_clipboard_monitoring_action
         ),
         pystray.MenuItem('Alternar Color Texto', toggle_text_color_action),
+        pystray.MenuItem(
+            lambda item=None: f"Vaciar Caché Respuestas ({core.answer_cache.stats_text()})" if core.answer_cache else "Caché Respuestas Desactivada",
+            clear_answer_cache_action
+        ),
+        pystray.MenuItem(profiling_menu_text, lambda: toggle_profiling_action(profiler.FULL)),
+        pystray.MenuItem(
+            'Perfilar por Muestreo (sesiones largas)',
+            lambda: toggle_profiling_action(profiler.SAMPLING),
+            visible=lambda item: profiler.active_session() is None # Mientras perfila, se detiene con el item anterior
+        ),
         pystray.MenuItem('Salir', lambda: quit_app_combined(tray_icon, global_answer_window_root))
     ]
     menu = pystray.Menu(*menu_items) # Crear una instancia de pystray.Menu
@@ -704,16 +1151,20 @@ if __name__ == "__main__":
         menu # Pasar la instancia de pystray.Menu
     )
 
-    print("Iniciando icono en la bandeja del sistema. La aplicación está en ejecución.")
+    logger.info("Iniciando icono en la bandeja del sistema. La aplicación está en ejecución.")
     # Mensaje actualizado para reflejar el comportamiento del clic izquierdo y derecho
-    print("Haz clic izquierdo en el icono para Seleccionar Área. Clic derecho para más opciones (Mostrar/Ocultar Ventana, Salir). Presiona ESC en la ventana (si está visible) o usa Ctrl+C para salir.")
+    logger.info("Haz clic izquierdo en el icono para Seleccionar Área. Clic derecho para más opciones (Mostrar/Ocultar Ventana, Salir). Presiona ESC en la ventana (si está visible) o usa Ctrl+C para salir.")
     
+    def on_tray_ready(icon):
+        icon.visible = True # Lo que hace pystray por defecto si no se le pasa setup
+        mark_startup("bandeja")
+
     try:
-        tray_icon.run() # Esto es bloqueante y se ejecutará en el hilo principal
+        tray_icon.run(setup=on_tray_ready) # Esto es bloqueante y se ejecutará en el hilo principal
     except Exception as e_tray:
-        print(f"Error durante la ejecución del icono de la bandeja: {e_tray}")
+        logger.error("Error durante la ejecución del icono de la bandeja: %s", e_tray)
     finally:
-        print("Ejecución del icono de la bandeja finalizada.")
+        logger.info("Ejecución del icono de la bandeja finalizada.")
         # Asegurar que todo se cierre si tray_icon.run() termina por alguna razón
         # (aparte de quit_app_combined siendo llamada)
         if app_running: # Si no se cerró por quit_app_combined
@@ -721,8 +1172,8 @@ if __name__ == "__main__":
         
         # Esperar a que el hilo de Tkinter termine si es necesario (aunque es demonio)
         if tkinter_thread.is_alive():
-            print("Esperando al hilo de Tkinter...")
+            logger.debug("Esperando al hilo de Tkinter...")
             # No se puede hacer join a un hilo demonio de esta forma fácilmente si sys.exit() se llama.
             # La lógica de cierre debería haber manejado la GUI.
         
-    print("Script finalizado limpiamente.") 
\ No newline at end of file
+    logger.info("Script finalizado limpiamente.") 
\ No newline at end of file
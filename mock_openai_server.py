@@ -0,0 +1,255 @@
+"""
+Servidor local compatible con la API de OpenAI (solo /v1/chat/completions) para probar y medir
+la app sin gastar tokens ni depender de la red.
+
+Uso:
+    python mock_openai_server.py --puerto 8765 --latencia 0.3 --retardo-token 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python main.py
+
+Para probar el enrutado y la consulta doble, cada modelo puede tener su propia latencia y respuesta
+(--latencia-modelo gpt-4o-mini=0.1 --respuesta-modelo "gpt-4o-mini=b) Otra").
+
+Para probar reintentos y el cortacircuitos se pueden inyectar fallos: una secuencia fija
+(--fallos 429,429,500: las tres primeras peticiones fallan así) o una proporción aleatoria
+(--tasa-fallos 0.3 --fallo-aleatorio 503). "parcial" corta la conexión a mitad de una respuesta en
+streaming, después de enviar los primeros fragmentos.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = "a) Respuesta de prueba del servidor local."
+# Fallos que se pueden inyectar: código HTTP (429, 500, 503...), "cuota" (429 sin saldo), "corte" (cierra la conexión)
+# o "parcial" (en streaming, cierra la conexión tras PARTIAL_FAILURE_PIECES fragmentos; sin streaming es un "corte")
+FAILURE_ERRORS = {
+    429: ("Rate limit reached for requests", "requests", "rate_limit_exceeded"),
+    "cuota": ("You exceeded your current quota", "insufficient_quota", "insufficient_quota"),
+    400: ("Invalid request", "invalid_request_error", None),
+    401: ("Incorrect API key provided", "invalid_request_error", "invalid_api_key"),
+}
+PARTIAL_FAILURE_PIECES = 2
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, como la API real
+
+    def log_message(self, format, *args):
+        pass # Silencioso: las mediciones no deben ensuciarse con logs por petición
+
+    def do_HEAD(self):
+        # Usado por el precalentamiento de conexiones
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+
+        config = self.server.config
+        messages = body.get("messages", [])
+        # Caché de prompt simulada: si todos los mensajes salvo el último coinciden con la petición
+        # anterior, ese prefijo cuenta como cacheado (en bloques de 128 tokens a partir de 1024, como la API)
+        prefix = json.dumps(messages[:-1], ensure_ascii=False)
+        with self.server.lock:
+            self.server.requests_received += 1
+            self.server.last_request = body
+            failure = self.server.failures.pop(0) if self.server.failures else None
+            if failure is None and config["failure_rate"] and random.random() < config["failure_rate"]:
+                failure = config["random_failure"]
+            if failure is not None:
+                self.server.failures_sent += 1
+            else:
+                prefix_cached = prefix == self.server.last_prefix
+                self.server.last_prefix = prefix
+        model = body.get("model", "gpt-4o")
+        time.sleep(config["model_latency"].get(model, config["latency"])) # Tiempo hasta el primer byte
+        answer = config["model_answers"].get(model, config["answer"])
+        if failure == "parcial" and body.get("stream"):
+            self._send_stream(model, answer, config["token_delay"], cut_after=PARTIAL_FAILURE_PIECES)
+            return
+        if failure is not None:
+            self._send_failure(failure, config["retry_after"])
+            return
+        prompt_chars = len(json.dumps(messages, ensure_ascii=False))
+        usage = {"prompt_tokens": prompt_chars // 4, "completion_tokens": max(1, len(answer) // 4)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        prefix_tokens = len(prefix) // 4
+        cached_tokens = (prefix_tokens // 128) * 128 if prefix_cached and prefix_tokens >= 1024 else 0
+        usage["prompt_tokens_details"] = {"cached_tokens": cached_tokens}
+
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            self._send_stream(model, answer, config["token_delay"], usage if include_usage else None)
+        else:
+            self._send_json(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+    def _send_failure(self, failure, retry_after):
+        if failure in ("corte", "parcial"):
+            self.close_connection = True
+            self.connection.shutdown(2) # El cliente ve una conexión cerrada sin respuesta
+            return
+        status = 429 if failure == "cuota" else int(failure)
+        message, error_type, code = FAILURE_ERRORS.get(failure, ("The server had an error while processing your request", "server_error", None))
+        headers = {}
+        if status == 429 and failure != "cuota" and retry_after is not None:
+            headers["retry-after"] = f"{retry_after:g}"
+            headers["x-ratelimit-reset-requests"] = f"{retry_after:g}s"
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": code}}, headers)
+
+    def _send_json(self, status, payload, extra_headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model, answer, token_delay, usage=None, cut_after=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        pieces = [{"role": "assistant", "content": ""}] + [{"content": word} for word in _split_tokens(answer)]
+        for i, delta in enumerate(pieces):
+            if i > 0:
+                time.sleep(token_delay)
+            chunk = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            if cut_after is not None and i >= cut_after: # Fallo "parcial": el cliente ya recibió texto
+                self.close_connection = True
+                self.connection.shutdown(2)
+                return
+        final = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        self._write_chunk(f"data: {json.dumps(final)}\n\n")
+        if usage is not None:
+            # Con stream_options.include_usage el uso llega en un último fragmento sin opciones
+            self._write_chunk(f"data: {json.dumps(dict(base, choices=[], usage=usage))}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n") # Fin del cuerpo chunked
+        self.wfile.flush()
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def parse_failure(text):
+    """'429' -> 429; 'cuota' y 'corte' se quedan como texto."""
+    text = text.strip().lower()
+    return int(text) if text.isdigit() else text
+
+def parse_model_values(values, convert=str):
+    """["modelo=valor", ...] -> {modelo: convert(valor)}."""
+    parsed = {}
+    for value in values:
+        model, _, text = value.partition("=")
+        parsed[model.strip()] = convert(text)
+    return parsed
+
+def _split_tokens(text):
+    """Parte la respuesta en 'tokens' (palabras con su espacio) para simular el streaming."""
+    words = text.split(" ")
+    return [w if i == len(words) - 1 else w + " " for i, w in enumerate(words)]
+
+
+class MockOpenAIServer:
+    """Servidor en un hilo de fondo; base_url sirve para OpenAI(base_url=...)."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_delay=0.0, answer=DEFAULT_ANSWER,
+                 failures=(), failure_rate=0.0, random_failure=503, retry_after=1.0, model_latency=None, model_answers=None):
+        self.httpd = ThreadingHTTPServer((host, port), MockOpenAIHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = {"latency": latency, "token_delay": token_delay, "answer": answer,
+                             "failure_rate": failure_rate, "random_failure": random_failure, "retry_after": retry_after,
+                             "model_latency": dict(model_latency or {}), # modelo -> segundos (sustituye a latency)
+                             "model_answers": dict(model_answers or {})} # modelo -> respuesta (sustituye a answer)
+        self.httpd.lock = threading.Lock()
+        self.httpd.failures = list(failures) # Próximas respuestas fallidas, en orden
+        self.httpd.failures_sent = 0
+        self.httpd.requests_received = 0
+        self.httpd.last_request = None
+        self.httpd.last_prefix = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def config(self):
+        return self.httpd.config
+
+    @property
+    def requests_received(self):
+        return self.httpd.requests_received
+
+    @property
+    def failures_sent(self):
+        return self.httpd.failures_sent
+
+    def inject_failures(self, *failures):
+        """Las próximas peticiones fallarán con estos códigos (429, 500...), "cuota", "corte" o "parcial", en orden."""
+        with self.httpd.lock:
+            self.httpd.failures.extend(failures)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local compatible con la API de chat de OpenAI.")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.3, help="Segundos hasta el primer byte.")
+    parser.add_argument("--retardo-token", type=float, default=0.02, help="Segundos entre fragmentos en streaming.")
+    parser.add_argument("--respuesta", default=DEFAULT_ANSWER, help="Texto que devuelve siempre el servidor.")
+    parser.add_argument("--fallos", default="",
+                        help="Respuestas fallidas al arrancar, separadas por comas (p.ej. 429,429,500,cuota,corte,parcial).")
+    parser.add_argument("--tasa-fallos", type=float, default=0.0, help="Proporción de peticiones que fallan al azar.")
+    parser.add_argument("--fallo-aleatorio", default="503", help="Fallo que se usa con --tasa-fallos.")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Segundos de Retry-After en las respuestas 429.")
+    parser.add_argument("--latencia-modelo", action="append", default=[], metavar="MODELO=SEGUNDOS",
+                        help="Latencia propia de un modelo (se puede repetir).")
+    parser.add_argument("--respuesta-modelo", action="append", default=[], metavar="MODELO=TEXTO",
+                        help="Respuesta propia de un modelo (se puede repetir).")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(port=args.puerto, latency=args.latencia, token_delay=args.retardo_token, answer=args.respuesta,
+                              failures=[parse_failure(f) for f in args.fallos.split(",") if f.strip()],
+                              failure_rate=args.tasa_fallos, random_failure=parse_failure(args.fallo_aleatorio),
+                              retry_after=args.retry_after, model_latency=parse_model_values(args.latencia_modelo, float),
+                              model_answers=parse_model_values(args.respuesta_modelo))
+    print(f"Servidor local de OpenAI escuchando en {server.base_url} (Ctrl+C para salir)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
@@ -0,0 +1,116 @@
+import re
+import threading
+from collections import deque
+
+from answer_cache import split_options, normalize_text
+
+# --- Configuración por defecto del enrutado de modelos ---
+FAST_MODEL = "gpt-4o-mini"
+STRONG_MODEL = "gpt-4o"
+FAST = "rapido"
+STRONG = "fuerte"
+# Tipos de petición
+IMAGE = "imagen"
+MULTIPLE_CHOICE = "opcion_multiple"
+FILL_BLANK = "completar"
+DIRECT = "directa"
+# Modelo (rápido o fuerte) de cada tipo de petición
+DEFAULT_ROUTES = {IMAGE: STRONG, MULTIPLE_CHOICE: STRONG, FILL_BLANK: FAST, DIRECT: FAST}
+FAST_MAX_QUESTION_CHARS = 300 # Una pregunta más larga va al modelo fuerte aunque su tipo vaya al rápido
+LATENCY_WINDOW = 200 # Latencias recientes que se guardan por modelo para los percentiles
+
+_FILL_BLANK_RE = re.compile(r"_{3,}|\.{4,}|^\s*(complete|completa|completar|complete the)\b", re.IGNORECASE | re.MULTILINE)
+_ANSWER_LETTER_RE = re.compile(r"^\s*([a-hA-H])[\)\.]\s*")
+
+
+def classify_request(question, has_image=False):
+    """Tipo de petición: imagen, opción múltiple (alternativas a), b)...), para completar o directa."""
+    if has_image:
+        return IMAGE
+    if split_options(question)[1]:
+        return MULTIPLE_CHOICE
+    if _FILL_BLANK_RE.search(question):
+        return FILL_BLANK
+    return DIRECT
+
+def answers_agree(first, second):
+    """
+    Compara dos respuestas: si ambas empiezan por una letra de alternativa ("b) ...") basta con la letra
+    (los modelos copian el texto de la alternativa con pequeñas diferencias); si no, el texto normalizado.
+    """
+    first_letter = _ANSWER_LETTER_RE.match(first or "")
+    second_letter = _ANSWER_LETTER_RE.match(second or "")
+    if first_letter and second_letter:
+        return first_letter.group(1).lower() == second_letter.group(1).lower()
+    return normalize_text(first or "") == normalize_text(second or "")
+
+
+class ModelRouter:
+    """Elige el modelo de cada petición según su tipo y tamaño: el rápido para lo trivial, el fuerte para el resto."""
+
+    def __init__(self, fast_model=FAST_MODEL, strong_model=STRONG_MODEL, routes=None, fast_max_chars=FAST_MAX_QUESTION_CHARS):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.routes = dict(DEFAULT_ROUTES, **(routes or {}))
+        self.fast_max_chars = fast_max_chars
+
+    def route(self, question, has_image=False):
+        """Devuelve (modelo, tipo de petición, FAST o STRONG)."""
+        kind = classify_request(question, has_image=has_image)
+        tier = self.routes.get(kind, STRONG)
+        if tier == FAST and len(question) > self.fast_max_chars:
+            tier = STRONG
+        return (self.fast_model if tier == FAST else self.strong_model), kind, tier
+
+
+class ModelStats:
+    """Latencia de las llamadas por modelo y tasa de desacuerdo entre el rápido y el fuerte en las consultas dobles."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.lock = threading.Lock()
+        self.window = window
+        self.latencies_ms = {} # modelo -> deque de ms recientes
+        self.calls = {} # modelo -> llamadas (incluidas las fallidas)
+        self.errors = {}
+        self.hedged = 0 # Consultas dobles con las dos respuestas
+        self.disagreements = 0
+        self.upgrades = 0 # Respuestas rápidas ya mostradas y corregidas por la fuerte
+
+    def record_call(self, model, elapsed_ms, error=False):
+        with self.lock:
+            self.calls[model] = self.calls.get(model, 0) + 1
+            if error:
+                self.errors[model] = self.errors.get(model, 0) + 1
+            else:
+                self.latencies_ms.setdefault(model, deque(maxlen=self.window)).append(elapsed_ms)
+
+    def record_hedge(self, agreed, upgraded=False):
+        with self.lock:
+            self.hedged += 1
+            if not agreed:
+                self.disagreements += 1
+            if upgraded:
+                self.upgrades += 1
+
+    def summary(self):
+        """{"modelos": {modelo: {llamadas, errores, p50_ms, p95_ms}}, "dobles", "desacuerdos", "correcciones"}."""
+        with self.lock:
+            models = {}
+            for model, calls in sorted(self.calls.items()):
+                ordered = sorted(self.latencies_ms.get(model, ()))
+                models[model] = {"llamadas": calls, "errores": self.errors.get(model, 0),
+                                 "p50_ms": ordered[len(ordered) // 2] if ordered else None,
+                                 "p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] if ordered else None}
+            return {"modelos": models, "dobles": self.hedged, "desacuerdos": self.disagreements, "correcciones": self.upgrades}
+
+    def stats_text(self):
+        summary = self.summary()
+        parts = []
+        for model, row in summary["modelos"].items():
+            latency = f"p50 {row['p50_ms']:.0f} ms, p95 {row['p95_ms']:.0f} ms" if row["p50_ms"] is not None else "sin respuestas"
+            errors = f", {row['errores']} errores" if row["errores"] else ""
+            parts.append(f"{model}: {row['llamadas']} llamadas, {latency}{errors}")
+        if summary["dobles"]:
+            rate = summary["desacuerdos"] / summary["dobles"] * 100
+            parts.append(f"desacuerdo {summary['desacuerdos']}/{summary['dobles']} ({rate:.0f}%), {summary['correcciones']} corregidas")
+        return "Modelos: " + ("; ".join(parts) if parts else "sin llamadas")
@@ -0,0 +1,98 @@
+import logging
+import time
+import threading
+from PIL import ImageOps
+
+try:
+    import pytesseract # Opcional: requiere además el ejecutable de Tesseract instalado
+except ImportError:
+    pytesseract = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración del OCR local ---
+OCR_LANGUAGES = "spa+eng"
+OCR_TARGET_MIN_HEIGHT = 900 # Tesseract lee mejor texto grande: se amplía si la captura es más baja
+OCR_MAX_UPSCALE = 3.0
+
+_availability = None # Caché de la comprobación del ejecutable (None = sin comprobar)
+_availability_lock = threading.Lock()
+
+
+def ocr_available(tesseract_cmd=None):
+    """Indica si pytesseract y el ejecutable de Tesseract están disponibles (se comprueba una vez)."""
+    global _availability
+    with _availability_lock:
+        if _availability is None:
+            if pytesseract is None:
+                logger.info("OCR local no disponible: falta el paquete 'pytesseract'.")
+                _availability = False
+            else:
+                if tesseract_cmd:
+                    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+                try:
+                    version = pytesseract.get_tesseract_version()
+                    logger.info("OCR local disponible (Tesseract %s).", version)
+                    _availability = True
+                except Exception as e:
+                    logger.info("OCR local no disponible: no se encontró Tesseract (%s).", e)
+                    _availability = False
+        return _availability
+
+def _prepare_for_ocr(image_pil):
+    image = ImageOps.autocontrast(ImageOps.grayscale(image_pil), cutoff=1)
+    if image.height < OCR_TARGET_MIN_HEIGHT:
+        scale = min(OCR_TARGET_MIN_HEIGHT / image.height, OCR_MAX_UPSCALE)
+        image = image.resize((round(image.width * scale), round(image.height * scale)))
+    return image
+
+def extract_question_text(image_pil, languages=OCR_LANGUAGES):
+    """
+    Extrae el texto de una captura con Tesseract.
+    Devuelve (texto, confianza_media 0-100, ms). La confianza es la media de las palabras reconocidas.
+    """
+    start = time.perf_counter()
+    data = pytesseract.image_to_data(_prepare_for_ocr(image_pil), lang=languages, output_type=pytesseract.Output.DICT)
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        confidence = float(data["conf"][i])
+        if not word or confidence < 0:
+            continue
+        confidences.append(confidence)
+        line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(line_key, []).append(word)
+    text = "\n".join(" ".join(words) for _key, words in sorted(lines.items()))
+    mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, mean_confidence, (time.perf_counter() - start) * 1000
+
+
+class PathStats:
+    """Latencias por camino (p.ej. "ocr" frente a "imagen") y tasa de recurso a la imagen."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies_ms = {}
+        self.fallbacks = 0 # OCR intentado pero con confianza insuficiente
+        self.ocr_attempts = 0
+
+    def record_attempt(self, fell_back):
+        with self.lock:
+            self.ocr_attempts += 1
+            if fell_back:
+                self.fallbacks += 1
+
+    def record_latency(self, path, elapsed_ms):
+        with self.lock:
+            self.latencies_ms.setdefault(path, []).append(elapsed_ms)
+
+    def stats_text(self):
+        with self.lock:
+            parts = []
+            for path, values in sorted(self.latencies_ms.items()):
+                ordered = sorted(values)
+                parts.append(f"{path}: {len(values)} resp., p50 {ordered[len(ordered) // 2]:.0f} ms")
+            rate = (self.fallbacks / self.ocr_attempts * 100) if self.ocr_attempts else 0.0
+            parts.append(f"recurso a imagen {self.fallbacks}/{self.ocr_attempts} ({rate:.0f}%)")
+            return "; ".join(parts)
@@ -0,0 +1,281 @@
+import logging
+import os
+import json
+import time
+import hashlib
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pypdf
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración de la caché de extracción ---
+# La caché vive junto al corpus (p.ej. pdfs/.cache/) para que viaje con los PDFs.
+CACHE_DIRNAME = ".cache"
+# Incrementar si cambia el formato de las entradas o la forma de extraer el texto
+CACHE_FORMAT_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024 # Leer los PDFs en bloques de 1 MB al calcular el hash
+
+# --- Configuración de la extracción paralela ---
+PAGES_PER_TASK = 4 # Páginas que extrae cada tarea del pool de procesos
+# Por debajo de este número de páginas pendientes, crear procesos cuesta más de lo que ahorra
+PARALLEL_MIN_PAGES = 16
+
+
+def get_cache_dir(directory):
+    """Devuelve la ruta del directorio de caché asociado a un directorio de PDFs."""
+    return os.path.join(directory, CACHE_DIRNAME)
+
+def compute_file_hash(filepath):
+    """Calcula el SHA-256 del contenido de un archivo."""
+    sha = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def cache_key(file_hash):
+    """Clave de caché: hash del contenido + versión de pypdf + versión del formato."""
+    return f"{file_hash}-pypdf{pypdf.__version__}-v{CACHE_FORMAT_VERSION}"
+
+def list_pdf_files(directory):
+    """Lista los PDFs del directorio en un orden fijo (alfabético)."""
+    return sorted(f for f in os.listdir(directory) if f.lower().endswith(".pdf"))
+
+def extract_pages(filepath):
+    """Extrae el texto de cada página de un PDF. Devuelve una lista (una entrada por página)."""
+    reader = PdfReader(filepath)
+    return [page.extract_text() or "" for page in reader.pages]
+
+def load_cached_entry(cache_dir, key):
+    """Carga una entrada de la caché. Devuelve None si no existe o está corrupta."""
+    entry_path = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.isfile(entry_path):
+        return None
+    try:
+        with open(entry_path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        if entry.get("key") != key or not isinstance(entry.get("pages"), list):
+            return None
+        return entry
+    except (OSError, ValueError) as e:
+        logger.warning("Entrada de caché ilegible (%s): %s", entry_path, e)
+        return None
+
+def cached_document(directory, document):
+    """
+    El documento ({"filename", "pages", "key"}) con las páginas tal como se extrajeron, leídas de la caché
+    por su clave. None si no está en la caché (p.ej. se cargó sin caché).
+    """
+    entry = load_cached_entry(get_cache_dir(directory), document["key"]) if document.get("key") else None
+    if entry is None:
+        return None
+    return {"filename": document["filename"], "pages": entry["pages"], "key": document["key"]}
+
+def save_cached_entry(cache_dir, key, filename, pages, extraction_seconds):
+    """Guarda las páginas extraídas de un PDF en la caché (escritura atómica)."""
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = {
+        "key": key,
+        "filename": filename,
+        "pypdf_version": pypdf.__version__,
+        "format_version": CACHE_FORMAT_VERSION,
+        "extraction_seconds": extraction_seconds, # Tiempo del camino en frío, para comparar
+        "pages": pages,
+    }
+    entry_path = os.path.join(cache_dir, f"{key}.json")
+    tmp_path = entry_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, entry_path)
+
+def prune_cache(cache_dir, valid_keys):
+    """Elimina entradas de la caché que ya no corresponden a ningún PDF actual."""
+    if not os.path.isdir(cache_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(cache_dir):
+        # Solo entradas de texto extraído ("<hash>-pypdf<versión>-v<formato>.json"); otros archivos
+        # de la caché del corpus (p.ej. conteos de tokens) no se tocan
+        if name.endswith(".json") and "-pypdf" in name and name[:-len(".json")] not in valid_keys:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+                removed += 1
+            except OSError as e:
+                logger.warning("No se pudo eliminar la entrada de caché %s: %s", name, e)
+    return removed
+
+def clear_cache(directory):
+    """Invalida por completo la caché de extracción de un directorio de PDFs."""
+    cache_dir = get_cache_dir(directory)
+    if not os.path.isdir(cache_dir):
+        logger.info("No hay caché de extracción en: %s", os.path.abspath(cache_dir))
+        return False
+    shutil.rmtree(cache_dir)
+    logger.info("Caché de extracción eliminada: %s", os.path.abspath(cache_dir))
+    return True
+
+def count_pages(filepath):
+    """Devuelve el número de páginas de un PDF sin extraer su texto."""
+    return len(PdfReader(filepath).pages)
+
+def extract_page_range(filepath, start, stop):
+    """
+    Extrae el texto de las páginas [start, stop) de un PDF.
+    Se ejecuta en los procesos del pool, por eso es una función de nivel de módulo.
+    Devuelve (páginas, segundos empleados).
+    """
+    task_start = time.perf_counter()
+    reader = PdfReader(filepath)
+    pages = [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+    return pages, time.perf_counter() - task_start
+
+def resolve_worker_count(workers):
+    """Normaliza el número de procesos: None o 0 significa uno por núcleo."""
+    if not workers or workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+def extract_pages_parallel(filepaths, workers, pages_per_task=PAGES_PER_TASK):
+    """
+    Extrae varios PDFs repartiendo bloques de páginas entre un pool de procesos.
+    Los resultados se reensamblan en orden fijo de documento/página.
+    Devuelve un dict {filepath: (páginas, segundos)}; los PDFs que fallan no aparecen.
+    Si hay menos de PARALLEL_MIN_PAGES páginas en total devuelve {} y no crea el pool.
+    """
+    tasks = [] # (filepath, start, stop)
+    total_pages_all = 0
+    for filepath in filepaths:
+        try:
+            total_pages = count_pages(filepath)
+        except Exception as e:
+            logger.error("Error al leer %s: %s", os.path.basename(filepath), e)
+            continue
+        total_pages_all += total_pages
+        for start in range(0, total_pages, pages_per_task):
+            tasks.append((filepath, start, min(start + pages_per_task, total_pages)))
+        if total_pages == 0:
+            tasks.append((filepath, 0, 0))
+
+    if total_pages_all < PARALLEL_MIN_PAGES:
+        return {}
+
+    logger.info("Procesando %s PDFs (%s páginas) en paralelo con %s procesos...", len(filepaths), total_pages_all, workers)
+    partial = {} # filepath -> {start: páginas}
+    seconds = {}
+    failed = set()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(extract_page_range, *task): task for task in tasks}
+        for future in as_completed(futures):
+            filepath, start, _stop = futures[future]
+            try:
+                pages, elapsed = future.result()
+            except Exception as e:
+                if filepath not in failed:
+                    logger.error("Error al leer %s: %s", os.path.basename(filepath), e)
+                failed.add(filepath)
+                continue
+            partial.setdefault(filepath, {})[start] = pages
+            seconds[filepath] = seconds.get(filepath, 0.0) + elapsed
+
+    results = {}
+    for filepath in filepaths:
+        if filepath in failed or filepath not in partial:
+            continue
+        blocks = partial[filepath]
+        results[filepath] = ([page for start in sorted(blocks) for page in blocks[start]], seconds[filepath])
+    return results
+
+def extract_documents(directory, use_cache=True, workers=1, reuse=None):
+    """
+    Extrae el texto de todos los PDFs del directorio, página por página.
+    Usa la caché en disco para los PDFs sin cambios y solo re-procesa los nuevos o modificados.
+    Con workers distinto de 1 (None/0 = un proceso por núcleo) los PDFs a procesar se reparten
+    por bloques de páginas en un pool de procesos.
+    reuse ({nombre: documento} de una carga anterior) da los PDFs que se sabe que no cambiaron:
+    se toman tal cual, sin leerlos ni calcular su hash (recarga incremental).
+    Devuelve una lista de dicts {"filename", "pages", "key"} en orden fijo.
+    """
+    cache_dir = get_cache_dir(directory)
+    workers = resolve_worker_count(workers)
+    valid_keys = set()
+    pages_by_filename = {}
+    keys_by_filename = {}
+    pending = [] # (filename, filepath, key) de los PDFs que hay que extraer
+    hits = 0
+    reused = 0
+    cold_seconds_saved = 0.0
+    start = time.perf_counter()
+
+    filenames = list_pdf_files(directory)
+    for filename in filenames:
+        previous = reuse.get(filename) if reuse else None
+        if previous is not None and previous.get("key"):
+            pages_by_filename[filename] = previous["pages"]
+            keys_by_filename[filename] = previous["key"]
+            valid_keys.add(previous["key"])
+            reused += 1
+            continue
+        filepath = os.path.join(directory, filename)
+        file_start = time.perf_counter()
+        try:
+            key = cache_key(compute_file_hash(filepath))
+        except OSError as e:
+            logger.error("Error al leer %s: %s", filename, e)
+            continue
+        valid_keys.add(key)
+        keys_by_filename[filename] = key
+        entry = load_cached_entry(cache_dir, key) if use_cache else None
+        if entry is not None:
+            pages_by_filename[filename] = entry["pages"]
+            hits += 1
+            cold_seconds_saved += entry.get("extraction_seconds", 0.0)
+            elapsed_ms = (time.perf_counter() - file_start) * 1000
+            logger.debug("Desde caché: %s (%s páginas, %.1f ms; en frío tomó %.0f ms)", filename, len(entry["pages"]), elapsed_ms, entry.get("extraction_seconds", 0.0) * 1000)
+        else:
+            pending.append((filename, filepath, key))
+
+    extracted = {} # filepath -> (páginas, segundos)
+    if pending and workers > 1:
+        try:
+            extracted = extract_pages_parallel([filepath for _, filepath, _ in pending], workers)
+        except Exception as e: # p.ej. no se pudo crear el pool de procesos
+            logger.warning("Error en la extracción paralela (%s). Reintentando de forma secuencial...", e)
+            extracted = {}
+    for filename, filepath, _key in pending:
+        if filepath in extracted:
+            continue
+        logger.debug("Procesando: %s...", filename)
+        file_start = time.perf_counter()
+        try:
+            extracted[filepath] = (extract_pages(filepath), time.perf_counter() - file_start)
+        except Exception as e:
+            logger.error("Error al leer %s: %s", filename, e)
+
+    for filename, filepath, key in pending:
+        if filepath not in extracted:
+            continue
+        pages, extraction_seconds = extracted[filepath]
+        pages_by_filename[filename] = pages
+        logger.info("Texto extraído de %s (%s páginas, %.0f ms).", filename, len(pages), extraction_seconds * 1000)
+        if use_cache:
+            try:
+                save_cached_entry(cache_dir, key, filename, pages, extraction_seconds)
+            except OSError as e:
+                logger.warning("No se pudo guardar %s en la caché: %s", filename, e)
+
+    if use_cache:
+        prune_cache(cache_dir, valid_keys)
+
+    documents = [{"filename": f, "pages": pages_by_filename[f], "key": keys_by_filename[f]}
+                 for f in filenames if f in pages_by_filename]
+    misses = len(pending)
+    total_ms = (time.perf_counter() - start) * 1000
+    if reuse is not None:
+        logger.info("Extracción: %.0f ms en total (%s sin cambios, %s desde caché, %s procesados).", total_ms, reused, hits, misses)
+    else:
+        logger.info("Extracción: %.0f ms en total (%s desde caché, %s procesados).", total_ms, hits, misses)
+    if hits and not misses and not reused:
+        logger.info("Arranque en caliente: %.0f ms frente a ~%.0f ms en frío.", total_ms, cold_seconds_saved * 1000)
+    return documents
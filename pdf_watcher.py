@@ -0,0 +1,260 @@
+import os
+import sys
+import time
+import struct
+import select
+import logging
+import threading
+
+from profiler import checkpoint as profiler_checkpoint
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración por defecto del observador del directorio de PDFs ---
+DEBOUNCE_SECONDS = 1.0 # Tras un cambio se espera a que el directorio esté quieto este tiempo (copias en curso)
+POLL_SECONDS = 2.0 # Sondeo: intervalo entre comparaciones del directorio
+CHECK_SECONDS = 0.5 # Espera máxima de cada vuelta del bucle (para poder detenerlo)
+BACKENDS = ("auto", "windows", "inotify", "polling")
+
+
+def is_pdf_name(name):
+    return name.lower().endswith(".pdf")
+
+def snapshot_directory(directory):
+    """Estado de los PDFs del directorio: {nombre: (mtime_ns, tamaño)}. {} si el directorio no existe."""
+    snapshot = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not is_pdf_name(entry.name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue # Borrado entre el listado y el stat
+                if entry.is_file():
+                    snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        pass
+    return snapshot
+
+def diff_snapshots(old, new):
+    """Devuelve (añadidos, modificados, eliminados) entre dos estados del directorio, en orden alfabético."""
+    added = sorted(name for name in new if name not in old)
+    changed = sorted(name for name in new if name in old and new[name] != old[name])
+    removed = sorted(name for name in old if name not in new)
+    return added, changed, removed
+
+
+class PollingBackend:
+    """Compara el estado del directorio (mtime y tamaño de cada PDF) cada cierto intervalo."""
+    name = "polling"
+
+    def __init__(self, directory, interval=POLL_SECONDS):
+        self.directory = directory
+        self.interval = interval
+        self.snapshot = snapshot_directory(directory)
+        self.next_poll = time.monotonic() + interval
+
+    def wait_for_change(self, timeout):
+        wait = min(self.next_poll - time.monotonic(), timeout)
+        if wait > 0:
+            time.sleep(wait)
+        if time.monotonic() < self.next_poll:
+            return False
+        self.next_poll = time.monotonic() + self.interval
+        snapshot = snapshot_directory(self.directory)
+        changed = snapshot != self.snapshot
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyBackend:
+    """Linux: eventos de inotify (vía libc con ctypes) sobre el directorio; solo cuentan los de archivos .pdf."""
+    name = "inotify"
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_IGNORED = 0x8000
+    EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len (seguido del nombre)
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+        mask = (self.IN_MODIFY | self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO
+                | self.IN_CREATE | self.IN_DELETE | self.IN_DELETE_SELF | self.IN_MOVE_SELF)
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch falló para {directory}")
+
+    def wait_for_change(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        changed = False
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            _wd, mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + self.EVENT_HEADER.size:offset + self.EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += self.EVENT_HEADER.size + length
+            if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF | self.IN_IGNORED) or name.lower().endswith(b".pdf"):
+                changed = True
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WindowsChangeBackend:
+    """Windows: FindFirstChangeNotification sobre el directorio (nombres, tamaños y fechas de escritura)."""
+    name = "windows"
+    FILE_NOTIFY_CHANGE_FILE_NAME = 0x1
+    FILE_NOTIFY_CHANGE_SIZE = 0x8
+    FILE_NOTIFY_CHANGE_LAST_WRITE = 0x10
+    WAIT_OBJECT_0 = 0
+    INVALID_HANDLE_VALUE = -1
+
+    def __init__(self, directory):
+        import ctypes
+        from ctypes import wintypes
+        self.kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        self.kernel32.FindFirstChangeNotificationW.restype = wintypes.HANDLE
+        self.kernel32.FindFirstChangeNotificationW.argtypes = (wintypes.LPCWSTR, wintypes.BOOL, wintypes.DWORD)
+        self.kernel32.WaitForSingleObject.argtypes = (wintypes.HANDLE, wintypes.DWORD)
+        self.kernel32.FindNextChangeNotification.argtypes = (wintypes.HANDLE,)
+        self.kernel32.FindCloseChangeNotification.argtypes = (wintypes.HANDLE,)
+        flags = self.FILE_NOTIFY_CHANGE_FILE_NAME | self.FILE_NOTIFY_CHANGE_SIZE | self.FILE_NOTIFY_CHANGE_LAST_WRITE
+        self.handle = self.kernel32.FindFirstChangeNotificationW(os.path.abspath(directory), False, flags)
+        if not self.handle or self.handle == ctypes.c_void_p(self.INVALID_HANDLE_VALUE).value:
+            raise ctypes.WinError(ctypes.get_last_error())
+        # La notificación no dice qué archivo cambió: se compara el estado para ignorar p.ej. la caché
+        self.directory = directory
+        self.snapshot = snapshot_directory(directory)
+
+    def wait_for_change(self, timeout):
+        if self.kernel32.WaitForSingleObject(self.handle, int(timeout * 1000)) != self.WAIT_OBJECT_0:
+            return False
+        self.kernel32.FindNextChangeNotification(self.handle)
+        snapshot = snapshot_directory(self.directory)
+        changed = snapshot != self.snapshot
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        self.kernel32.FindCloseChangeNotification(self.handle)
+
+
+def create_backend(name, directory, poll_seconds=POLL_SECONDS):
+    """
+    Crea el backend pedido. Con "auto" prueba el nativo de la plataforma
+    (Windows: notificaciones de cambio, Linux: inotify) y si falla usa el sondeo.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Backend del observador de PDFs desconocido: {name} (opciones: {', '.join(BACKENDS)})")
+    candidates = []
+    if name == "auto":
+        if sys.platform == "win32":
+            candidates.append("windows")
+        elif sys.platform.startswith("linux"):
+            candidates.append("inotify")
+    elif name != "polling":
+        candidates.append(name)
+    for candidate in candidates:
+        try:
+            if candidate == "windows":
+                return WindowsChangeBackend(directory)
+            return InotifyBackend(directory)
+        except Exception as e:
+            logger.warning("No se pudo iniciar el observador de PDFs '%s': %s. Usando sondeo.", candidate, e)
+    return PollingBackend(directory, interval=poll_seconds)
+
+
+class PdfDirectoryWatcher:
+    """
+    Observa el directorio de PDFs en un hilo y, cuando se añaden, modifican o eliminan PDFs, llama a
+    on_change(añadidos, modificados, eliminados) con los nombres de archivo. Los cambios seguidos (p.ej.
+    la copia de un PDF grande) se agrupan hasta que el directorio pasa debounce_seconds sin cambios.
+    snapshot es el estado de partida (el del momento en que se cargó el material): lo que cambie
+    después, aunque sea antes de arrancar el observador, se detecta en la primera vuelta.
+    """
+
+    def __init__(self, directory, on_change, backend="auto", snapshot=None, debounce_seconds=DEBOUNCE_SECONDS,
+                 poll_seconds=POLL_SECONDS):
+        self.directory = directory
+        self.on_change = on_change
+        self.backend_name = backend
+        self.backend = None
+        self.snapshot = snapshot if snapshot is not None else snapshot_directory(directory)
+        self.debounce_seconds = debounce_seconds
+        self.poll_seconds = poll_seconds
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.reloads = 0
+
+    def start(self):
+        self.backend = create_backend(self.backend_name, self.directory, poll_seconds=self.poll_seconds)
+        logger.info("Observando %s para recargar el material (backend %s).", os.path.abspath(self.directory), self.backend.name)
+        self.thread = threading.Thread(target=self.run, name="observador-pdfs", daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            self._check() # Cambios ocurridos entre la carga del material y el arranque del observador
+            while not self.stop_event.is_set():
+                profiler_checkpoint()
+                if not self.backend.wait_for_change(CHECK_SECONDS):
+                    continue
+                # Debounce: esperar a que no haya más cambios durante la ventana (con sondeo, al menos un
+                # intervalo entero, para que una copia en curso se vea crecer antes de leer el PDF)
+                quiet_seconds = self.debounce_seconds
+                if self.backend.name == "polling":
+                    quiet_seconds = max(quiet_seconds, self.poll_seconds)
+                deadline = time.monotonic() + quiet_seconds
+                while not self.stop_event.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if self.backend.wait_for_change(remaining):
+                        deadline = time.monotonic() + quiet_seconds
+                if not self.stop_event.is_set():
+                    self._check()
+        finally:
+            self.backend.close()
+            logger.info("Observador de PDFs detenido (%d recargas).", self.reloads)
+
+    def _check(self):
+        snapshot = snapshot_directory(self.directory)
+        added, changed, removed = diff_snapshots(self.snapshot, snapshot)
+        self.snapshot = snapshot
+        if not (added or changed or removed):
+            return
+        logger.info("Cambios en los PDFs: %d nuevos, %d modificados, %d eliminados.", len(added), len(changed), len(removed))
+        self.reloads += 1
+        try:
+            self.on_change(added, changed, removed)
+        except Exception as e:
+            logger.exception("Error al procesar los cambios de los PDFs: %s", e)
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
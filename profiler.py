@@ -0,0 +1,262 @@
+import os
+import sys
+import time
+import marshal
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración por defecto del perfilador ---
+FULL = "completo" # cProfile en todos los hilos + tracemalloc con la pila de cada asignación
+SAMPLING = "muestreo" # Muestreo de las pilas de todos los hilos: apenas frena, apto para sesiones largas
+MODES = (FULL, SAMPLING)
+PROFILE_DIRECTORY = "perfiles"
+SAMPLE_INTERVAL_SECONDS = 0.01 # Intervalo entre muestras de las pilas (100 por segundo como mucho)
+FULL_TRACEMALLOC_FRAMES = 10 # Marcos guardados por asignación en el modo completo
+SAMPLING_TRACEMALLOC_FRAMES = 1 # En muestreo, solo la línea que asigna (lo más barato de tracemalloc)
+TOP_ALLOCATIONS = 25 # Líneas del informe de asignaciones (por tamaño y por crecimiento)
+MAX_STACK_DEPTH = 64
+
+_active_session = None
+_session_lock = threading.Lock()
+_thread_state = threading.local() # profile: (sesión, cProfile.Profile) del hilo, si se está perfilando
+
+
+def frame_key(code):
+    """Clave de una función como la usa pstats: (archivo, primera línea, nombre)."""
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+def frame_label(code):
+    """Nombre de un marco en las pilas colapsadas: función (archivo:línea)."""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _StatsHolder:
+    """Lo mínimo que pstats.Stats acepta como perfil: un diccionario stats ya calculado."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class ProfilerSession:
+    """
+    Sesión de perfilado de todo el proceso. Siempre muestrea las pilas de todos los hilos (para las pilas
+    colapsadas, que se convierten en un flamegraph con flamegraph.pl o speedscope) y sigue las asignaciones
+    con tracemalloc. En el modo completo además activa cProfile en cada hilo: los hilos nuevos lo activan
+    al arrancar (threading.setprofile) y los de larga vida (trabajadores, motor asíncrono, observadores)
+    en su siguiente vuelta (checkpoint). Al detenerla escribe en directory, con la fecha en el nombre:
+    <base>.pstats (en muestreo, construido con las muestras), <base>.asignaciones.txt y <base>.colapsado.txt.
+    """
+
+    def __init__(self, mode=SAMPLING, directory=PROFILE_DIRECTORY, sample_interval=SAMPLE_INTERVAL_SECONDS,
+                 top_allocations=TOP_ALLOCATIONS):
+        if mode not in MODES:
+            raise ValueError(f"Modo de perfilado desconocido: {mode} (opciones: {', '.join(MODES)})")
+        self.mode = mode
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.top_allocations = top_allocations
+        self.active = False
+        self.lock = threading.Lock()
+        self.profiles = [] # (nombre del hilo, cProfile.Profile)
+        self.stacks = Counter() # pila colapsada -> muestras
+        self.self_samples = Counter() # función -> muestras en las que estaba en la cima de la pila
+        self.total_samples = Counter() # función -> muestras en las que estaba en la pila
+        self.caller_samples = Counter() # (función llamadora, función) -> muestras
+        self.samples = 0
+        self.sampler_seconds = 0.0 # Tiempo de CPU del hilo muestreador (coste del muestreo)
+        self.sampler = None
+        self.stop_event = threading.Event()
+        self.started_at = None
+        self.started_wall = None
+        self.tracemalloc_started = False
+        self.start_snapshot = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.started_wall = datetime.now()
+        self.active = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(FULL_TRACEMALLOC_FRAMES if self.mode == FULL else SAMPLING_TRACEMALLOC_FRAMES)
+            self.tracemalloc_started = True
+        self.start_snapshot = tracemalloc.take_snapshot()
+        if self.mode == FULL:
+            threading.setprofile(self._thread_start_hook)
+        self.sampler = threading.Thread(target=self._sample_loop, name="perfilador", daemon=True)
+        self.sampler.start()
+        logger.info("Perfilado iniciado (%s).", self.mode)
+        return self
+
+    def _thread_start_hook(self, frame, event, arg):
+        """Primer evento de un hilo creado durante la sesión: se cambia por su propio cProfile."""
+        sys.setprofile(None)
+        if self.active:
+            self.attach_current_thread()
+
+    def attach_current_thread(self):
+        if getattr(_thread_state, "profile", None) is not None:
+            return
+        profile = cProfile.Profile()
+        with self.lock:
+            if not self.active:
+                return
+            self.profiles.append((threading.current_thread().name, profile))
+        _thread_state.profile = (self, profile)
+        profile.enable()
+
+    def _sample_loop(self):
+        cpu_start = time.thread_time()
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.sample_interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                codes = []
+                while frame is not None and len(codes) < MAX_STACK_DEPTH:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse() # De la raíz a la cima
+                thread_name = names.get(thread_id, str(thread_id))
+                self.stacks[";".join([thread_name] + [frame_label(code) for code in codes])] += 1
+                if codes:
+                    self.self_samples[frame_key(codes[-1])] += 1
+                seen = set()
+                for caller, code in zip([None] + codes[:-1], codes):
+                    key = frame_key(code)
+                    if key not in seen: # Recursión: una vez por muestra
+                        seen.add(key)
+                        self.total_samples[key] += 1
+                    if caller is not None:
+                        self.caller_samples[(frame_key(caller), key)] += 1
+            self.samples += 1
+        self.sampler_seconds = time.thread_time() - cpu_start
+
+    def elapsed_seconds(self):
+        return time.perf_counter() - self.started_at if self.started_at else 0.0
+
+    def stop(self):
+        """Detiene la sesión y escribe los tres archivos. Devuelve {"pstats", "asignaciones", "colapsado"}: rutas."""
+        with self.lock:
+            self.active = False
+        if self.mode == FULL:
+            threading.setprofile(None)
+        self.stop_event.set()
+        self.sampler.join()
+        elapsed = self.elapsed_seconds()
+        allocation_snapshot = tracemalloc.take_snapshot()
+        traced_current, traced_peak = tracemalloc.get_traced_memory()
+        if self.tracemalloc_started:
+            tracemalloc.stop()
+        own = getattr(_thread_state, "profile", None)
+        if own is not None and own[0] is self:
+            own[1].disable()
+            _thread_state.profile = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"perfil-{self.started_wall:%Y%m%d-%H%M%S}-{self.mode}")
+        paths = {"pstats": base + ".pstats", "asignaciones": base + ".asignaciones.txt", "colapsado": base + ".colapsado.txt"}
+        stats = self._cprofile_stats() if self.mode == FULL else None
+        if stats is not None:
+            stats.dump_stats(paths["pstats"])
+        else:
+            with open(paths["pstats"], "wb") as f:
+                marshal.dump(self._sampled_stats(elapsed / max(self.samples, 1)), f)
+        with open(paths["colapsado"], "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        with open(paths["asignaciones"], "w", encoding="utf-8") as f:
+            f.write(self._allocation_report(allocation_snapshot, traced_current, traced_peak, elapsed))
+        logger.info("Perfilado (%s) detenido tras %.1f s: %d muestras (muestreo %.1f ms de CPU), %d hilos con cProfile. "
+                    "Archivos: %s", self.mode, elapsed, self.samples, self.sampler_seconds * 1000, len(self.profiles), base + ".*")
+        return paths
+
+    def _cprofile_stats(self):
+        """pstats.Stats con los perfiles de todos los hilos (los que siguen activos se leen sin detenerlos)."""
+        merged = None
+        with self.lock:
+            profiles = list(self.profiles)
+        for _thread_name, profile in profiles:
+            profile.snapshot_stats() # Lectura bajo el GIL; el hilo lo desactiva en su siguiente checkpoint
+            if not profile.stats:
+                continue
+            holder = _StatsHolder(dict(profile.stats))
+            if merged is None:
+                merged = pstats.Stats(holder)
+            else:
+                merged.add(holder)
+        return merged
+
+    def _sampled_stats(self, interval):
+        """
+        Diccionario de pstats construido con las muestras: tiempos = muestras x segundos por muestra
+        (tiempo real, no de CPU: un hilo esperando a la API también cuenta, que es lo que interesa).
+        """
+        callers = {}
+        for (caller, callee), count in self.caller_samples.items():
+            callers.setdefault(callee, {})[caller] = (count, count, 0.0, count * interval)
+        return {key: (total, total, self.self_samples.get(key, 0) * interval, total * interval, callers.get(key, {}))
+                for key, total in self.total_samples.items()}
+
+    def _allocation_report(self, snapshot, traced_current, traced_peak, elapsed):
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+                   tracemalloc.Filter(False, __file__)]
+        snapshot = snapshot.filter_traces(filters)
+        lines = [f"Perfilado {self.mode} del {self.started_wall:%Y-%m-%d %H:%M:%S}, {elapsed:.1f} s.",
+                 f"Memoria seguida por tracemalloc: {traced_current / 1024 / 1024:.1f} MiB ahora, "
+                 f"{traced_peak / 1024 / 1024:.1f} MiB de pico.", "",
+                 f"Top {self.top_allocations} por tamaño (memoria viva al detener):"]
+        for stat in snapshot.statistics("lineno")[:self.top_allocations]:
+            lines.append(f"  {stat.size / 1024:10.1f} KiB {stat.count:8d} bloques  {stat.traceback.format()[-1].strip()}")
+        lines += ["", f"Top {self.top_allocations} por crecimiento durante la sesión:"]
+        for stat in snapshot.compare_to(self.start_snapshot.filter_traces(filters), "lineno")[:self.top_allocations]:
+            lines.append(f"  {stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} bloques  {stat.traceback.format()[-1].strip()}")
+        if self.mode == FULL:
+            lines += ["", "Pilas de las 5 líneas que más memoria viva retienen:"]
+            for stat in snapshot.statistics("traceback")[:5]:
+                lines.append(f"  {stat.size / 1024:.1f} KiB en {stat.count} bloques:")
+                lines += [f"    {line}" for line in stat.traceback.format()]
+        return "\n".join(lines) + "\n"
+
+
+def start_session(mode=SAMPLING, directory=PROFILE_DIRECTORY, **kwargs):
+    """Inicia la sesión de perfilado del proceso (solo puede haber una). Devuelve la sesión."""
+    global _active_session
+    with _session_lock:
+        if _active_session is not None:
+            raise RuntimeError(f"Ya hay un perfilado en curso ({_active_session.mode}).")
+        _active_session = ProfilerSession(mode, directory, **kwargs).start()
+        return _active_session
+
+def stop_session():
+    """Detiene la sesión en curso y devuelve las rutas de sus archivos (None si no había ninguna)."""
+    global _active_session
+    with _session_lock:
+        session, _active_session = _active_session, None
+    return session.stop() if session is not None else None
+
+def active_session():
+    return _active_session
+
+def checkpoint():
+    """
+    Para los bucles de hilos de larga vida (una llamada por vuelta, casi gratis): durante un perfilado
+    completo activa cProfile en el hilo; al terminar la sesión lo desactiva.
+    """
+    session = _active_session
+    attached = getattr(_thread_state, "profile", None)
+    if attached is not None and not (attached[0] is session and session.active):
+        attached[1].disable() # La sesión que lo activó ya terminó
+        _thread_state.profile = None
+        attached = None
+    if attached is None and session is not None and session.mode == FULL and session.active:
+        session.attach_current_thread()
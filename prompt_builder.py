@@ -0,0 +1,211 @@
+import logging
+import os
+import json
+import hashlib
+import threading
+
+try:
+    import tiktoken # Opcional: conteo exacto de tokens; sin él se usa una estimación
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración de modelos ---
+MODEL_ENCODINGS = {"gpt-4o": "o200k_base", "gpt-4o-mini": "o200k_base"}
+DEFAULT_ENCODING = "o200k_base"
+MODEL_CONTEXT_WINDOWS = {"gpt-4o": 128_000, "gpt-4o-mini": 128_000}
+DEFAULT_CONTEXT_WINDOW = 128_000
+CHARS_PER_TOKEN_ESTIMATE = 4 # Sin tiktoken: ~4 caracteres por token (algo conservador para español)
+MESSAGE_OVERHEAD_TOKENS = 4 # Tokens de formato que añade cada mensaje de chat
+IMAGE_TOKENS_ESTIMATE = 1105 # gpt-4o, detalle alto, ~1600 px en el lado largo (85 + 170 por tesela)
+
+
+class TokenCounter:
+    """
+    Cuenta tokens localmente (tiktoken si está disponible) y memoriza el conteo de los textos del material
+    (pasajes, documentos) por su hash en un archivo JSON, para que no se recuenten al reiniciar. Los textos
+    de cada petición (pregunta, pasajes elegidos) se cuentan con memoize=False: no se repiten y harían
+    crecer la memoria y el archivo con cada pregunta.
+    """
+
+    def __init__(self, model="gpt-4o", cache_path=None):
+        self.encoding_name = MODEL_ENCODINGS.get(model, DEFAULT_ENCODING)
+        self.cache_path = cache_path
+        self._encoding = None
+        self._encoding_loaded = False
+        self.counts = {} # sha1(texto) -> tokens
+        self.used = set() # Claves pedidas desde el último save(): las del material actual
+        self.dirty = False
+        self.lock = threading.Lock()
+        if cache_path and os.path.isfile(cache_path):
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    self.counts = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("No se pudo leer la caché de tokens (%s): %s", cache_path, e)
+
+    @property
+    def exact(self):
+        """True si se cuenta con tiktoken; False si es una estimación por caracteres."""
+        return self._get_encoding() is not None
+
+    def _get_encoding(self):
+        # Carga perezosa: tiktoken puede tardar o necesitar descargar el vocabulario la primera vez
+        if not self._encoding_loaded:
+            self._encoding_loaded = True
+            if tiktoken is not None:
+                try:
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+                except Exception as e:
+                    logger.warning("No se pudo cargar el vocabulario de tiktoken (%s). Se estimarán los tokens.", e)
+        return self._encoding
+
+    def count(self, text, memoize=True):
+        """Número de tokens del texto (exacto o estimado). memoize=False para textos que no se repiten."""
+        if not text:
+            return 0
+        if not memoize:
+            return self._count_uncached(text)
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self.lock:
+            cached = self.counts.get(key)
+            self.used.add(key)
+        if cached is not None:
+            return cached
+        tokens = self._count_uncached(text)
+        if self._get_encoding() is not None: # Las estimaciones no se guardan para no mezclarlas con conteos exactos
+            with self.lock:
+                self.counts[key] = tokens
+                self.dirty = True
+        return tokens
+
+    def _count_uncached(self, text):
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return max(1, -(-len(text) // CHARS_PER_TOKEN_ESTIMATE))
+
+    def save(self):
+        """
+        Guarda los conteos junto al corpus (escritura atómica). Se llama al terminar de construir el
+        material: solo se conservan los textos contados desde el save() anterior (los del material actual),
+        así que los pasajes de versiones anteriores del material no se acumulan.
+        """
+        with self.lock:
+            current = {key: tokens for key, tokens in self.counts.items() if key in self.used}
+            self.dirty = self.dirty or len(current) != len(self.counts)
+            self.counts = current
+            self.used = set()
+            if not self.cache_path or not self.dirty:
+                return
+            data = dict(self.counts)
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("No se pudo guardar la caché de tokens: %s", e)
+
+    def truncate(self, text, max_tokens):
+        """Recorta el texto (por el final) para que no supere max_tokens. Resultado determinista."""
+        if self.count(text, memoize=False) <= max_tokens:
+            return text
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+        return text[:max_tokens * CHARS_PER_TOKEN_ESTIMATE]
+
+
+def token_cache_path(cache_dir, model="gpt-4o"):
+    """Ruta del archivo de conteos de tokens dentro del directorio de caché del corpus."""
+    return os.path.join(cache_dir, f"tokens-{MODEL_ENCODINGS.get(model, DEFAULT_ENCODING)}.json")
+
+def context_window(model):
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+def build_messages(system_text, context_text, question_text, image_url=None):
+    """
+    Ordena el prompt para que el prefijo sea idéntico byte a byte entre llamadas:
+    1) mensaje de sistema con las instrucciones fijas, 2) material de estudio, 3) la pregunta (variable).
+    Así el proveedor puede reutilizar su caché de prompt para todo lo anterior a la pregunta.
+    """
+    messages = [
+        {"role": "system", "content": system_text},
+        {"role": "system", "content": context_text},
+    ]
+    user_content = [{"type": "text", "text": question_text}]
+    if image_url:
+        user_content.append({"type": "image_url", "image_url": {"url": image_url}})
+    messages.append({"role": "user", "content": user_content})
+    return messages
+
+def count_message_tokens(counter, system_text, context_text, question_text, has_image=False):
+    """Tokens de entrada estimados para los mensajes que produce build_messages (sin memorizar: son de la petición)."""
+    tokens = sum(counter.count(text, memoize=False) for text in (system_text, context_text, question_text))
+    tokens += 3 * MESSAGE_OVERHEAD_TOKENS
+    if has_image:
+        tokens += IMAGE_TOKENS_ESTIMATE
+    return tokens
+
+
+class TokenAccounting:
+    """Registro por petición de tokens de prompt/respuesta y de aciertos de la caché de prompt del proveedor."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cache_hits = 0 # Peticiones con al menos un token de prefijo reutilizado
+        self.stable_prefix_requests = 0
+
+    def record(self, usage, estimated_prompt_tokens, stable_prefix):
+        """Registra el uso devuelto por la API (puede ser None) y devuelve una línea de log."""
+        prompt_tokens = getattr(usage, "prompt_tokens", None) if usage else None
+        completion_tokens = getattr(usage, "completion_tokens", None) if usage else None
+        cached_tokens = _cached_tokens(usage)
+        with self.lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+            self.cached_tokens += cached_tokens
+            if cached_tokens:
+                self.cache_hits += 1
+            if stable_prefix:
+                self.stable_prefix_requests += 1
+        if prompt_tokens is None:
+            return f"Tokens: ~{estimated_prompt_tokens} de entrada (estimado; la API no devolvió uso)."
+        return (f"Tokens: {prompt_tokens} de entrada (estimado {estimated_prompt_tokens}), {completion_tokens} de salida, "
+                f"{cached_tokens} desde la caché de prompt. {self.stats_text()}")
+
+    def stats_text(self):
+        with self.lock:
+            hit_rate = (self.cache_hits / self.requests * 100) if self.requests else 0.0
+            cached_share = (self.cached_tokens / self.prompt_tokens * 100) if self.prompt_tokens else 0.0
+            return (f"Acumulado: {self.requests} peticiones, {self.prompt_tokens} tokens de entrada "
+                    f"({cached_share:.0f}% en caché), {self.completion_tokens} de salida, "
+                    f"aciertos de caché de prompt {self.cache_hits}/{self.requests} ({hit_rate:.0f}%)")
+
+
+def usage_attributes(usage):
+    """Tokens del uso devuelto por la API como atributos planos (para trazas); {} si no hay uso."""
+    if not usage:
+        return {}
+    return {"prompt_tokens": getattr(usage, "prompt_tokens", None), "completion_tokens": getattr(usage, "completion_tokens", None),
+            "cached_tokens": _cached_tokens(usage)}
+
+def _cached_tokens(usage):
+    """Tokens de entrada servidos desde la caché de prompt (usage.prompt_tokens_details.cached_tokens)."""
+    if not usage:
+        return 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None and hasattr(usage, "model_extra"):
+        details = (usage.model_extra or {}).get("prompt_tokens_details")
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", 0) or 0
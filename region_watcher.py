@@ -0,0 +1,193 @@
+import time
+import logging
+import threading
+from collections import deque
+
+try:
+    import numpy as np # Opcional: sin NumPy no hay vigilancia de región (solo la selección manual)
+except ImportError:
+    np = None
+
+from profiler import checkpoint as profiler_checkpoint
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración por defecto de la vigilancia de región ---
+CAPTURES_PER_SECOND = 4.0 # Capturas por segundo de la región vigilada
+CHANGE_THRESHOLD = 0.005 # Proporción de píxeles distintos para considerar que el contenido cambió (un cursor no llega)
+STABLE_SECONDS = 0.5 # El contenido nuevo debe quedarse quieto este tiempo antes de enviarse (desplazamientos en curso)
+SAMPLE_STEP = 2 # Se compara uno de cada SAMPLE_STEP píxeles en cada dirección
+MAX_CONSECUTIVE_ERRORS = 20 # Capturas fallidas seguidas tras las que se deja de vigilar
+STATS_WINDOW = 200 # Mediciones recientes que se guardan para los percentiles
+
+
+def region_watch_available():
+    return np is not None
+
+def frame_pixels(raw, size):
+    """Vista de una captura BGRA de mss como matriz alto x ancho de uint32 (un entero por píxel, sin copiar)."""
+    width, height = size
+    return np.frombuffer(raw, dtype=np.uint32, count=width * height).reshape(height, width)
+
+def changed_fraction(frame, reference, step=SAMPLE_STEP):
+    """Proporción (0-1) de píxeles muestreados que cambian entre dos capturas; 1.0 si el tamaño no coincide."""
+    if reference is None or frame.shape != reference.shape:
+        return 1.0
+    sampled = frame[::step, ::step]
+    return np.count_nonzero(sampled != reference[::step, ::step]) / sampled.size
+
+def open_mss_grabber(region):
+    """Captura de la región con un manejador de mss que se reutiliza: devuelve (grab, close); grab() da (BGRA, tamaño)."""
+    import mss
+    sct = mss.mss()
+    def grab():
+        shot = sct.grab(region)
+        return shot.raw, shot.size
+    return grab, sct.close
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else None
+
+
+class WatchStats:
+    """Coste por captura (CPU del hilo y tiempo real), capturas enviadas y latencia de captura a respuesta."""
+
+    def __init__(self, window=STATS_WINDOW):
+        self.lock = threading.Lock()
+        self.captures = 0
+        self.changes = 0 # Capturas que difieren de la última procesada (aún sin asentarse)
+        self.submitted = 0
+        self.errors = 0
+        self.cpu_ms = deque(maxlen=window)
+        self.wall_ms = deque(maxlen=window)
+        self.answer_ms = deque(maxlen=window)
+
+    def record_capture(self, cpu_ms, wall_ms, changed):
+        with self.lock:
+            self.captures += 1
+            self.changes += changed
+            self.cpu_ms.append(cpu_ms)
+            self.wall_ms.append(wall_ms)
+
+    def record_submit(self):
+        with self.lock:
+            self.submitted += 1
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def record_answer(self, elapsed_ms):
+        """Latencia desde la captura enviada hasta que su respuesta está en pantalla."""
+        with self.lock:
+            self.answer_ms.append(elapsed_ms)
+
+    def summary(self):
+        with self.lock:
+            cpu = list(self.cpu_ms)
+            return {"capturas": self.captures, "con_cambios": self.changes, "enviadas": self.submitted, "errores": self.errors,
+                    "cpu_media_ms": sum(cpu) / len(cpu) if cpu else None,
+                    "captura_p50_ms": percentile(self.wall_ms, 0.5), "captura_p95_ms": percentile(self.wall_ms, 0.95),
+                    "respuesta_p50_ms": percentile(self.answer_ms, 0.5), "respuesta_p95_ms": percentile(self.answer_ms, 0.95)}
+
+    def stats_text(self):
+        summary = self.summary()
+        text = f"{summary['capturas']} capturas, {summary['enviadas']} enviadas"
+        if summary["cpu_media_ms"] is not None:
+            text += (f"; por captura CPU {summary['cpu_media_ms']:.1f} ms, p50 {summary['captura_p50_ms']:.1f} ms, "
+                     f"p95 {summary['captura_p95_ms']:.1f} ms")
+        if summary["respuesta_p50_ms"] is not None:
+            text += f"; captura a respuesta p50 {summary['respuesta_p50_ms']:.0f} ms, p95 {summary['respuesta_p95_ms']:.0f} ms"
+        if summary["errores"]:
+            text += f"; {summary['errores']} errores"
+        return text
+
+
+class RegionWatcher:
+    """
+    Vigila una región de la pantalla en un hilo: la captura captures_per_second veces por segundo (con el
+    mismo manejador de mss) y la compara con la última captura procesada. Cuando el contenido cambia más
+    de change_threshold y se mantiene quieto stable_seconds, llama a on_change(imagen PIL, instante de la
+    captura en perf_counter). La primera captura estable también se envía (la pregunta que ya está).
+    grab permite sustituir la captura (benchmarks): una función sin argumentos que devuelve (BGRA, tamaño).
+    """
+
+    def __init__(self, region, on_change, captures_per_second=CAPTURES_PER_SECOND, change_threshold=CHANGE_THRESHOLD,
+                 stable_seconds=STABLE_SECONDS, grab=None, stats=None):
+        self.region = region
+        self.on_change = on_change
+        self.interval = 1.0 / captures_per_second
+        self.change_threshold = change_threshold
+        self.stable_seconds = stable_seconds
+        self.grab = grab
+        self.stats = stats or WatchStats()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="vigilancia-region", daemon=True)
+        self.thread.start()
+        logger.info("Vigilando la región %s (%.1f capturas/s, umbral %.1f%%, %.1f s quieta).", self.region,
+                    1.0 / self.interval, self.change_threshold * 100, self.stable_seconds)
+        return self
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive() and not self.stop_event.is_set()
+
+    def run(self):
+        from PIL import Image
+        grab, close = (self.grab, None) if self.grab else open_mss_grabber(self.region) # mss, en el hilo que captura
+        processed = None # Última captura enviada
+        previous = None # Captura anterior, para saber si el contenido está quieto
+        stable_since = None
+        consecutive_errors = 0
+        next_capture = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                profiler_checkpoint()
+                cpu_start = time.thread_time()
+                captured_at = time.perf_counter()
+                try:
+                    raw, size = grab()
+                except Exception as e:
+                    self.stats.record_error()
+                    consecutive_errors += 1
+                    if consecutive_errors == 1:
+                        logger.warning("Error al capturar la región vigilada: %s", e)
+                    if consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                        logger.error("La región vigilada falló %d veces seguidas: se deja de vigilar.", consecutive_errors)
+                        break
+                else:
+                    consecutive_errors = 0
+                    frame = frame_pixels(raw, size)
+                    changed = changed_fraction(frame, processed) > self.change_threshold
+                    if not changed:
+                        stable_since = None
+                    elif stable_since is None or changed_fraction(frame, previous) > self.change_threshold:
+                        stable_since = captured_at # Acaba de cambiar o aún se mueve: el debounce empieza de nuevo
+                    previous = frame
+                    submit = changed and stable_since is not None and captured_at - stable_since >= self.stable_seconds
+                    image = Image.frombytes("RGB", size, raw, "raw", "BGRX") if submit else None
+                    self.stats.record_capture((time.thread_time() - cpu_start) * 1000,
+                                              (time.perf_counter() - captured_at) * 1000, changed)
+                    if submit:
+                        processed = frame
+                        stable_since = None
+                        self.stats.record_submit()
+                        logger.info("Contenido nuevo en la región vigilada: se envía la pregunta.")
+                        try:
+                            self.on_change(image, captured_at)
+                        except Exception as e:
+                            logger.exception("Error al procesar la captura de la región vigilada: %s", e)
+                next_capture = max(next_capture + self.interval, time.perf_counter())
+                self.stop_event.wait(next_capture - time.perf_counter())
+        finally:
+            if close:
+                close()
+            logger.info("Vigilancia de región detenida: %s", self.stats.stats_text())
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
@@ -0,0 +1,138 @@
+import logging
+import time
+import threading
+import itertools
+from collections import deque
+
+from profiler import checkpoint as profiler_checkpoint
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCancelled(Exception):
+    """La petición fue reemplazada por una más reciente y debe abandonarse."""
+
+
+class RequestContext:
+    """Estado de una petición planificada: id, tipo y si sigue siendo la más reciente."""
+
+    def __init__(self, scheduler, request_id, kind):
+        self.scheduler = scheduler
+        self.request_id = request_id
+        self.kind = kind
+        self.cancelled = threading.Event()
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+
+    def is_current(self):
+        return not self.cancelled.is_set()
+
+    def raise_if_cancelled(self):
+        """Para cortar trabajo en curso (p.ej. un streaming) en cuanto la petición queda obsoleta."""
+        if self.cancelled.is_set():
+            raise RequestCancelled(f"Petición #{self.request_id} reemplazada")
+
+    def publish(self, action, *args):
+        """
+        Ejecuta action(*args) (actualizar etiqueta, copiar al portapapeles...) solo si la petición
+        sigue vigente. Se hace bajo el lock del planificador para que una respuesta vieja no pueda
+        colarse después de la nueva. Devuelve True si se publicó.
+        """
+        with self.scheduler.lock:
+            if self.cancelled.is_set():
+                self.scheduler.discarded += 1
+                return False
+            action(*args)
+            return True
+
+
+class RequestScheduler:
+    """
+    Planificador central de peticiones a la API:
+    - concurrencia limitada (max_workers hilos trabajadores),
+    - ids de petición crecientes,
+    - "gana la última": cada petición nueva descarta las encoladas y cancela las que están en curso,
+    - métricas de profundidad de cola y peticiones en curso.
+    Las funciones planificadas reciben el RequestContext como primer argumento.
+    """
+
+    def __init__(self, max_workers=2, latest_wins=True):
+        self.max_workers = max_workers
+        self.latest_wins = latest_wins
+        self.lock = threading.Lock()
+        self.has_work = threading.Condition(self.lock)
+        self.queue = deque() # (contexto, fn, args)
+        self.in_flight = {} # request_id -> contexto
+        self.ids = itertools.count(1)
+        self.workers = []
+        self.running = True
+        self.submitted = 0
+        self.completed = 0
+        self.superseded = 0 # Descartadas en cola o canceladas en curso por una más reciente
+        self.discarded = 0 # Resultados que llegaron cuando la petición ya era obsoleta
+        self.max_queue_depth = 0
+
+    def submit(self, kind, fn, *args):
+        """Encola fn(contexto, *args). Devuelve el contexto de la nueva petición."""
+        with self.lock:
+            context = RequestContext(self, next(self.ids), kind)
+            if self.latest_wins:
+                while self.queue:
+                    old_context, _fn, _args = self.queue.popleft()
+                    old_context.cancelled.set()
+                    self.superseded += 1
+                for old_context in self.in_flight.values():
+                    if not old_context.cancelled.is_set():
+                        old_context.cancelled.set()
+                        self.superseded += 1
+            self.queue.append((context, fn, args))
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+            if len(self.workers) < self.max_workers:
+                worker = threading.Thread(target=self._worker_loop, daemon=True)
+                self.workers.append(worker)
+                worker.start()
+            self.has_work.notify()
+        logger.debug("Petición #%s (%s) encolada. %s", context.request_id, kind, self.stats_text())
+        return context
+
+    def _worker_loop(self):
+        while True:
+            with self.lock:
+                while self.running and not self.queue:
+                    self.has_work.wait()
+                if not self.running:
+                    return
+                context, fn, args = self.queue.popleft()
+                context.started_at = time.perf_counter()
+                self.in_flight[context.request_id] = context
+            profiler_checkpoint() # Un perfilado completo en curso también mide este hilo (de larga vida)
+            try:
+                fn(context, *args)
+            except RequestCancelled:
+                logger.info("Petición #%s abandonada: hay una pregunta más reciente.", context.request_id)
+            except Exception as e:
+                logger.error("Error en la petición #%s (%s): %s", context.request_id, context.kind, e)
+            finally:
+                with self.lock:
+                    self.in_flight.pop(context.request_id, None)
+                    self.completed += 1
+                wait_ms = (context.started_at - context.submitted_at) * 1000
+                total_ms = (time.perf_counter() - context.submitted_at) * 1000
+                logger.info("Petición #%s terminada en %.0f ms (%.0f ms en cola).", context.request_id, total_ms, wait_ms)
+
+    def stats_text(self):
+        """Resumen de la cola: profundidad, peticiones en curso y descartadas."""
+        return (f"Cola: {len(self.queue)} (máx. {self.max_queue_depth}), en curso: {len(self.in_flight)}/{self.max_workers}, "
+                f"reemplazadas: {self.superseded}, resultados descartados: {self.discarded}")
+
+    def shutdown(self):
+        """Cancela todo lo pendiente y despierta a los trabajadores para que terminen."""
+        with self.lock:
+            self.running = False
+            for context, _fn, _args in self.queue:
+                context.cancelled.set()
+            self.queue.clear()
+            for context in self.in_flight.values():
+                context.cancelled.set()
+            self.has_work.notify_all()
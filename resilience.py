@@ -0,0 +1,383 @@
+import logging
+import math
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from request_scheduler import RequestCancelled
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración por defecto de reintentos, límites y cortacircuitos ---
+MAX_RETRIES = 4 # Reintentos tras el primer intento fallido (solo errores transitorios)
+BACKOFF_BASE_SECONDS = 0.5 # Espera base; se duplica en cada reintento ("full jitter" sobre ese tope)
+BACKOFF_MAX_SECONDS = 20.0 # Tope de la espera calculada (Retry-After del servidor puede superarlo)
+RETRY_AFTER_MAX_SECONDS = 60.0 # Un Retry-After mayor no se espera: se falla y se abre el cortacircuitos
+RATE_LIMIT_MAX_WAIT_SECONDS = 30.0 # Espera máxima en el limitador local antes de rendirse
+CIRCUIT_FAILURE_THRESHOLD = 5 # Fallos transitorios seguidos que abren el cortacircuitos
+CIRCUIT_RESET_SECONDS = 30.0 # Tiempo abierto antes de dejar pasar una petición de prueba
+
+# Tipos de error (ApiError.kind)
+RATE_LIMIT = "rate_limit"
+QUOTA = "quota"
+SERVER = "server"
+TIMEOUT = "timeout"
+CONNECTION = "connection"
+AUTH = "auth"
+SAFETY = "safety"
+BAD_REQUEST = "bad_request"
+UNKNOWN = "unknown"
+RETRYABLE_KINDS = frozenset({RATE_LIMIT, SERVER, TIMEOUT, CONNECTION})
+
+# Texto corto para la etiqueta de la ventana (no se copia al portapapeles)
+DISPLAY_TEXTS = {
+    RATE_LIMIT: "Rate limited",
+    QUOTA: "Sin cuota en la API",
+    SERVER: "Error del servidor API",
+    TIMEOUT: "API sin respuesta",
+    CONNECTION: "Sin conexión con la API",
+    AUTH: "Clave API inválida",
+    SAFETY: "Imagen bloqueada",
+    BAD_REQUEST: "Petición rechazada",
+    UNKNOWN: "Error API",
+}
+
+
+class ApiError(Exception):
+    """Fallo definitivo de una llamada a la API, ya clasificado (tras los reintentos que correspondan)."""
+
+    def __init__(self, kind, message, retry_after=None, attempts=1):
+        super().__init__(message)
+        self.kind = kind
+        self.retry_after = retry_after
+        self.attempts = attempts
+
+    @property
+    def retryable(self):
+        return self.kind in RETRYABLE_KINDS
+
+    @property
+    def display_text(self):
+        text = DISPLAY_TEXTS.get(self.kind, DISPLAY_TEXTS[UNKNOWN])
+        if self.retry_after:
+            text += f" ({math.ceil(self.retry_after)} s)"
+        return text
+
+
+class CircuitOpenError(ApiError):
+    """El cortacircuitos está abierto: la petición ni siquiera se envía."""
+
+
+def classify_error(error):
+    """Tipo de error (RATE_LIMIT, SERVER...) de una excepción del SDK de OpenAI o de httpx."""
+    if isinstance(error, ApiError):
+        return error.kind
+    import httpx # Ya cargados por el cliente que produjo el error
+    import openai
+    if isinstance(error, openai.APITimeoutError) or isinstance(error, httpx.TimeoutException):
+        return TIMEOUT
+    if isinstance(error, openai.APIConnectionError) or isinstance(error, httpx.TransportError):
+        return CONNECTION
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        code = getattr(error, "code", None) or ""
+        text = str(error).lower()
+        if status == 429:
+            # Sin saldo también llega como 429, pero reintentar no lo arregla
+            return QUOTA if code == "insufficient_quota" or "quota" in text else RATE_LIMIT
+        if status in (401, 403):
+            return AUTH
+        if status >= 500 or status in (408, 409):
+            return SERVER
+        if "safety" in text or "content_policy" in text or code == "content_policy_violation":
+            return SAFETY
+        return BAD_REQUEST
+    if "safety" in str(error).lower():
+        return SAFETY
+    return UNKNOWN
+
+def retry_after_seconds(error):
+    """
+    Segundos que pide esperar el servidor: cabeceras retry-after-ms, retry-after (segundos o fecha HTTP)
+    o x-ratelimit-reset-requests / x-ratelimit-reset-tokens ("1s", "6m0s", "250ms"). None si no hay.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    resets = [_parse_duration(headers.get(name)) for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    resets = [seconds for seconds in resets if seconds is not None]
+    return max(resets) if resets else None
+
+def _parse_duration(text):
+    """'1m30s' -> 90.0, '250ms' -> 0.25; None si no se puede interpretar."""
+    if not text:
+        return None
+    total = 0.0
+    number = ""
+    i = 0
+    units = {"h": 3600, "m": 60, "s": 1}
+    while i < len(text):
+        char = text[i]
+        if char.isdigit() or char == ".":
+            number += char
+        elif text.startswith("ms", i):
+            total += float(number or 0) / 1000
+            number = ""
+            i += 1
+        elif char in units:
+            total += float(number or 0) * units[char]
+            number = ""
+        else:
+            return None
+        i += 1
+    return total if not number else None
+
+def backoff_delay(attempt, retry_after=None, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS):
+    """
+    Espera antes del reintento número `attempt` (1, 2...): "full jitter" entre 0 y base * 2^(attempt-1)
+    con tope `cap`. Si el servidor indicó Retry-After, se espera al menos eso (más un poco de jitter
+    para que los hilos que esperaban a la vez no vuelvan todos en el mismo instante).
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, base)
+    return delay
+
+
+class TokenBucket:
+    """Cubo de fichas: `capacity` fichas que se reponen a `rate` por segundo."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Segundos hasta que haya `amount` fichas (0 si ya las hay). Una petición mayor que el cubo espera a llenarlo."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Limitador del lado del cliente con los límites de la cuenta: peticiones por minuto (RPM) y tokens
+    por minuto (TPM). acquire() bloquea hasta que hay cupo; pause() detiene a todos los hilos cuando
+    el servidor responde 429 con Retry-After. max_wait=None espera lo que haga falta (modo por lotes).
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_wait=RATE_LIMIT_MAX_WAIT_SECONDS):
+        self.max_wait = max_wait
+        self.requests = TokenBucket(requests_per_minute / 60, requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self.lock = threading.Lock()
+        self.paused_until = 0.0
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    def acquire(self, tokens, cancel_event=None):
+        """Reserva una petición y `tokens` tokens. Lanza ApiError(RATE_LIMIT) si habría que esperar más de max_wait."""
+        start = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = max(0.0, self.paused_until - now)
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1, now))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    if self.requests is not None:
+                        self.requests.take(1)
+                    if self.tokens is not None:
+                        self.tokens.take(tokens)
+                    waited = now - start
+                    if waited > 0.001:
+                        self.waits += 1
+                        self.waited_seconds += waited
+                    return waited
+            if self.max_wait is not None and now - start + wait > self.max_wait:
+                raise ApiError(RATE_LIMIT, f"Límite local de RPM/TPM: harían falta {wait:.1f} s más", retry_after=wait)
+            _sleep(wait, cancel_event)
+
+    def adjust_tokens(self, delta):
+        """Corrige la reserva con el uso real (delta > 0 si se gastaron más tokens de los estimados)."""
+        if self.tokens is None or not delta:
+            return
+        with self.lock:
+            self.tokens._refill(time.monotonic())
+            self.tokens.tokens = min(self.tokens.capacity, self.tokens.tokens - delta)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats_text(self):
+        return f"limitador: {self.waits} esperas ({self.waited_seconds:.1f} s)"
+
+
+class CircuitBreaker:
+    """
+    Cortacircuitos: tras `failure_threshold` fallos transitorios seguidos se abre y las peticiones
+    fallan al instante durante `reset_seconds` (o lo que pida Retry-After, si es más). Después deja
+    pasar una sola petición de prueba (semiabierto): si va bien se cierra, si falla se vuelve a abrir.
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.lock = threading.Lock()
+        self.state = "cerrado"
+        self.failures = 0
+        self.opened_until = 0.0
+        self.open_kind = None
+        self.probe_in_flight = False
+        self.times_opened = 0
+
+    def before_call(self):
+        """Lanza CircuitOpenError si la petición no debe enviarse."""
+        with self.lock:
+            if self.state == "cerrado":
+                return
+            now = time.monotonic()
+            if self.state == "abierto" and now >= self.opened_until:
+                self.state = "semiabierto"
+                self.probe_in_flight = False
+            if self.state == "semiabierto" and not self.probe_in_flight:
+                self.probe_in_flight = True
+                logger.info("Cortacircuitos semiabierto: enviando una petición de prueba.")
+                return
+            remaining = max(1.0, self.opened_until - now)
+            raise CircuitOpenError(self.open_kind or UNKNOWN, f"Cortacircuitos abierto ({remaining:.0f} s)", retry_after=remaining)
+
+    def open_seconds_left(self):
+        """Segundos hasta que el circuito deje pasar una petición de prueba (0 si no está abierto)."""
+        with self.lock:
+            return max(0.0, self.opened_until - time.monotonic()) if self.state == "abierto" else 0.0
+
+    def release_probe(self):
+        """La petición de prueba no llegó a enviarse (cancelada o frenada por el limitador)."""
+        with self.lock:
+            self.probe_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != "cerrado":
+                logger.info("Cortacircuitos cerrado: la API vuelve a responder.")
+            self.state = "cerrado"
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self, kind, retry_after=None):
+        """Cuenta un fallo; solo los transitorios (429, 5xx, red) pueden abrir el circuito."""
+        if kind not in RETRYABLE_KINDS:
+            self.release_probe()
+            return
+        with self.lock:
+            self.failures += 1
+            if self.state == "semiabierto" or self.failures >= self.failure_threshold:
+                open_seconds = max(self.reset_seconds, retry_after or 0)
+                self.state = "abierto"
+                self.opened_until = time.monotonic() + open_seconds
+                self.open_kind = kind
+                self.probe_in_flight = False
+                self.times_opened += 1
+                logger.warning("Cortacircuitos abierto durante %.0f s tras %d fallos (%s).", open_seconds, self.failures, kind)
+
+    def stats_text(self):
+        return f"cortacircuitos {self.state} (abierto {self.times_opened} veces)"
+
+
+class ResilientCaller:
+    """
+    Ejecuta llamadas a la API con limitador de RPM/TPM, reintentos con espera exponencial y jitter
+    (respetando Retry-After) y cortacircuitos. Los errores definitivos salen como ApiError.
+    """
+
+    def __init__(self, limiter=None, breaker=None, max_retries=MAX_RETRIES):
+        self.limiter = limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.retries = 0
+        self.failures = {} # tipo de error -> veces
+
+    def call(self, fn, estimated_tokens=0, cancel_event=None, can_retry=None):
+        """
+        Llama a fn() hasta que funcione o el error no sea transitorio. can_retry() permite vetar un
+        reintento (p.ej. si el streaming ya mostró texto parcial). Devuelve (resultado, intentos).
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            try:
+                if self.limiter is not None:
+                    self.limiter.acquire(estimated_tokens, cancel_event=cancel_event)
+                result = fn()
+            except (RequestCancelled, CircuitOpenError):
+                self.breaker.release_probe()
+                raise
+            except ApiError: # El limitador local no dio cupo a tiempo: no es un fallo de la API
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                kind = classify_error(e)
+                retry_after = retry_after_seconds(e)
+                self.failures[kind] = self.failures.get(kind, 0) + 1
+                self.breaker.record_failure(kind, retry_after)
+                if kind == RATE_LIMIT and retry_after and self.limiter is not None:
+                    self.limiter.pause(min(retry_after, RETRY_AFTER_MAX_SECONDS))
+                retry = (kind in RETRYABLE_KINDS and attempt <= self.max_retries
+                         and (retry_after is None or retry_after <= RETRY_AFTER_MAX_SECONDS)
+                         and (can_retry is None or can_retry()))
+                open_seconds = self.breaker.open_seconds_left()
+                if open_seconds: # Este fallo abrió el circuito: no tiene sentido esperar para reintentar
+                    retry, retry_after = False, open_seconds
+                if not retry:
+                    raise ApiError(kind, str(e), retry_after=retry_after if kind == RATE_LIMIT else None, attempts=attempt) from e
+                delay = backoff_delay(attempt, retry_after)
+                self.retries += 1
+                logger.warning("Error de la API (%s, intento %d): %s. Reintentando en %.1f s.", kind, attempt, e, delay)
+                _sleep(delay, cancel_event)
+                continue
+            self.breaker.record_success()
+            return result, attempt
+
+    def stats_text(self):
+        failures = ", ".join(f"{kind} {count}" for kind, count in sorted(self.failures.items())) or "sin fallos"
+        text = f"Resiliencia: {self.retries} reintentos, {failures}, {self.breaker.stats_text()}"
+        if self.limiter is not None:
+            text += f", {self.limiter.stats_text()}"
+        return text
+
+
+def _sleep(seconds, cancel_event=None):
+    """Espera interrumpible: si la petición se cancela mientras tanto, lanza RequestCancelled."""
+    if cancel_event is None:
+        time.sleep(seconds)
+    elif cancel_event.wait(seconds):
+        raise RequestCancelled("Petición cancelada durante la espera")
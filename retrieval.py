@@ -0,0 +1,167 @@
+import re
+import math
+import unicodedata
+from collections import Counter
+
+# --- Configuración del índice ---
+CHUNK_MAX_CHARS = 1200 # Tamaño máximo aproximado de un pasaje (se agrupan párrafos hasta este tamaño)
+BM25_K1 = 1.5
+BM25_B = 0.75
+PASSAGE_SEPARATOR = "\n\n---\n\n" # El mismo separador que usa extract_text_from_pdfs
+
+# Palabras vacías (español e inglés) que no aportan a la búsqueda
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes como con contra cual cuales cuando de del desde donde
+durante e el ella ellas ellos en entre era es esa esas ese eso esos esta estas este esto estos fue ha hay la las
+le les lo los mas me mi muy no nos o otra otro para pero por porque que quien se sea ser si sin sobre son su sus
+tambien te tiene todo tu un una uno unos y ya
+an and are as at be by for from in is it of on or that the this to was what which with
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+
+
+def normalize_text(text):
+    """Pasa a minúsculas y elimina acentos/diacríticos (ñ -> n, ó -> o)."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def tokenize(text):
+    """Divide un texto en términos normalizados, sin palabras vacías ni tokens de 1 carácter."""
+    return [t for t in _TOKEN_RE.findall(normalize_text(text)) if len(t) > 1 and t not in STOPWORDS]
+
+class Chunk:
+    """Un pasaje del material. corpus_store.ChunkRecord tiene los mismos atributos, leídos del archivo mapeado."""
+    __slots__ = ("filename", "page", "text")
+
+    def __init__(self, filename, page, text):
+        self.filename = filename
+        self.page = page
+        self.text = text
+
+    @property
+    def chars(self):
+        return len(self.text)
+
+
+def chunk_documents(documents, max_chars=CHUNK_MAX_CHARS):
+    """
+    Divide los documentos ({"filename", "pages"}) en pasajes.
+    Cada página se parte por párrafos y los párrafos se agrupan hasta max_chars,
+    de modo que un pasaje nunca mezcla páginas distintas.
+    Devuelve una lista de Chunk en el orden del corpus.
+    """
+    chunks = []
+    for doc in documents:
+        for page_number, page_text in enumerate(doc["pages"], start=1):
+            if not page_text or not page_text.strip():
+                continue
+            paragraphs = [p.strip() for p in _PARAGRAPH_SPLIT_RE.split(page_text) if p.strip()]
+            current = []
+            current_len = 0
+            for paragraph in paragraphs:
+                if current and current_len + len(paragraph) > max_chars:
+                    chunks.append(Chunk(doc["filename"], page_number, "\n\n".join(current)))
+                    current, current_len = [], 0
+                current.append(paragraph)
+                current_len += len(paragraph)
+            if current:
+                chunks.append(Chunk(doc["filename"], page_number, "\n\n".join(current)))
+    return chunks
+
+
+class RetrievalIndex:
+    """Índice invertido BM25 sobre los pasajes del material de estudio."""
+
+    def __init__(self, chunks, chunk_terms=None):
+        """chunk_terms: [(término, frecuencia)] ya contados de cada pasaje (None = tokenizar su texto)."""
+        self.chunks = chunks
+        self.postings = {} # término -> lista de (id_pasaje, frecuencia)
+        self.chunk_lengths = []
+        for chunk_id, chunk in enumerate(chunks):
+            terms = chunk_terms[chunk_id] if chunk_terms is not None else None
+            if terms is None:
+                terms = Counter(tokenize(chunk.text)).items()
+            self.chunk_lengths.append(sum(freq for _term, freq in terms))
+            for term, freq in terms:
+                self.postings.setdefault(term, []).append((chunk_id, freq))
+        self.chunk_tokens = None # Tokens por pasaje (ver attach_token_counts)
+        self.separator_tokens = 0
+        total = len(chunks)
+        self.avg_length = (sum(self.chunk_lengths) / total) if total else 0.0
+        # IDF de BM25 (variante siempre positiva)
+        self.idf = {term: math.log(1 + (total - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+
+    @classmethod
+    def from_documents(cls, documents, max_chars=CHUNK_MAX_CHARS):
+        """Construye el índice a partir de los documentos extraídos de los PDFs."""
+        return cls(chunk_documents(documents, max_chars=max_chars))
+
+    def updated(self, documents, changed_filenames, max_chars=CHUNK_MAX_CHARS):
+        """
+        Índice nuevo para documents que reutiliza los pasajes (y sus términos ya contados) de los PDFs
+        sin cambios: solo se trocean y tokenizan los de changed_filenames y los que no estaban. Este
+        índice no se modifica, así que las búsquedas en curso pueden seguir usándolo.
+        """
+        changed = set(changed_filenames)
+        kept_ids = {} # nombre de archivo -> ids de sus pasajes en este índice
+        for chunk_id, chunk in enumerate(self.chunks):
+            if chunk.filename not in changed:
+                kept_ids.setdefault(chunk.filename, []).append(chunk_id)
+        kept_terms = {chunk_id: [] for ids in kept_ids.values() for chunk_id in ids}
+        for term, postings in self.postings.items():
+            for chunk_id, freq in postings:
+                terms = kept_terms.get(chunk_id)
+                if terms is not None:
+                    terms.append((term, freq))
+        chunks = []
+        chunk_terms = []
+        for doc in documents:
+            ids = kept_ids.get(doc["filename"])
+            if ids is None:
+                new_chunks = chunk_documents([doc], max_chars=max_chars)
+                chunks += new_chunks
+                chunk_terms += [None] * len(new_chunks)
+            else:
+                chunks += [self.chunks[i] for i in ids]
+                chunk_terms += [kept_terms[i] for i in ids]
+        return type(self)(chunks, chunk_terms)
+
+    def attach_token_counts(self, count_tokens):
+        """Precalcula los tokens de cada pasaje con count_tokens(texto) para presupuestar en tokens."""
+        self.chunk_tokens = [count_tokens(chunk.text) for chunk in self.chunks]
+        self.separator_tokens = count_tokens(PASSAGE_SEPARATOR)
+
+    def search(self, query, top_k=8):
+        """Devuelve [(id_pasaje, puntuación)] de los top_k pasajes más relevantes para la consulta."""
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for chunk_id, freq in self.postings[term]:
+                norm = 1 - BM25_B + BM25_B * self.chunk_lengths[chunk_id] / (self.avg_length or 1)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * freq * (BM25_K1 + 1) / (freq + BM25_K1 * norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+
+    def build_context(self, query, top_k=8, max_chars=6000, max_tokens=None):
+        """
+        Selecciona los pasajes más relevantes sin superar max_chars (ni max_tokens, si se indica
+        y hay conteos precalculados) y los une en el orden original del corpus. Devuelve "" si nada coincide.
+        """
+        use_tokens = max_tokens is not None and self.chunk_tokens is not None
+        selected = []
+        used_chars = 0
+        used_tokens = 0
+        for chunk_id, _score in self.search(query, top_k=top_k):
+            length = self.chunks[chunk_id].chars + len(PASSAGE_SEPARATOR)
+            tokens = self.chunk_tokens[chunk_id] + self.separator_tokens if use_tokens else 0
+            if selected and used_chars + length > max_chars:
+                continue # Probar pasajes más cortos que aún quepan en el presupuesto
+            if use_tokens and used_tokens + tokens > max_tokens:
+                continue
+            selected.append(chunk_id)
+            used_chars += length
+            used_tokens += tokens
+        return PASSAGE_SEPARATOR.join(self.chunks[i].text for i in sorted(selected))
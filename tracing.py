@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import queue
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración de trazas y métricas ---
+LOG_FORMAT = "%(asctime)s.%(msecs)03d %(levelname)-7s [%(threadName)s] %(name)s: %(message)s"
+LOG_DATE_FORMAT = "%H:%M:%S"
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000) # Cubetas del histograma de duraciones
+SIZE_ATTRIBUTES = ("bytes", "chars", "tokens", "prompt_tokens", "completion_tokens", "cached_tokens") # Se suman en las métricas
+METRICS_WRITE_INTERVAL_SECONDS = 5.0 # El archivo de métricas se reescribe como mucho con esta frecuencia
+JSONL_MAX_BYTES = 20 * 1024 * 1024 # Al arrancar, un spans.jsonl mayor que esto se rota a spans.jsonl.1
+METRIC_PREFIX = "asistente"
+
+
+def configure_logging(level="INFO", log_file=None):
+    """Configura el logging de la app: consola y, opcionalmente, un archivo."""
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    logging.basicConfig(level=getattr(logging, str(level).upper(), logging.INFO), format=LOG_FORMAT,
+                        datefmt=LOG_DATE_FORMAT, handlers=handlers, force=True)
+    # httpx registra cada petición en INFO; las trazas ya miden la llamada a la API
+    for noisy_logger in ("httpx", "httpcore"):
+        logging.getLogger(noisy_logger).setLevel(max(logging.WARNING, logging.getLogger().level))
+
+
+class Span:
+    """Un tramo medido dentro de una traza. set() añade atributos (tamaños, resultado...)."""
+    __slots__ = ("name", "attrs")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _NullSpan:
+    """Tramo sin traza activa: no mide ni registra nada."""
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+_NULL_SPAN = _NullSpan()
+_current = threading.local() # Traza activa en cada hilo (ver Trace.activate)
+
+
+class Trace:
+    """
+    Una petición de principio a fin (p.ej. una copia al portapapeles o una selección de área).
+    Sus tramos pueden medirse desde distintos hilos: con span() en el hilo que hace el trabajo,
+    o con record() si el inicio y el fin se tomaron en sitios distintos (p.ej. el hilo de Tk).
+    """
+
+    def __init__(self, tracer, trace_id, kind, attrs):
+        self.tracer = tracer
+        self.id = trace_id
+        self.kind = kind
+        self.attrs = attrs
+        self.wall_start = time.time()
+        self.perf_start = time.perf_counter()
+        self.spans = [] # [(nombre, ms)] para el resumen al terminar
+        self.pending = 1 # Partes que deben llamar a finish() (ver add_pending)
+        self.finished = False
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        span = Span(name, attrs)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(name, start, time.perf_counter(), **span.attrs)
+
+    def record(self, name, start, end, **attrs):
+        """Registra un tramo ya medido (start/end de time.perf_counter())."""
+        duration_ms = (end - start) * 1000
+        self.spans.append((name, duration_ms))
+        self.tracer.emit(self, name, start, duration_ms, attrs)
+
+    @contextmanager
+    def activate(self):
+        """Hace de esta la traza activa del hilo, para que span() la encuentre sin pasarla por parámetro."""
+        previous = getattr(_current, "trace", None)
+        _current.trace = self
+        try:
+            yield self
+        finally:
+            _current.trace = previous
+
+    def add_pending(self, parts=1):
+        """Indica que la traza terminará en más de un hilo (p.ej. copia al portapapeles y etiqueta en Tk)."""
+        with self.lock:
+            self.pending += parts
+
+    def finish(self, **attrs):
+        """
+        Cierra la traza cuando todas sus partes han terminado: registra el tramo 'total'
+        y deja en el log el desglose de la latencia.
+        """
+        with self.lock:
+            self.attrs.update(attrs)
+            self.pending -= 1
+            if self.finished or self.pending > 0:
+                return
+            self.finished = True
+        end = time.perf_counter()
+        breakdown = ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.spans)
+        self.record("total", self.perf_start, end, **self.attrs)
+        logger.info("Traza #%d (%s) %.0f ms: %s", self.id, self.kind, (end - self.perf_start) * 1000, breakdown or "sin tramos")
+
+
+def current_trace():
+    return getattr(_current, "trace", None)
+
+@contextmanager
+def span(name, **attrs):
+    """Tramo en la traza activa del hilo; si no hay ninguna no hace nada."""
+    trace = current_trace()
+    if trace is None:
+        yield _NULL_SPAN
+        return
+    with trace.span(name, **attrs) as active_span:
+        yield active_span
+
+
+class Tracer:
+    """
+    Recoge los tramos de todas las trazas: los agrega en histogramas (exportados en formato de texto
+    de Prometheus) y los escribe como JSONL. La escritura a disco se hace en un hilo aparte para no
+    añadir E/S al camino de las respuestas.
+    """
+
+    def __init__(self, jsonl_path=None, metrics_path=None):
+        self.jsonl_path = jsonl_path
+        self.metrics_path = metrics_path
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.histograms = {} # (tipo de petición, tramo) -> {"buckets": [...], "count": n, "sum": ms}
+        self.size_totals = {} # (tipo de petición, tramo, atributo) -> suma
+        self.traces_started = 0
+        self.pending = queue.SimpleQueue()
+        self.writer = None
+        self.last_metrics_write = 0.0
+        self.metrics_dirty = False
+        if jsonl_path or metrics_path:
+            self._rotate_jsonl()
+            self.writer = threading.Thread(target=self._writer_loop, name="trazas", daemon=True)
+            self.writer.start()
+
+    def start_trace(self, kind, **attrs):
+        with self.lock:
+            self.traces_started += 1
+        return Trace(self, next(self.ids), kind, attrs)
+
+    def emit(self, trace, name, start, duration_ms, attrs):
+        with self.lock:
+            key = (trace.kind, name)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(LATENCY_BUCKETS_MS), "count": 0, "sum": 0.0}
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if duration_ms <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["count"] += 1
+            histogram["sum"] += duration_ms
+            self.metrics_dirty = True
+            for attr in SIZE_ATTRIBUTES:
+                value = attrs.get(attr)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.size_totals[key + (attr,)] = self.size_totals.get(key + (attr,), 0) + value
+        if self.writer is not None:
+            record = {"ts": round(trace.wall_start + (start - trace.perf_start), 6), "trace": trace.id,
+                      "kind": trace.kind, "span": name, "ms": round(duration_ms, 3)}
+            record.update(attrs)
+            self.pending.put(record)
+
+    def metrics_text(self):
+        """Métricas acumuladas en el formato de exposición de texto de Prometheus."""
+        name = f"{METRIC_PREFIX}_span_duration_ms"
+        lines = [f"# HELP {name} Duración de cada etapa de una petición en milisegundos.", f"# TYPE {name} histogram"]
+        with self.lock:
+            for (kind, span_name), histogram in sorted(self.histograms.items()):
+                labels = f'kind="{kind}",span="{span_name}"'
+                for bound, count in zip(LATENCY_BUCKETS_MS, histogram["buckets"]):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+                lines.append(f'{name}_sum{{{labels}}} {histogram["sum"]:.3f}')
+                lines.append(f'{name}_count{{{labels}}} {histogram["count"]}')
+            size_name = f"{METRIC_PREFIX}_span_size_total"
+            lines += [f"# HELP {size_name} Suma de los tamaños registrados por etapa (bytes, caracteres, tokens).",
+                      f"# TYPE {size_name} counter"]
+            for (kind, span_name, attr), total in sorted(self.size_totals.items()):
+                lines.append(f'{size_name}{{kind="{kind}",span="{span_name}",attr="{attr}"}} {total}')
+            lines += [f"# HELP {METRIC_PREFIX}_traces_total Peticiones trazadas desde el arranque.",
+                      f"# TYPE {METRIC_PREFIX}_traces_total counter",
+                      f"{METRIC_PREFIX}_traces_total {self.traces_started}"]
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self):
+        """Reescribe el archivo de métricas de forma atómica (para un recolector tipo node_exporter textfile)."""
+        if not self.metrics_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.metrics_path) or ".", exist_ok=True)
+            tmp_path = self.metrics_path + ".tmp"
+            self.metrics_dirty = False
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.metrics_text())
+            os.replace(tmp_path, self.metrics_path)
+        except OSError as e:
+            logger.warning("No se pudo escribir el archivo de métricas: %s", e)
+        self.last_metrics_write = time.monotonic()
+
+    def _rotate_jsonl(self):
+        if not self.jsonl_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.jsonl_path) or ".", exist_ok=True)
+            if os.path.isfile(self.jsonl_path) and os.path.getsize(self.jsonl_path) > JSONL_MAX_BYTES:
+                os.replace(self.jsonl_path, self.jsonl_path + ".1")
+        except OSError as e:
+            logger.warning("No se pudo rotar el archivo de trazas: %s", e)
+
+    def _write_records(self, records):
+        if not self.jsonl_path or not records:
+            return
+        try:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        except OSError as e:
+            logger.warning("No se pudieron escribir las trazas: %s", e)
+
+    def _writer_loop(self):
+        while True:
+            try:
+                record = self.pending.get(timeout=METRICS_WRITE_INTERVAL_SECONDS)
+            except queue.Empty:
+                record = None
+            if record is _STOP:
+                return
+            records = [] if record is None else [record]
+            while True: # Escribir por lotes lo que se haya acumulado
+                try:
+                    record = self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    self._write_records(records)
+                    return
+                records.append(record)
+            self._write_records(records)
+            if self.metrics_dirty and time.monotonic() - self.last_metrics_write >= METRICS_WRITE_INTERVAL_SECONDS:
+                self.write_metrics()
+
+    def close(self):
+        """Vacía lo pendiente y deja las métricas finales escritas."""
+        if self.writer is not None and self.writer.is_alive():
+            self.pending.put(_STOP)
+            self.writer.join(timeout=2)
+        self.write_metrics()
+
+_STOP = object()
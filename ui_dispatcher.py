@@ -0,0 +1,161 @@
+import time
+import logging
+import threading
+import tkinter as tk
+from collections import deque
+
+from profiler import checkpoint as profiler_checkpoint
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración por defecto del despachador de la interfaz ---
+FRAME_MS = 16 # Como mucho una vuelta de actualizaciones por fotograma (~60 por segundo)
+FRAME_BUDGET_MS = 8 # Tiempo máximo de cada vuelta en el hilo de Tk; lo que no quepa pasa al fotograma siguiente
+STATS_SECONDS = 60 # Segundos de estadísticas que se guardan (un registro por segundo con actividad)
+
+LABEL = "etiqueta"
+PLACE = "posicion"
+CALL = "llamada"
+
+
+class UiDispatcher:
+    """
+    Cola única, segura para hilos, de todo lo que los hilos de trabajo piden a la ventana de Tk. El hilo de
+    Tk la vacía como mucho una vez por fotograma (frame_ms) y sin pasar de budget_ms por vuelta. El texto
+    de la etiqueta y la colocación de la ventana se fusionan: de varias peticiones pendientes solo se aplica
+    la última (los fragmentos de una respuesta en streaming no hacen una actualización cada uno). Las
+    llamadas (call) se ejecutan todas y en orden. set_label(texto) y place_window(force) las aplica el
+    hilo de Tk; place_window debe saltarse el trabajo si la ventana ya está donde debe (salvo force).
+    """
+
+    def __init__(self, root, set_label, place_window, frame_ms=FRAME_MS, budget_ms=FRAME_BUDGET_MS):
+        self.root = root
+        self.set_label = set_label
+        self.place_window = place_window
+        self.frame_seconds = frame_ms / 1000
+        self.budget_seconds = budget_ms / 1000
+        self.lock = threading.Lock()
+        self.queue = deque() # (tipo, contenido, secuencia)
+        self.sequence = 0
+        self.latest = {} # tipo fusionable -> secuencia de su última petición
+        self.force_place = False # Alguna colocación pendiente pedía forzar (tras mostrar la ventana)
+        self.scheduled = False
+        self.next_frame_at = 0.0
+        # Estadísticas del segundo en curso y de los anteriores
+        self.second = None
+        self.current = self._empty_second()
+        self.history = deque(maxlen=STATS_SECONDS)
+
+    @staticmethod
+    def _empty_second():
+        return {"peticiones": 0, "fusionadas": 0, "vueltas": 0, "cola_max": 0, "tk_ms": 0.0}
+
+    def label(self, text):
+        """Cambia el texto de la etiqueta (desde cualquier hilo); si llega otro antes de aplicarse, gana el último."""
+        self._post(LABEL, text)
+
+    def place(self, force=False):
+        """Recoloca la ventana en su esquina (desde cualquier hilo), una vez por fotograma como mucho."""
+        with self.lock:
+            self.force_place = self.force_place or force
+        self._post(PLACE, None)
+
+    def call(self, fn, *args):
+        """Ejecuta fn(*args) en el hilo de Tk, en orden con el resto de peticiones."""
+        self._post(CALL, (fn, args))
+
+    def _post(self, kind, payload):
+        with self.lock:
+            self.sequence += 1
+            self.queue.append((kind, payload, self.sequence))
+            if kind != CALL:
+                self.latest[kind] = self.sequence
+            self._roll_second_locked()
+            self.current["peticiones"] += 1
+            self.current["cola_max"] = max(self.current["cola_max"], len(self.queue))
+            if self.scheduled:
+                return
+            self.scheduled = True
+            delay_ms = max(0, int((self.next_frame_at - time.perf_counter()) * 1000))
+        try:
+            self.root.after(delay_ms, self._drain)
+        except (RuntimeError, tk.TclError) as e: # La ventana ya no existe (cierre) o el bucle de Tk ya terminó
+            with self.lock:
+                self.scheduled = False
+            logger.debug("No se pudo programar la actualización de la ventana: %s", e)
+
+    def _drain(self):
+        """Una vuelta en el hilo de Tk: aplica las peticiones pendientes hasta agotar el presupuesto del fotograma."""
+        profiler_checkpoint()
+        started = time.perf_counter()
+        deadline = started + self.budget_seconds
+        coalesced = 0
+        while True:
+            with self.lock:
+                if not self.queue:
+                    break
+                kind, payload, sequence = self.queue.popleft()
+                superseded = kind != CALL and sequence != self.latest.get(kind)
+                force = False
+                if kind == PLACE and not superseded:
+                    force, self.force_place = self.force_place, False
+            if superseded:
+                coalesced += 1
+                continue
+            try:
+                if kind == LABEL:
+                    self.set_label(payload)
+                elif kind == PLACE:
+                    self.place_window(force)
+                else:
+                    fn, args = payload
+                    fn(*args)
+            except Exception as e:
+                logger.exception("Error al actualizar la ventana: %s", e)
+            if time.perf_counter() >= deadline:
+                break
+        finished = time.perf_counter()
+        with self.lock:
+            self._roll_second_locked()
+            self.current["fusionadas"] += coalesced
+            self.current["vueltas"] += 1
+            self.current["tk_ms"] += (finished - started) * 1000
+            self.next_frame_at = started + self.frame_seconds
+            if not self.queue:
+                self.scheduled = False
+                return
+        self.root.after(max(1, int((self.next_frame_at - time.perf_counter()) * 1000)), self._drain) # Sigue en el próximo fotograma
+
+    def _roll_second_locked(self):
+        """Cierra el segundo anterior (si tuvo actividad, queda en el historial y en el log de depuración)."""
+        second = int(time.monotonic())
+        if second == self.second:
+            return
+        if self.second is not None and (self.current["peticiones"] or self.current["vueltas"]):
+            self.history.append(self.current)
+            logger.debug("Ventana: %d peticiones (%d fusionadas), cola máx. %d, %.1f ms en Tk en %d vueltas.",
+                         self.current["peticiones"], self.current["fusionadas"], self.current["cola_max"],
+                         self.current["tk_ms"], self.current["vueltas"])
+        self.second = second
+        self.current = self._empty_second()
+
+    def summary(self):
+        """Por segundo con actividad (últimos STATS_SECONDS): cola máxima y ms en el hilo de Tk; y los totales."""
+        with self.lock:
+            seconds = list(self.history) + ([self.current] if self.current["peticiones"] or self.current["vueltas"] else [])
+            pending = len(self.queue)
+        if not seconds:
+            return {"segundos": 0, "pendientes": pending}
+        return {"segundos": len(seconds), "pendientes": pending,
+                "peticiones": sum(s["peticiones"] for s in seconds), "fusionadas": sum(s["fusionadas"] for s in seconds),
+                "cola_max": max(s["cola_max"] for s in seconds),
+                "tk_ms_por_segundo": sum(s["tk_ms"] for s in seconds) / len(seconds),
+                "tk_ms_por_segundo_max": max(s["tk_ms"] for s in seconds)}
+
+    def stats_text(self):
+        summary = self.summary()
+        if not summary["segundos"]:
+            return "Ventana: sin actualizaciones recientes"
+        return (f"Ventana: {summary['peticiones']} peticiones ({summary['fusionadas']} fusionadas) en {summary['segundos']} s "
+                f"con actividad; cola máx. {summary['cola_max']}; en Tk {summary['tk_ms_por_segundo']:.1f} ms/s de media, "
+                f"máx. {summary['tk_ms_por_segundo_max']:.1f} ms/s")